@@ -5,31 +5,56 @@ Telegram Polls Bot 2.0
 """
 
 import asyncio
-from collections import defaultdict
-from contextlib import contextmanager
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import lru_cache, wraps
 import base64
 import json
 import logging
+import logging.handlers
 import os
+import random
 import re
 import sqlite3
 import sys
 import time
+from types import MappingProxyType
 from typing import Dict, List, Optional, Tuple, Union
 import uuid
 import math
 
 try:
-    from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+    from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
     from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, InlineQueryHandler, filters, ContextTypes
     from telegram.constants import ParseMode
-    from telegram.error import TelegramError, RetryAfter, TimedOut, NetworkError
+    from telegram.error import TelegramError, RetryAfter, TimedOut, NetworkError, BadRequest
 except ImportError:
     print("telegram library not found. Install: pip3 install python-telegram-bot==20.7")
     sys.exit(1)
 
+try:
+    import aiosqlite
+except ImportError:
+    print("aiosqlite library not found. Install: pip3 install aiosqlite")
+    sys.exit(1)
+
+# orjson is optional: faster (de)serialization of state/template JSON, falls back to stdlib json
+try:
+    import orjson
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+    json_loads = json.loads
+
 # Configuration
 BOT_DIR = "/opt/root/PollsBot"
 DB_PATH = f"{BOT_DIR}/polls.db"
@@ -45,7 +70,256 @@ RATE_LIMIT_WINDOW = 3600
 SESSION_TIMEOUT = 7200
 MAX_RETRIES = 3
 RETRY_DELAY = 5
+WAL_CHECKPOINT_INTERVAL = 3600
+RETRY_BASE_DELAY = 0.5
+TELEGRAM_POOL_SIZE = 256
+TELEGRAM_POOL_TIMEOUT = 20
+TELEGRAM_SEND_RATE = 30  # bot-wide outgoing messages per second allowed by Telegram
+TELEGRAM_LONG_POLL_TIMEOUT = 30  # getUpdates держит соединение до прихода апдейта
 MAX_USERS_IN_MEMORY = 1000
+FLOOD_HISTORY_SIZE = 11
+DB_READ_POOL_SIZE = 4
+CACHE_MAX_SIZE = 1024
+CACHE_TTL = 60
+CLEANUP_CHUNK_SIZE = 1000
+STATE_CACHE_SIZE = 4096
+USER_ACTIVITY_REFRESH = 300  # seconds between last_activity updates for a known user
+STATE_FLUSH_DELAY = 0.05
+VOTE_FLUSH_DELAY = 0.05
+POLL_EDIT_DEBOUNCE = 0.5  # redraws of one poll message within this window collapse into the latest
+TEMPLATES_CACHE_TTL = 30
+LOGGING_CONFIG_RECHECK = 5  # seconds between logging_config.json mtime checks
+
+# Default configuration (overridden by config.json)
+DEFAULT_CONFIG = MappingProxyType({
+    "bot_token": "",
+    "admin_chat_id": "",
+    "polling_interval": 2,
+    "max_poll_options": 10,
+    "rate_limit_hour": 10,
+    "web_port": 8080,
+    "default_decision_threshold": 50,
+    "auto_close_hours": 24,
+    "show_poll_stats": True,
+    "show_author": True,
+    "show_template": True,
+    "show_creation_date": True,
+    "show_vote_count": True,
+    "show_decision_status": True,
+    "non_anonymous_voting": False,
+    "show_voter_names": True,
+    "show_decision_numbers": True,
+    "max_voters_display": 5
+})
+
+# Applied once to every pooled connection when it is opened
+DB_PRAGMAS = (
+    "journal_mode = WAL",
+    "synchronous = NORMAL",   # with WAL: a power loss may drop the last commits, never corrupts the DB
+    "foreign_keys = ON",
+    "mmap_size = 268435456",  # 256MB memory-mapped I/O
+    "cache_size = -65536",    # 64MB page cache
+    "temp_store = MEMORY",
+    "wal_autocheckpoint = 1000",  # pages; bounds WAL growth between explicit checkpoints
+)
+
+# Hot-path SQL (identical text lets SQLite reuse cached prepared statements)
+SQL_GET_USER_STATE = "SELECT state, data FROM user_states WHERE user_id = ?"
+SQL_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"  # same layout as datetime.now().isoformat()
+SQL_NOW_TS = "CAST(strftime('%s', 'now') AS INTEGER)"  # unix epoch seconds, same as int(time.time())
+SQL_SET_USER_STATE = (
+    f"INSERT INTO user_states (user_id, state, data, updated_date, updated_ts) VALUES (?, ?, ?, {SQL_NOW}, {SQL_NOW_TS}) "
+    "ON CONFLICT(user_id) DO UPDATE SET state = excluded.state, data = excluded.data, "
+    "updated_date = excluded.updated_date, updated_ts = excluded.updated_ts"
+)
+SQL_GET_PERMISSIONS = "SELECT permissions FROM users WHERE user_id = ?"
+SQL_SET_USER = (
+    f"INSERT INTO users (user_id, username, permissions, last_activity) VALUES (?, ?, ?, {SQL_NOW}) "
+    "ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, permissions = excluded.permissions, "
+    "last_activity = excluded.last_activity"
+)
+SQL_GET_TEMPLATES = "SELECT * FROM templates ORDER BY usage_count DESC"
+# Последний номер решения: один спуск по частичному индексу idx_polls_decision_number_set
+SQL_LAST_DECISION_NUMBER = (
+    "SELECT decision_number FROM polls WHERE decision_number IS NOT NULL ORDER BY decision_number DESC LIMIT 1"
+)
+SQL_ASSIGN_DECISION_NUMBER = (
+    f"UPDATE polls SET decision_number = COALESCE(({SQL_LAST_DECISION_NUMBER}), 0) + 1 "
+    "WHERE poll_id = ? AND decision_number IS NULL"
+)
+SQL_POLL_RENDER_ROW = (
+    "SELECT question, options, threshold, non_anonymous, decision_number, created_date, template_used, "
+    "creator_id, decision_status, voting_type, status, max_participants FROM polls WHERE poll_id = ?"
+)
+SQL_POLL_RENDER_VOTES = "SELECT option_id, username FROM poll_votes WHERE poll_id = ? ORDER BY vote_date"
+SQL_RECORD_VOTE = "INSERT OR REPLACE INTO poll_votes (poll_id, user_id, username, option_id) VALUES (?, ?, ?, ?)"
+SQL_UPDATE_TOTAL_VOTERS = (
+    "UPDATE polls SET total_voters = (SELECT COUNT(DISTINCT user_id) FROM poll_votes WHERE poll_id = ?) WHERE poll_id = ?"
+)
+
+# str.translate tables: control characters (кроме \t \n \r) and markdown symbols are deleted in one C-level pass
+CONTROL_CHARS_TABLE = dict.fromkeys([*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F])
+MARKDOWN_CHARS_TABLE = str.maketrans('', '', '*`_')
+
+# Ключевые слова для определения типа голосования (варианты с пунктуацией на конце не нужны:
+# она срезается с вариантов и слов перед сравнением)
+POSITIVE_KEYWORDS = (
+    'за', 'да', 'одобрить', 'согласен', 'поддерживаю', 'принять', 'утвердить',
+    'согласие', 'поддержка', 'одобрение', 'утверждение', 'принятие', 'принимаю', 'утверждаю',
+    'положительно', 'в пользу', 'за принятие', 'за утверждение', 'соглашаюсь', 'одобряю',
+    'конечно', 'разумеется', 'безусловно', 'несомненно',
+)
+NEGATIVE_KEYWORDS = (
+    'против', 'нет', 'отклонить', 'не согласен', 'отказать', 'отклонение', 'отказ', 'несогласие',
+    'против принятия', 'отклоняю', 'отказываю', 'отрицательно', 'против утверждения',
+    'не соглашаюсь', 'не одобряю', 'не поддерживаю', 'не принимаю', 'не утверждаю',
+    'не', 'ни', 'никогда', 'ни за что',
+)
+ABSTAIN_KEYWORDS = (
+    'воздержался', 'воздержаться', 'нейтрально', 'не определился', 'воздержание',
+    'нейтральная позиция', 'не знаю', 'затрудняюсь ответить', 'не могу определиться', 'затрудняюсь',
+)
+# Варианты, голоса за которые считаются "за" при подсчёте решения (approval/binary)
+DECISION_POSITIVE_KEYWORDS = ('за', 'да', 'одобрить', 'согласен', 'поддерживаю', 'принять', 'утвердить')
+DECISION_POSITIVE_RE = re.compile("|".join(map(re.escape, DECISION_POSITIVE_KEYWORDS)))
+# Per category: alternation that finds any keyword inside an option, and all keywords joined by
+# newlines so "option/word is part of some keyword" is one substring search
+VOTING_KEYWORD_MATCHERS = tuple(
+    (re.compile("|".join(map(re.escape, keywords))), "\n".join(keywords))
+    for keywords in (POSITIVE_KEYWORDS, NEGATIVE_KEYWORDS, ABSTAIN_KEYWORDS)
+)
+
+# Precompiled regular expressions
+VARIABLE_RE = re.compile(r'\{([\w\sА-Яа-яЁёA-Za-z0-9@#\-\.,:;/!\?&%+=\'\"\(\)\[\]]{1,30})\}', re.UNICODE)
+BOT_TOKEN_RE = re.compile(r'^\d+:[A-Za-z0-9_-]{35}$')
+TEMPLATE_NAME_RE = re.compile(r'^[\w\s\-]{3,50}$', re.UNICODE)
+
+# Static message texts (built once at import instead of on every command)
+GROUP_COMMANDS_TEXT = "❌ В группах команды не поддерживаются. Для публикации и голосования используйте inline-режим: @{bot_username} ..."
+NO_ACCESS_TEXT = "❌ У вас нет доступа к боту.\nВаш ID: `{user_id}`\nОбратитесь к администратору."
+HELP_TEXT = """ℹ️ **Справка по системе голосований**
+
+👥 **Права пользователей:**
+
+• **👤 use** - Базовые права
+  - Просмотр активных опросов (только тех, в которых участвовали)
+  - Просмотр закрытых опросов (только тех, в которых участвовали)
+  - Голосование в опросах
+  - Просмотр результатов
+
+• **📝 create** - Права создателя
+  - Все права уровня "use"
+  - Создание новых опросов
+  - Создание и использование шаблонов
+  - Просмотр своих созданных опросов + опросов, в которых участвовали
+  - Редактирование своих опросов
+
+• **🛠 admin** - Административные права
+  - Все права уровня "create"
+  - Просмотр всех опросов (активных и закрытых)
+  - Управление пользователями
+  - Просмотр статистики системы
+  - Редактирование любых опросов
+  - Удаление опросов и пользователей
+
+🗳️ **Как работает система:**
+
+1. **Создание опроса** - Выберите тип (простой или из шаблона)
+2. **Голосование** - Нажмите на вариант ответа в опросе
+3. **Результаты** - Отображаются в реальном времени
+4. **Закрытие** - Автоматическое или ручное закрытие опросов
+5. **Шаблоны** - Используйте {Переменная} для быстрого создания
+
+🔒 **Приватность голосований:**
+
+• **Пользователи "use"** видят только те голосования, в которых участвовали
+• **Пользователи "create"** видят свои созданные голосования + те, в которых участвовали
+• **Администраторы** видят все голосования в системе
+
+🔧 **Переменные в шаблонах:**
+
+Переменные позволяют создавать универсальные шаблоны опросов:
+
+• **Формат:** `{НазваниеПеременной}` - в фигурных скобках
+• **Примеры:** `{Дата}`, `{Место}`, `{Время}`, `{Тема}`
+• **Использование:** В вопросе и вариантах ответа
+• **Заполнение:** При создании опроса система запросит значения
+
+**Пример шаблона:**
+```
+Вопрос: Голосование по {Тема} на {Дата}
+Варианты:
+- За
+- Против
+- Воздержаться
+```
+
+При использовании система спросит:
+- Значение для {Тема}: "Встреча команды"
+- Значение для {Дата}: "15 декабря"
+
+📞 **Поддержка:** @ih0rd"""
+HELP_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]])
+
+# Whitelist of allowed callback_data values
+CALLBACK_DATA_PATTERNS = [
+    # Основные меню
+    r'^(create_poll|templates|active_polls|closed_polls|status|admin|help|display_settings|reset_settings)$',
+    r'^(back_to_main|back_to_templates|back_to_\w+)$',
+    
+    # Создание опросов
+    r'^(create_simple|create_from_template|new_template|finish_poll_creation|finish_template_creation)$',
+
+    r'^(enter_decision_number|next_decision_number)$',
+    
+    # Шаблоны
+    r'^use_tpl:\d+$',
+    r'^continue_tpl:\d+$',
+    r'^delete_tpl:\d+$',
+    r'^confirm_delete_template:\d+$',
+    r'^edit_tpl_threshold:\d+$',
+    
+    # Голосования
+    r'^vote:[a-f0-9-]{36}:\d+$',
+    r'^vote_option:\d+$',
+    r'^close_poll:[a-f0-9-]{36}$',
+    r'^edit_poll:[a-f0-9-]{36}$',
+    r'^delete_poll:[a-f0-9-]{36}$',
+    r'^confirm_delete_poll:[a-f0-9-]{36}$',
+    r'^edit_poll_question:[a-f0-9-]{36}$',
+    r'^edit_poll_options:[a-f0-9-]{36}$',
+    r'^show_poll:[a-f0-9-]{36}$',
+    r'^show_closed_poll:[a-f0-9-]{36}$',
+    
+    # Админка - пользователи
+    r'^admin_(users|stats|back)$',
+    r'^admin_setperm:\d+$',
+    r'^admin_perm_select:\d+:(use|create|admin)$',
+    r'^admin_revoke:\d+$',
+    r'^admin_delete:\d+$',
+    r'^admin_confirm_delete:\d+$',
+    
+    # Админка - логи
+    r'^admin_(logs|logs_stats|clear_all_logs|clear_logs_by_level|view_recent_logs|rotate_logs|logs_levels|third_party_loggers)$',
+    r'^admin_clear_logs:(debug|info|warning|error|critical)$',
+    r'^admin_view_logs:(debug|info|warning|error|critical)$',
+    r'^admin_toggle_logs:(debug|info|warning|error|critical)$',
+    
+    # Настройки
+    r'^toggle_setting:[\w_]+$',
+    
+    # Отмена и подтверждения
+    r'^cancel:[a-f0-9-]{36}$',
+    r'^cancel_delete$',
+    r'^confirm_delete:\d+$',
+]
+# Single alternation: one regex traversal per callback instead of one match per pattern
+CALLBACK_DATA_RE = re.compile("|".join(f"(?:{pattern})" for pattern in CALLBACK_DATA_PATTERNS))
+
+# Permission levels (ordered) and the groups checked on hot paths
+PERMISSION_LEVELS = MappingProxyType({"none": 0, "use": 1, "create": 2, "admin": 3})
+CREATE_PERMISSIONS = frozenset({"create", "admin"})
+VOTE_PERMISSIONS = frozenset({"use", "create", "admin"})
 
 # User states
 class UserState:
@@ -74,6 +348,8 @@ os.makedirs(BOT_DIR, exist_ok=True)
 LOG_DIR = f"{BOT_DIR}/logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
+LOGGING_CONFIG_FILE = f"{LOG_DIR}/logging_config.json"
+
 # Пути к файлам логов
 LOG_FILES = {
     'debug': f"{LOG_DIR}/debug.log",
@@ -82,20 +358,27 @@ LOG_FILES = {
     'error': f"{LOG_DIR}/error.log",
     'critical': f"{LOG_DIR}/critical.log"
 }
-
-# Настройка основного логгера
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILES['debug'], encoding='utf-8'),
-        logging.StreamHandler()  # Вывод в консоль
-    ]
+LOG_MAX_SIZE_MB = 5
+LOG_BACKUP_COUNT = 5
+
+# Числовые уровни logging для наших имён уровней
+LOG_LEVELS = MappingProxyType({
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL
+})
+
+# Нижняя граница уровней на весь процесс (POLLSBOT_MIN_LOG_LEVEL=INFO и т.п.);
+# при запуске с python -O debug-сообщения отключены по умолчанию
+MIN_LOG_LEVEL = LOG_LEVELS.get(
+    os.environ.get('POLLSBOT_MIN_LOG_LEVEL', 'debug' if __debug__ else 'info').lower(), logging.DEBUG
 )
 
 # Предварительная настройка логгеров сторонних библиотек
 # Это поможет избежать проблем с httpcore и другими библиотеками
-for logger_name in ['httpcore', 'httpx', 'telegram', 'urllib3', 'asyncio', 'aiohttp', 'websockets']:
+for logger_name in ['httpcore', 'httpx', 'telegram', 'urllib3', 'asyncio', 'aiohttp', 'websockets', 'aiosqlite']:
     try:
         third_party_logger = logging.getLogger(logger_name)
         third_party_logger.setLevel(logging.WARNING)  # Устанавливаем WARNING по умолчанию
@@ -105,12 +388,16 @@ for logger_name in ['httpcore', 'httpx', 'telegram', 'urllib3', 'asyncio', 'aioh
 
 # Создаем отдельные логгеры для каждого уровня
 loggers = {}
+log_handlers = {}
 for level, log_file in LOG_FILES.items():
     logger_obj = logging.getLogger(f"polls_bot.{level}")
     logger_obj.setLevel(logging.NOTSET)  # Логгер принимает все сообщения
 
-    # Создаем handler для файла
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    # Создаем handler для файла; ротацию выполняет LogManager.rotate_logs через doRollover(),
+    # поэтому maxBytes=0 — без проверки размера на каждой записи
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=0, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
     file_handler.setLevel(getattr(logging, level.upper()))  # Handler фильтрует по уровню
 
     # Создаем форматтер
@@ -122,36 +409,59 @@ for level, log_file in LOG_FILES.items():
     logger_obj.propagate = False  # Предотвращаем дублирование
 
     loggers[level] = logger_obj
+    log_handlers[level] = file_handler
+
+# Настройка основного логгера
+logging.basicConfig(
+    level=logging.DEBUG,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        log_handlers['debug'],  # тот же handler, что у polls_bot.debug: после ротации оба пишут в новый файл
+        logging.StreamHandler()  # Вывод в консоль
+    ]
+)
 
 class CustomLogger:
     """Кастомный логгер, который использует LogManager для проверки включения уровней и пишет только в нужный файл"""
 
     def __init__(self, name: str):
         self.name = name
-        # Не используем self._logger, а всегда обращаемся к нужному логгеру по уровню
+        # Привязываем методы логгеров уровней один раз, чтобы не вызывать logging.getLogger на каждое сообщение
+        self._debug = loggers['debug'].debug
+        self._info = loggers['info'].info
+        self._warning = loggers['warning'].warning
+        self._error = loggers['error'].error
+        self._critical = loggers['critical'].critical
 
     def _should_log(self, level: str) -> bool:
         return LogManager.should_log(level)
 
     def debug(self, message: str):
         if self._should_log('debug'):
-            logging.getLogger('polls_bot.debug').debug(message)
+            self._debug(message)
 
     def info(self, message: str):
         if self._should_log('info'):
-            logging.getLogger('polls_bot.info').info(message)
+            self._info(message)
 
     def warning(self, message: str):
         if self._should_log('warning'):
-            logging.getLogger('polls_bot.warning').warning(message)
+            self._warning(message)
 
     def error(self, message: str, exc_info=False):
         if self._should_log('error'):
-            logging.getLogger('polls_bot.error').error(message, exc_info=exc_info)
+            self._error(message, exc_info=exc_info)
 
     def critical(self, message: str, exc_info=False):
         if self._should_log('critical'):
-            logging.getLogger('polls_bot.critical').critical(message, exc_info=exc_info)
+            self._critical(message, exc_info=exc_info)
+
+def _disabled_log(self, message: str, exc_info=False):
+    """Заглушка для уровней ниже MIN_LOG_LEVEL и выключенных в конфигурации"""
+
+# Исходные методы уровней: LogManager.bind_logger_methods подставляет вместо них заглушки
+# для уровней ниже MIN_LOG_LEVEL и выключенных в конфигурации, а при включении возвращает обратно
+_LOG_METHODS = MappingProxyType({level: CustomLogger.__dict__[level] for level in LOG_LEVELS})
 
 # Создаем кастомный логгер для использования в коде
 logger = CustomLogger(__name__)
@@ -167,6 +477,7 @@ class LogManager:
         'urllib3': 'urllib3',
         'asyncio': 'asyncio',
         'sqlite3': 'sqlite3',
+        'aiosqlite': 'aiosqlite',
         'aiohttp': 'aiohttp',
         'websockets': 'websockets',
         'requests': 'requests',
@@ -175,54 +486,47 @@ class LogManager:
         'socket': 'socket'
     }
 
+    # Общий handler для всех сторонних логгеров и последнее применённое состояние (max_level, есть ли handler)
+    _shared_handler: Optional[logging.Handler] = None
+    _applied_state: Optional[Tuple[int, bool]] = None
+
     @staticmethod
-    def setup_third_party_loggers():
-        """Настройка логгеров сторонних библиотек для подчинения нашей системе управления уровнями"""
-        try:
-            # Получаем текущую конфигурацию уровней
-            config_file = f"{LOG_DIR}/logging_config.json"
-            if os.path.exists(config_file):
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            else:
-                config = {level: True for level in LOG_FILES.keys()}
+    def _apply_config(config: dict) -> int:
+        """Подчинить логгеры сторонних библиотек конфигурации уровней; ничего не делает, если состояние не изменилось"""
+        # Находим самый низкий (наиболее подробный) включенный уровень; если все отключены - CRITICAL
+        enabled_levels = [LOG_LEVELS[level] for level, enabled in config.items() if enabled and level in LOG_LEVELS]
+        max_level = min(enabled_levels) if enabled_levels else logging.CRITICAL
+        state = (max_level, bool(enabled_levels))
+        if state == LogManager._applied_state:
+            return max_level
 
-            # Определяем максимальный уровень логирования на основе включенных уровней
-            enabled_levels = [level for level, enabled in config.items() if enabled]
-            if not enabled_levels:
-                # Если все уровни отключены, устанавливаем CRITICAL
-                max_level = logging.CRITICAL
-            else:
-                # Находим самый низкий (наиболее подробный) включенный уровень
-                level_mapping = {
-                    'debug': logging.DEBUG,
-                    'info': logging.INFO,
-                    'warning': logging.WARNING,
-                    'error': logging.ERROR,
-                    'critical': logging.CRITICAL
-                }
-                max_level = min(level_mapping[level] for level in enabled_levels)
+        if LogManager._shared_handler is None:
+            LogManager._shared_handler = LogManager.ThirdPartyLogHandler()
+            LogManager._shared_handler.setLevel(logging.DEBUG)  # Handler принимает все сообщения
 
-            # Настраиваем логгеры сторонних библиотек
-            for logger_name in LogManager.THIRD_PARTY_LOGGERS.values():
-                third_party_logger = logging.getLogger(logger_name)
+        for logger_name in LogManager.THIRD_PARTY_LOGGERS.values():
+            third_party_logger = logging.getLogger(logger_name)
+            third_party_logger.setLevel(max_level)
 
-                # Устанавливаем уровень логгера
-                third_party_logger.setLevel(max_level)
+            # Удаляем существующие handlers, чтобы избежать дублирования
+            for handler in third_party_logger.handlers[:]:
+                third_party_logger.removeHandler(handler)
 
-                # Удаляем существующие handlers, чтобы избежать дублирования
-                for handler in third_party_logger.handlers[:]:
-                    third_party_logger.removeHandler(handler)
+            # Добавляем наш handler только если есть включенные уровни
+            if enabled_levels:
+                third_party_logger.addHandler(LogManager._shared_handler)
 
-                # Добавляем наш кастомный handler только если есть включенные уровни
-                if enabled_levels:
-                    custom_handler = LogManager.ThirdPartyLogHandler()
-                    custom_handler.setLevel(logging.DEBUG)  # Handler принимает все сообщения
-                    third_party_logger.addHandler(custom_handler)
+            # Отключаем propagate для предотвращения дублирования
+            third_party_logger.propagate = False
 
-                # Отключаем propagate для предотвращения дублирования
-                third_party_logger.propagate = False
+        LogManager._applied_state = state
+        return max_level
 
+    @staticmethod
+    def setup_third_party_loggers():
+        """Настройка логгеров сторонних библиотек для подчинения нашей системе управления уровнями"""
+        try:
+            max_level = LogManager._apply_config(LogManager.load_logging_config())
             logger.info(f"Third-party loggers configured with max level: {logging.getLevelName(max_level)}")
             return True
         except Exception as e:
@@ -233,50 +537,7 @@ class LogManager:
     def update_third_party_loggers():
         """Обновить настройки логгеров сторонних библиотек при изменении конфигурации"""
         try:
-            # Получаем текущую конфигурацию уровней
-            config_file = f"{LOG_DIR}/logging_config.json"
-            if os.path.exists(config_file):
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            else:
-                config = {level: True for level in LOG_FILES.keys()}
-
-            # Определяем максимальный уровень логирования на основе включенных уровней
-            enabled_levels = [level for level, enabled in config.items() if enabled]
-            if not enabled_levels:
-                # Если все уровни отключены, устанавливаем CRITICAL
-                max_level = logging.CRITICAL
-            else:
-                # Находим самый низкий (наиболее подробный) включенный уровень
-                level_mapping = {
-                    'debug': logging.DEBUG,
-                    'info': logging.INFO,
-                    'warning': logging.WARNING,
-                    'error': logging.ERROR,
-                    'critical': logging.CRITICAL
-                }
-                max_level = min(level_mapping[level] for level in enabled_levels)
-
-            # Обновляем настройки логгеров сторонних библиотек
-            for logger_name in LogManager.THIRD_PARTY_LOGGERS.values():
-                third_party_logger = logging.getLogger(logger_name)
-
-                # Устанавливаем новый уровень логгера
-                third_party_logger.setLevel(max_level)
-
-                # Удаляем существующие handlers
-                for handler in third_party_logger.handlers[:]:
-                    third_party_logger.removeHandler(handler)
-
-                # Добавляем наш кастомный handler только если есть включенные уровни
-                if enabled_levels:
-                    custom_handler = LogManager.ThirdPartyLogHandler()
-                    custom_handler.setLevel(logging.DEBUG)
-                    third_party_logger.addHandler(custom_handler)
-
-                # Отключаем propagate
-                third_party_logger.propagate = False
-
+            max_level = LogManager._apply_config(LogManager.load_logging_config())
             logger.info(f"Third-party loggers updated with max level: {logging.getLevelName(max_level)}")
             return True
         except Exception as e:
@@ -305,40 +566,15 @@ class LogManager:
         def emit(self, record):
             """Обработка лог-записи от сторонних библиотек"""
             try:
-                # Определяем уровень записи
+                # Определяем уровень записи и соответствующий наш уровень
                 level_name = logging.getLevelName(record.levelno).lower()
+                mapped_level = level_name if level_name in LOG_LEVELS else 'info'
 
-                # Маппинг уровней Python logging в наши уровни
-                level_mapping = {
-                    'debug': 'debug',
-                    'info': 'info',
-                    'warning': 'warning',
-                    'error': 'error',
-                    'critical': 'critical'
-                }
-
-                # Получаем соответствующий уровень
-                mapped_level = level_mapping.get(level_name, 'info')
-
-                # Проверяем, включен ли этот уровень в нашей системе
-                if LogManager.should_log(mapped_level):
-                    # Форматируем сообщение
-                    message = self.format(record)
-
-                    # Добавляем префикс для идентификации источника
-                    prefixed_message = f"[{record.name}] {message}"
-
-                    # Логируем в соответствующий файл
-                    if mapped_level in LOG_FILES:
-                        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        log_entry = f"[{timestamp}] {level_name.upper()}: {prefixed_message}\n"
-
-                        try:
-                            with open(LOG_FILES[mapped_level], 'a', encoding='utf-8') as f:
-                                f.write(log_entry)
-                        except (IOError, OSError) as e:
-                            # Если не удается записать в файл, логируем ошибку в консоль
-                            print(f"Error writing to log file {mapped_level}: {e}")
+                # Проверяем, включен ли этот уровень в нашей системе и передаем запись
+                # в FileHandler нашего логгера: файл открыт один раз при импорте,
+                # источник виден по %(name)s в форматтере
+                if LogManager.should_log(mapped_level) and mapped_level in loggers:
+                    loggers[mapped_level].handle(record)
             except Exception as e:
                 # Fallback: логируем ошибку в консоль
                 print(f"Error in ThirdPartyLogHandler: {e}")
@@ -357,6 +593,12 @@ class LogManager:
                     total_size += os.path.getsize(log_file)
             return total_size
 
+    @staticmethod
+    def count_lines(path: str) -> int:
+        """Посчитать строки файла по байтам b'\\n' блоками по 1 МБ, без декодирования"""
+        with open(path, 'rb') as f:
+            return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+
     @staticmethod
     def get_log_stats() -> dict:
         """Получить статистику по логам"""
@@ -367,7 +609,7 @@ class LogManager:
                 stats[level] = {
                     'size_bytes': size,
                     'size_mb': round(size / (1024 * 1024), 2),
-                    'lines': sum(1 for _ in open(log_file, 'r', encoding='utf-8'))
+                    'lines': LogManager.count_lines(log_file)
                 }
             else:
                 stats[level] = {'size_bytes': 0, 'size_mb': 0, 'lines': 0}
@@ -394,30 +636,27 @@ class LogManager:
             return False
 
     @staticmethod
-    def rotate_logs(max_size_mb: int = 5) -> bool:
+    def rotate_logs(max_size_mb: int = LOG_MAX_SIZE_MB) -> bool:
         """Ротация логов при превышении размера"""
         try:
             rotated = False
             for level, log_file in LOG_FILES.items():
-                if os.path.exists(log_file):
-                    size_mb = os.path.getsize(log_file) / (1024 * 1024)
-                    if size_mb > max_size_mb:
-                        # Создаем резервную копию
-                        backup_file = f"{log_file}.{int(time.time())}"
-                        os.rename(log_file, backup_file)
-
-                        # Создаем новый пустой файл
-                        with open(log_file, 'w', encoding='utf-8') as f:
-                            f.write("")
-
-                        # Удаляем старые резервные копии (оставляем только 5 последних)
-                        backup_files = [f for f in os.listdir(LOG_DIR) if f.startswith(f"{os.path.basename(log_file)}.")]
-                        backup_files.sort(reverse=True)
-                        for old_backup in backup_files[5:]:
-                            os.remove(os.path.join(LOG_DIR, old_backup))
+                try:
+                    size_mb = os.stat(log_file).st_size / (1024 * 1024)
+                except FileNotFoundError:
+                    continue
+                if size_mb > max_size_mb:
+                    # Handler сам переименовывает файлы (.1 … .LOG_BACKUP_COUNT), удаляет лишние
+                    # и переоткрывает поток, так что запись не продолжается в резервную копию
+                    handler = log_handlers[level]
+                    handler.acquire()
+                    try:
+                        handler.doRollover()
+                    finally:
+                        handler.release()
 
-                        rotated = True
-                        logger.info(f"Rotated {level} log file (size: {size_mb:.2f}MB)")
+                    rotated = True
+                    logger.info(f"Rotated {level} log file (size: {size_mb:.2f}MB)")
 
             return rotated
         except Exception as e:
@@ -441,14 +680,10 @@ class LogManager:
     def toggle_logs(level: str) -> bool:
         """Включить/выключить логирование для определенного уровня"""
         try:
-            config_file = f"{LOG_DIR}/logging_config.json"
+            config_file = LOGGING_CONFIG_FILE
 
-            # Загружаем текущую конфигурацию
-            if os.path.exists(config_file):
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-            else:
-                config = {level: True for level in LOG_FILES.keys()}
+            # Загружаем текущую конфигурацию (копию: кэш не должен меняться до записи файла)
+            config = dict(LogManager.load_logging_config())
 
             # Переключаем состояние
             config[level] = not config.get(level, True)
@@ -456,6 +691,7 @@ class LogManager:
             # Сохраняем конфигурацию
             with open(config_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=2, ensure_ascii=False)
+            LogManager.invalidate_enabled_cache()
 
             # Обновляем настройки логгеров сторонних библиотек
             LogManager.update_third_party_loggers()
@@ -466,20 +702,52 @@ class LogManager:
             logger.error(f"Error toggling logs for {level}: {e}")
             return False
 
+    # Кэш флагов включения уровней: файл конфигурации перечитывается только при изменении mtime,
+    # а mtime проверяется не чаще раза в LOGGING_CONFIG_RECHECK секунд
+    _enabled_cache: Optional[dict] = None
+    _enabled_mtime: Optional[float] = None
+    _enabled_checked = 0.0
+
     @staticmethod
-    def is_enabled(level: str) -> bool:
-        """Проверить, включено ли логирование для определенного уровня"""
+    def bind_logger_methods(config: dict):
+        """Выключенные уровни становятся заглушками в классе CustomLogger: вызов не проверяет конфигурацию вовсе"""
+        for level, levelno in LOG_LEVELS.items():
+            enabled = levelno >= MIN_LOG_LEVEL and config.get(level, True)
+            setattr(CustomLogger, level, _LOG_METHODS[level] if enabled else _disabled_log)
+
+    @staticmethod
+    def invalidate_enabled_cache():
+        """Сбросить кэш флагов после записи logging_config.json"""
+        LogManager._enabled_cache = None
+
+    @staticmethod
+    def load_logging_config() -> dict:
+        """Общая разобранная конфигурация уровней (не изменять: это кэш, перечитывается по mtime)"""
+        now = time.monotonic()
+        if LogManager._enabled_cache is not None and now - LogManager._enabled_checked < LOGGING_CONFIG_RECHECK:
+            return LogManager._enabled_cache
+
+        LogManager._enabled_checked = now
         try:
-            config_file = f"{LOG_DIR}/logging_config.json"
+            mtime = os.stat(LOGGING_CONFIG_FILE).st_mtime
+        except OSError:
+            mtime = None
+        if LogManager._enabled_cache is None or mtime != LogManager._enabled_mtime:
+            LogManager._enabled_mtime = mtime
+            LogManager._enabled_cache = dict.fromkeys(LOG_FILES, True)  # По умолчанию все уровни включены
+            if mtime is not None:
+                try:
+                    with open(LOGGING_CONFIG_FILE, 'rb') as f:
+                        LogManager._enabled_cache.update(json_loads(f.read()))
+                except Exception as e:
+                    logger.error(f"Error reading logging config: {e}")
+            LogManager.bind_logger_methods(LogManager._enabled_cache)
+        return LogManager._enabled_cache
 
-            if os.path.exists(config_file):
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    return config.get(level, True)
-            return True  # По умолчанию включено
-        except Exception as e:
-            logger.error(f"Error checking log status for {level}: {e}")
-            return True
+    @staticmethod
+    def is_enabled(level: str) -> bool:
+        """Проверить, включено ли логирование для определенного уровня"""
+        return LogManager.load_logging_config().get(level, True)
 
     @staticmethod
     def should_log(level: str) -> bool:
@@ -491,39 +759,50 @@ class LogManager:
         """Логировать сообщение с проверкой включения уровня"""
         if LogManager.should_log(level):
             try:
-                if level in LOG_FILES:
-                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    log_entry = f"[{timestamp}] {level.upper()}: {message}\n"
-
-                    with open(LOG_FILES[level], 'a', encoding='utf-8') as f:
-                        f.write(log_entry)
+                if level in loggers:
+                    # Время подставляет formatter FileHandler'а (asctime)
+                    loggers[level].log(LOG_LEVELS[level], message)
             except Exception as e:
                 # Fallback to console if file logging fails
                 logger.error(f"Log error: {e}")
                 logger.error(f"[{level.upper()}] {message}")
 
+# Привязываем методы CustomLogger к MIN_LOG_LEVEL и сохранённой конфигурации уровней
+LogManager.load_logging_config()
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for retry attempt N (0-based), capped at RETRY_DELAY"""
+    return min(RETRY_DELAY, RETRY_BASE_DELAY * 2 ** attempt + random.uniform(0, RETRY_BASE_DELAY))
+
 def error_handler(func):
     """Enhanced decorator for error handling"""
+    name = func.__name__
+
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        try:
-            return await func(*args, **kwargs)
-        except RetryAfter as e:
-            logger.warning(f"Rate limited in {func.__name__}: retry after {e.retry_after}s")
-            await asyncio.sleep(e.retry_after)
-            return await func(*args, **kwargs)
-        except (TimedOut, NetworkError) as e:
-            logger.error(f"Network error in {func.__name__}: {e}")
-            if len(args) > 1:
-                await safe_send_error_message(args[1], "❌ Проблемы с сетью. Попробуйте позже.")
-        except TelegramError as e:
-            logger.error(f"Telegram error in {func.__name__}: {e}")
-            if len(args) > 1:
-                await safe_send_error_message(args[1], "❌ Ошибка Telegram. Попробуйте позже.")
-        except Exception as e:
-            logger.error(f"Unexpected error in {func.__name__}: {e}", exc_info=True)
-            if len(args) > 1:
-                await safe_send_error_message(args[1], "❌ Внутренняя ошибка. Обратитесь к администратору.")
+        for attempt in range(MAX_RETRIES):
+            try:
+                return await func(*args, **kwargs)
+            except RetryAfter as e:
+                logger.warning(f"Rate limited in {name}: retry after {e.retry_after}s (attempt {attempt + 1}/{MAX_RETRIES})")
+                if attempt < MAX_RETRIES - 1:
+                    await asyncio.sleep(e.retry_after)
+            except (TimedOut, NetworkError) as e:
+                logger.error(f"Network error in {name}: {e}")
+                if len(args) > 1:
+                    await safe_send_error_message(args[1], "❌ Проблемы с сетью. Попробуйте позже.")
+                return None
+            except TelegramError as e:
+                logger.error(f"Telegram error in {name}: {e}")
+                if len(args) > 1:
+                    await safe_send_error_message(args[1], "❌ Ошибка Telegram. Попробуйте позже.")
+                return None
+            except Exception as e:
+                logger.error(f"Unexpected error in {name}: {e}", exc_info=True)
+                if len(args) > 1:
+                    await safe_send_error_message(args[1], "❌ Внутренняя ошибка. Обратитесь к администратору.")
+                return None
+        logger.error(f"Giving up on {name} after {MAX_RETRIES} rate-limited attempts")
     return wrapper
 
 async def safe_send_error_message(update_or_query, text: str):
@@ -539,9 +818,13 @@ async def safe_send_error_message(update_or_query, text: str):
         logger.error(f"Failed to send error message: {e}")
 
 class RateLimiter:
-    """Enhanced rate limiter with memory leak protection"""
+    """Sliding-window-counter rate limiter with memory leak protection"""
     def __init__(self):
-        self.requests = defaultdict(list)
+        # user_id -> (bucket index, previous bucket count, current bucket count), least recently active first
+        self.buckets: OrderedDict = OrderedDict()
+        # Short history for anti-flooding checks (array('d') of timestamps, bounded per user),
+        # least recently active first
+        self.recent: OrderedDict = OrderedDict()
         self.last_cleanup = time.time()
 
     def is_allowed(self, user_id: int, limit: int = 10) -> bool:
@@ -551,133 +834,325 @@ class RateLimiter:
             self.cleanup()
             self.last_cleanup = now
 
-        user_reqs = self.requests[user_id]
-        user_reqs[:] = [t for t in user_reqs if now - t < RATE_LIMIT_WINDOW]
-
-        if len(user_reqs) >= limit:
+        bucket = int(now // RATE_LIMIT_WINDOW)
+        stored = self.buckets.get(user_id)
+        if stored is None:
+            prev_count, curr_count = 0, 0
+        else:
+            stored_bucket, prev_count, curr_count = stored
+            if stored_bucket == bucket - 1:
+                prev_count, curr_count = curr_count, 0
+            elif stored_bucket != bucket:
+                prev_count, curr_count = 0, 0
+
+        weight = 1 - (now % RATE_LIMIT_WINDOW) / RATE_LIMIT_WINDOW
+        if prev_count * weight + curr_count >= limit:
+            self.buckets[user_id] = (bucket, prev_count, curr_count)
+            self.buckets.move_to_end(user_id)
             return False
 
-        user_reqs.append(now)
+        self.buckets[user_id] = (bucket, prev_count, curr_count + 1)
+        self.buckets.move_to_end(user_id)
+        user_messages = self.recent.get(user_id)
+        if user_messages is None:
+            user_messages = self.recent[user_id] = array('d')
+        else:
+            self.recent.move_to_end(user_id)
+        user_messages.append(now)
+        if len(user_messages) > FLOOD_HISTORY_SIZE:
+            del user_messages[:len(user_messages) - FLOOD_HISTORY_SIZE]
         return True
 
     def is_user_flooding(self, user_id: int) -> bool:
         """Check if user is sending too many messages (anti-flooding)"""
         now = time.time()
-        user_messages = self.requests[user_id]
+        user_messages = self.recent.get(user_id)
+        if not user_messages:
+            return False
 
-        recent_messages = [t for t in user_messages if now - t < 60]
-        if len(recent_messages) > 10:
+        # Timestamps are appended in order, so window sizes are found by binary search
+        total = len(user_messages)
+        recent_count = total - bisect_right(user_messages, now - 60)
+        very_recent_count = total - bisect_right(user_messages, now - 10)
+
+        if recent_count > 10:
             return True
 
-        very_recent = [t for t in user_messages if now - t < 10]
-        if len(very_recent) > 3:
+        if very_recent_count > 3:
             return True
 
         return False
 
     def cleanup(self):
-        """Remove old entries and limit memory usage"""
+        """Evict cold users from the least recently active end; never scans active users"""
         now = time.time()
-        users_to_remove = []
-
-        if len(self.requests) > MAX_USERS_IN_MEMORY:
-            logger.warning(f"RateLimiter memory limit reached: {len(self.requests)} users")
-            oldest_users = sorted(self.requests.items(),
-                                key=lambda x: max(x[1]) if x[1] else 0)[:MAX_USERS_IN_MEMORY//2]
-            for user_id, _ in oldest_users:
-                del self.requests[user_id]
-            logger.info(f"Removed {len(oldest_users)} oldest users from memory")
-
-        for user_id in list(self.requests.keys()):
-            self.requests[user_id][:] = [t for t in self.requests[user_id] if now - t < RATE_LIMIT_WINDOW]
-            if not self.requests[user_id]:
-                users_to_remove.append(user_id)
+        current_bucket = int(now // RATE_LIMIT_WINDOW)
+
+        if len(self.buckets) > MAX_USERS_IN_MEMORY:
+            logger.warning(f"RateLimiter memory limit reached: {len(self.buckets)} users")
+            evicted = 0
+            while len(self.buckets) > MAX_USERS_IN_MEMORY // 2:
+                user_id, _ = self.buckets.popitem(last=False)
+                self.recent.pop(user_id, None)
+                evicted += 1
+            logger.info(f"Removed {evicted} oldest users from memory")
+
+        # Both counters are outside the sliding window once the bucket is two windows old
+        removed = 0
+        while self.buckets:
+            user_id, (bucket, _, _) = next(iter(self.buckets.items()))
+            if bucket >= current_bucket - 1:
+                break
+            self.buckets.popitem(last=False)
+            removed += 1
 
-        for user_id in users_to_remove:
-            del self.requests[user_id]
+        while self.recent:
+            user_messages = next(iter(self.recent.values()))
+            if user_messages and now - user_messages[-1] < 60:
+                break
+            self.recent.popitem(last=False)
+
+        if removed:
+            logger.info(f"RateLimiter cleanup: removed {removed} empty records")
+
+class TTLCache:
+    """Small in-process LRU cache with per-entry time-to-live"""
+    def __init__(self, maxsize: int = CACHE_MAX_SIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+class AsyncRateLimiter:
+    """Token bucket for outgoing Telegram calls: callers wait locally instead of running into 429 RetryAfter"""
+    def __init__(self, rate: float = TELEGRAM_SEND_RATE, period: float = 1.0):
+        self.rate = rate
+        self.period = period
+        self._tokens = rate
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate / self.period)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.period / self.rate)
 
-        if users_to_remove:
-            logger.info(f"RateLimiter cleanup: removed {len(users_to_remove)} empty records")
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
 
 class Database:
     """Enhanced database manager with proper error handling"""
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, read_pool_size: int = DB_READ_POOL_SIZE):
         self.db_path = db_path
+        self.read_pool_size = read_pool_size
+        self._write_conn: Optional[aiosqlite.Connection] = None
+        self._read_conns: List[aiosqlite.Connection] = []
+        self._read_pool: Optional[asyncio.Queue] = None
+        self._init_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
         self.init_database()
 
-    @contextmanager
-    def get_connection(self):
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            conn.row_factory = sqlite3.Row
-            conn.execute("PRAGMA foreign_keys = ON")
-            conn.execute("PRAGMA journal_mode = WAL")
-            conn.execute("PRAGMA synchronous = NORMAL")
-            yield conn
-        except sqlite3.Error as e:
-            logger.error(f"Database error: {e}")
-            if conn:
-                try:
-                    conn.rollback()
-                except sqlite3.Error:
-                    pass
-            raise
-        except Exception as e:
-            logger.error(f"Database connection error: {e}")
-            if conn:
+    async def _open_connection(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.db_path, timeout=30.0, cached_statements=256)
+        conn.row_factory = aiosqlite.Row
+        for pragma in DB_PRAGMAS:
+            await conn.execute(f"PRAGMA {pragma}")
+        return conn
+
+    async def initialize(self):
+        """Open connection pool: one writer and N readers (lazily, inside the running event loop)"""
+        async with self._init_lock:
+            if self._write_conn is not None:
+                return
+            self._write_conn = await self._open_connection()
+            self._read_pool = asyncio.Queue()
+            for _ in range(self.read_pool_size):
+                conn = await self._open_connection()
+                self._read_conns.append(conn)
+                self._read_pool.put_nowait(conn)
+
+    async def close(self):
+        """Close all pooled connections"""
+        for conn in [self._write_conn] + self._read_conns:
+            if conn is None:
+                continue
+            try:
+                await conn.close()
+            except sqlite3.Error:
+                pass
+        self._write_conn = None
+        self._read_conns = []
+        self._read_pool = None
+
+    @asynccontextmanager
+    async def get_connection(self, readonly: bool = False):
+        if self._write_conn is None:
+            await self.initialize()
+        if readonly:
+            conn = await self._read_pool.get()
+            try:
+                yield conn
+            except Exception as e:
+                logger.error(f"Database error: {e}")
+                raise
+            finally:
+                self._read_pool.put_nowait(conn)
+            return
+
+        async with self._write_lock:
+            conn = self._write_conn
+            try:
+                yield conn
+            except sqlite3.Error as e:
+                logger.error(f"Database error: {e}")
                 try:
-                    conn.rollback()
+                    await conn.rollback()
                 except sqlite3.Error:
                     pass
-            raise
-        finally:
-            if conn:
+                raise
+            except Exception as e:
+                logger.error(f"Database connection error: {e}")
                 try:
-                    conn.close()
+                    await conn.rollback()
                 except sqlite3.Error:
                     pass
+                raise
 
-    def query(self, sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
+    async def query(self, sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
         """Execute SELECT query with proper error handling"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(sql, params)
-                return cursor.fetchall()
+            async with self.get_connection(readonly=True) as conn:
+                async with conn.execute(sql, params) as cursor:
+                    return await cursor.fetchall()
         except Exception as e:
             logger.error(f"Query execution error: {sql}, params: {params}, error: {e}")
             return []
 
-    def execute(self, sql: str, params: Tuple = ()) -> bool:
+    async def scalar(self, sql: str, params: Tuple = (), default=None):
+        """First column of the first row (default if there is no row); fetches a single row only"""
+        try:
+            async with self.get_connection(readonly=True) as conn:
+                async with conn.execute(sql, params) as cursor:
+                    row = await cursor.fetchone()
+            return default if row is None else row[0]
+        except Exception as e:
+            logger.error(f"Scalar query error: {sql}, params: {params}, error: {e}")
+            return default
+
+    async def execute(self, sql: str, params: Tuple = ()) -> bool:
         """Execute INSERT/UPDATE/DELETE query with proper error handling"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(sql, params)
-                conn.commit()
+            async with self.get_connection() as conn:
+                await conn.execute(sql, params)
+                await conn.commit()
                 return True
         except Exception as e:
             logger.error(f"Execute error: {sql}, params: {params}, error: {e}")
             return False
 
-    def execute_with_result(self, sql: str, params: Tuple = ()) -> Optional[int]:
+    async def checkpoint(self) -> bool:
+        """Checkpoint WAL into the main database file and truncate it"""
+        try:
+            async with self.get_connection() as conn:
+                await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                return True
+        except Exception as e:
+            logger.error(f"WAL checkpoint error: {e}")
+            return False
+
+    async def execute_many(self, sql: str, seq_of_params: List[Tuple]) -> bool:
+        """Execute one statement for every parameter tuple in a single transaction"""
+        try:
+            async with self.get_connection() as conn:
+                await conn.executemany(sql, seq_of_params)
+                await conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Execute many error: {sql}, rows: {len(seq_of_params)}, error: {e}")
+            return False
+
+    async def execute_batch(self, statements: List[Tuple[str, Tuple]]) -> bool:
+        """Execute several INSERT/UPDATE/DELETE statements in a single transaction"""
+        try:
+            async with self.get_connection() as conn:
+                for sql, params in statements:
+                    await conn.execute(sql, params)
+                await conn.commit()
+                return True
+        except Exception as e:
+            logger.error(f"Execute batch error: {statements}, error: {e}")
+            return False
+
+    async def execute_chunked(self, statements: List[Tuple[str, Tuple]], chunk_size: int = CLEANUP_CHUNK_SIZE) -> int:
+        """Run bounded DELETE/UPDATE statements (each ending in LIMIT ?) one chunk per transaction until exhausted"""
+        total = 0
+        pending = list(statements)
+        try:
+            while pending:
+                remaining = []
+                async with self.get_connection() as conn:
+                    for sql, params in pending:
+                        async with conn.execute(sql, params + (chunk_size,)) as cursor:
+                            total += cursor.rowcount
+                            if cursor.rowcount >= chunk_size:
+                                remaining.append((sql, params))
+                    await conn.commit()
+                pending = remaining
+                # Отдаём управление циклу событий, чтобы не блокировать обработку сообщений
+                await asyncio.sleep(0)
+        except Exception as e:
+            logger.error(f"Execute chunked error: {statements}, error: {e}")
+        return total
+
+    async def execute_with_result(self, sql: str, params: Tuple = ()) -> Optional[int]:
         """Execute query and return lastrowid"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(sql, params)
-                conn.commit()
-                return cursor.lastrowid
+            async with self.get_connection() as conn:
+                async with conn.execute(sql, params) as cursor:
+                    lastrowid = cursor.lastrowid
+                await conn.commit()
+                return lastrowid
         except Exception as e:
             logger.error(f"Execute with result error: {sql}, params: {params}, error: {e}")
             return None
 
     def init_database(self):
-        """Initialize database with all required tables"""
+        """Initialize database with all required tables (sync, runs once before the event loop starts)"""
         os.makedirs(BOT_DIR, exist_ok=True)
 
-        with self.get_connection() as conn:
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
             conn.executescript("""
                 CREATE TABLE IF NOT EXISTS users (
                     user_id INTEGER PRIMARY KEY,
@@ -752,14 +1227,47 @@ class Database:
                     settings TEXT
                 );
 
-                CREATE INDEX IF NOT EXISTS idx_polls_creator ON polls(creator_id);
+                -- (creator_id, created_date) also serves creator-only lookups
+                DROP INDEX IF EXISTS idx_polls_creator;
+                CREATE INDEX IF NOT EXISTS idx_polls_creator_created ON polls(creator_id, created_date);
                 CREATE INDEX IF NOT EXISTS idx_sessions_user ON template_sessions(user_id);
-                CREATE INDEX IF NOT EXISTS idx_user_states ON user_states(user_id);
-                CREATE INDEX IF NOT EXISTS idx_sessions_created ON template_sessions(created_date);
-                CREATE INDEX IF NOT EXISTS idx_polls_decision_number ON polls(decision_number);
+                -- user_states.user_id is the rowid: lookups already hit the table B-tree directly
+                DROP INDEX IF EXISTS idx_user_states;
+                DROP INDEX IF EXISTS idx_sessions_created;
+                -- Only polls with a decision are numbered: a partial index stays small
+                DROP INDEX IF EXISTS idx_polls_decision_number;
+                CREATE INDEX IF NOT EXISTS idx_polls_decision_number_set ON polls(decision_number)
+                    WHERE decision_number IS NOT NULL;
+                CREATE INDEX IF NOT EXISTS idx_polls_status_created ON polls(status, created_date);
+                DROP INDEX IF EXISTS idx_user_states_state_updated;
+                CREATE INDEX IF NOT EXISTS idx_templates_name ON templates(name);
+                -- poll_votes(poll_id) is served by the UNIQUE(poll_id, user_id) autoindex;
+                -- (user_id, poll_id) covers vote purges and the "polls I voted in" joins
+                DROP INDEX IF EXISTS idx_poll_votes_user;
+                CREATE INDEX IF NOT EXISTS idx_poll_votes_user_poll ON poll_votes(user_id, poll_id);
+            """)
+
+            # Integer unix timestamps for cleanup range scans; older databases get the column added and backfilled
+            # (template_sessions.created_date is UTC CURRENT_TIMESTAMP, user_states.updated_date is local time)
+            timestamp_columns = (
+                ("template_sessions", "created_ts", "CAST(strftime('%s', created_date) AS INTEGER)"),
+                ("user_states", "updated_ts", "CAST(strftime('%s', updated_date, 'utc') AS INTEGER)"),
+            )
+            for table, column, backfill in timestamp_columns:
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+                    conn.execute(f"UPDATE {table} SET {column} = {backfill}")
+            conn.executescript("""
+                CREATE INDEX IF NOT EXISTS idx_sessions_created_ts ON template_sessions(created_ts);
+                CREATE INDEX IF NOT EXISTS idx_user_states_state_updated_ts ON user_states(state, updated_ts);
             """)
             conn.commit()
+            # Статистика для планировщика: SQLite сам решает, каким индексам нужен ANALYZE
+            conn.execute("PRAGMA optimize")
             logger.info("Database initialized successfully")
+        finally:
+            conn.close()
 
 def permission_required(permissions):
     """Enhanced decorator for permission checking (универсальный для update и callback_query)"""
@@ -767,12 +1275,11 @@ def permission_required(permissions):
         @wraps(func)
         async def wrapper(self, update_or_query, context):
             user_id = self.get_user_id(update_or_query)
-            user_perm = self.get_permissions(user_id)
+            user_perm = await self.get_permissions(user_id)
             if user_perm not in permissions and user_perm != "admin":
                 await self.send_message(update_or_query, "❌ Недостаточно прав для выполнения команды.")
                 return
-            rate_limit = self.config.get('rate_limit_hour', 10)
-            if not self.rate_limiter.is_allowed(user_id, rate_limit):
+            if not self.rate_limiter.is_allowed(user_id, self.rate_limit_hour):
                 await self.send_message(update_or_query, "⚠️ Превышен лимит запросов. Попробуйте позже.")
                 return
             return await func(self, update_or_query, context)
@@ -787,17 +1294,147 @@ class PollsBot:
         self.config = self._load_config()
         self.db = Database(DB_PATH)
         self.rate_limiter = RateLimiter()
+        # Конфигурация читается один раз при старте, поэтому лимит можно зафиксировать здесь
+        self.rate_limit_hour = self.config.get('rate_limit_hour', 10)
+        self._permissions_cache = TTLCache()
+        # user_id -> username last written by add_user; expiry bounds how stale last_activity can get
+        self._known_users = TTLCache(maxsize=STATE_CACHE_SIZE, ttl=USER_ACTIVITY_REFRESH)
+        # The bot is the only writer of user_states, so cached states never go stale
+        self._state_cache = TTLCache(maxsize=STATE_CACHE_SIZE, ttl=math.inf)
+        self._pending_states: Dict[int, Tuple[str, str]] = {}
+        # Batch currently being written by _flush_user_states
+        self._flushing_states: Dict[int, Tuple[str, str]] = {}
+        self._state_flush_task: Optional[asyncio.Task] = None
+        self._pending_votes: Dict[Tuple[str, int], Tuple[str, int, str, int]] = {}
+        # poll_id -> (poll row, vote rows) for rendering; dropped on every write to the poll or its votes
+        self._poll_cache = TTLCache()
+        self._poll_cache_generation = 0
+        self._vote_flush_task: Optional[asyncio.Task] = None
+        # message key -> (query, text, keyboard) of the latest pending poll redraw, and its flush task
+        self._pending_edits: Dict[object, Tuple[object, str, InlineKeyboardMarkup]] = {}
+        self._edit_flush_tasks: Dict[object, asyncio.Task] = {}
+        self._send_limiter = AsyncRateLimiter()
+        self._templates_cache: Optional[List[Dict]] = None
+        self._templates_by_id: Dict[int, Dict] = {}
+        self._templates_cache_time = 0.0
         self.application = None
         self._cleanup_task = None
+        self._log_config_task = None
         self._write_pid()
         self.menus = self.Menus(self)
+        # Callback actions (the part of callback_data before ":") routed with one dict lookup;
+        # every route is called as route(update, context, arg)
+        self._callback_routes = {
+            "templates": lambda update, context, arg: self.show_templates_for_use(update.callback_query),
+            "back_to_templates": lambda update, context, arg: self.show_templates_for_use(update.callback_query),
+            "active_polls": lambda update, context, arg: self.show_active_polls(update.callback_query),
+            "closed_polls": lambda update, context, arg: self.show_closed_polls(update.callback_query),
+            "status": lambda update, context, arg: self.status_command(update.callback_query, context),
+            "help": lambda update, context, arg: self.help_command(update.callback_query, context),
+            "use_tpl": lambda update, context, arg: self.handle_use_template(update.callback_query, arg),
+            "show_poll": lambda update, context, arg: self.show_single_poll(update.callback_query, arg),
+            "show_closed_poll": lambda update, context, arg: self.show_single_poll(update.callback_query, arg),
+            "vote": lambda update, context, arg: self.vote_handler(update, context),
+            "close_poll": lambda update, context, arg: self.close_poll_handler(update, context),
+            "edit_poll": lambda update, context, arg: self.edit_poll_handler(update, context),
+            "delete_poll": lambda update, context, arg: self.delete_poll_handler(update, context),
+            "confirm_delete_poll": lambda update, context, arg: self.confirm_delete_poll_handler(update, context),
+            "edit_poll_question": lambda update, context, arg: self.start_edit_poll_question(update, context),
+            "edit_poll_options": lambda update, context, arg: self.start_edit_poll_options(update, context),
+        }
+        # Text input handlers keyed by user state; every handler is called as handler(update, text, state_data)
+        self._text_state_handlers = {
+            UserState.WAITING_POLL_QUESTION: self.handle_poll_question_input,
+            UserState.WAITING_POLL_OPTION: self.handle_poll_option_input,
+            UserState.WAITING_POLL_OPTIONS: self.handle_poll_options_input,
+            UserState.WAITING_TEMPLATE_OPTION: self.handle_template_option_input,
+            UserState.WAITING_TEMPLATE_NAME: lambda update, text, state_data: self.handle_template_name_input(update, text),
+            UserState.WAITING_TEMPLATE_QUESTION: self.handle_template_question_input,
+            UserState.WAITING_TEMPLATE_OPTIONS: self.handle_template_options_input,
+            UserState.WAITING_DECISION_NUMBER_INPUT: self.handle_decision_number_input,
+            UserState.WAITING_TEMPLATE_THRESHOLD: self.handle_template_threshold_input,
+            UserState.WAITING_EDIT_TEMPLATE_THRESHOLD: self.handle_edit_template_threshold_input,
+            UserState.WAITING_TEMPLATE_CREATION_THRESHOLD: self.handle_template_creation_threshold_input,
+            UserState.WAITING_MAX_PARTICIPANTS: self.handle_max_participants_input,
+            UserState.WAITING_TEMPLATE_POLL_THRESHOLD: self.handle_template_poll_threshold_input,
+            UserState.WAITING_POLL_THRESHOLD: self.handle_poll_threshold_input,
+        }
 
     class Menus:
         def __init__(self, bot):
             self.bot = bot
+            # Меню без состояния собираются один раз: InlineKeyboardMarkup неизменяем, его можно отдавать повторно
+            self._admin_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("👥 Управление пользователями", callback_data="admin_users")],
+                [InlineKeyboardButton("📊 Статистика системы", callback_data="admin_stats")],
+                [InlineKeyboardButton("📋 Управление логами", callback_data="admin_logs")],
+                [InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]
+            ])
+            self._finish_poll_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("✅ Завершить создание", callback_data="finish_poll_creation")],
+                [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]
+            ])
+            self._finish_template_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("✅ Завершить создание", callback_data="finish_template_creation")],
+                [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]
+            ])
+            self._back_to_templates_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_templates")]
+            ])
+            self._admin_users_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔄 Обновить", callback_data="admin_users")],
+                [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]
+            ])
+            self._admin_stats_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔄 Обновить", callback_data="admin_stats")],
+                [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]
+            ])
+            self._admin_back_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]
+            ])
+            self._cancel_delete_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("❌ Отмена", callback_data="cancel_delete")]
+            ])
+            self._poll_type_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("📊 Простое голосование", callback_data="create_simple")],
+                [InlineKeyboardButton("📋 Голосование из шаблона", callback_data="create_from_template")],
+                [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]
+            ])
+            self._admin_logs_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("📊 Статистика логов", callback_data="admin_logs_stats")],
+                [InlineKeyboardButton("🧹 Очистить все логи", callback_data="admin_clear_all_logs")],
+                [InlineKeyboardButton("🔧 Очистить по уровням", callback_data="admin_clear_logs_by_level")],
+                [InlineKeyboardButton("📄 Последние логи", callback_data="admin_view_recent_logs")],
+                [InlineKeyboardButton("🔄 Ротация логов", callback_data="admin_rotate_logs")],
+                [InlineKeyboardButton("⚙️ Управление уровнями", callback_data="admin_logs_levels")],
+                [InlineKeyboardButton("🔌 Статус сторонних логгеров", callback_data="admin_third_party_loggers")],
+                [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]
+            ])
+            self._admin_clear_logs_by_level_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("🐛 Debug", callback_data="admin_clear_logs:debug")],
+                [InlineKeyboardButton("ℹ️ Info", callback_data="admin_clear_logs:info")],
+                [InlineKeyboardButton("⚠️ Warning", callback_data="admin_clear_logs:warning")],
+                [InlineKeyboardButton("❌ Error", callback_data="admin_clear_logs:error")],
+                [InlineKeyboardButton("🚨 Critical", callback_data="admin_clear_logs:critical")],
+                [InlineKeyboardButton("🔙 Назад", callback_data="admin_logs")]
+            ])
+            self._admin_view_logs_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("🐛 Debug", callback_data="admin_view_logs:debug")],
+                [InlineKeyboardButton("ℹ️ Info", callback_data="admin_view_logs:info")],
+                [InlineKeyboardButton("⚠️ Warning", callback_data="admin_view_logs:warning")],
+                [InlineKeyboardButton("❌ Error", callback_data="admin_view_logs:error")],
+                [InlineKeyboardButton("🚨 Critical", callback_data="admin_view_logs:critical")],
+                [InlineKeyboardButton("🔙 Назад", callback_data="admin_logs")]
+            ])
+            self._admin_rotate_logs_menu = InlineKeyboardMarkup([
+                [InlineKeyboardButton("🔙 Назад", callback_data="admin_logs")]
+            ])
+            self._back_menus = {}
+            self._main_menus = {False: self._build_main_menu(False), True: self._build_main_menu(True)}
+            self._settings_menus = {}
 
-        def main_menu(self, user_id=None):
-            # user_id нужен для показа админки
+        @staticmethod
+        def _build_main_menu(is_admin: bool):
             buttons = [
                 [InlineKeyboardButton("📊 Создать голосование", callback_data="create_poll")],
                 [InlineKeyboardButton("📋 Шаблоны", callback_data="templates")],
@@ -805,33 +1442,31 @@ class PollsBot:
                 [InlineKeyboardButton("🔒 Закрытые голосования", callback_data="closed_polls")],
             ]
 
-            if user_id and self.bot.get_permissions(user_id) == "admin":
+            if is_admin:
                 buttons.append([InlineKeyboardButton("🛠 Админка", callback_data="admin")])
             buttons.append([InlineKeyboardButton("⚙️ Настройки отображения", callback_data="display_settings")])
             buttons.append([InlineKeyboardButton("ℹ️ Справка", callback_data="help")])
             return InlineKeyboardMarkup(buttons)
 
+        async def main_menu(self, user_id=None):
+            # user_id нужен для показа админки; вариантов меню всего два
+            return self._main_menus[bool(user_id) and await self.bot.get_permissions(user_id) == "admin"]
+
         def admin_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("👥 Управление пользователями", callback_data="admin_users")],
-                [InlineKeyboardButton("📊 Статистика системы", callback_data="admin_stats")],
-                [InlineKeyboardButton("📋 Управление логами", callback_data="admin_logs")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]
-            ])
+            return self._admin_menu
 
-        def template_menu(self, templates, user_id):
+        async def template_menu(self, templates, user_id):
             keyboard = []
+            permissions = await self.bot.get_permissions(user_id) if user_id is not None else "none"
             for template in templates[:10]:
                 # Безопасно получаем ID шаблона
                 template_id = template.get('id') or template.get('template_id') or str(template.get('name', ''))
                 row = [InlineKeyboardButton(f"📊 {template['name']}", callback_data=f"use_tpl:{template_id}")]
-                if user_id is not None and (
-                    (template.get('created_by') == user_id) or (self.bot.get_permissions(user_id) == "admin")
-                ):
+                if user_id is not None and (template.get('created_by') == user_id or permissions == "admin"):
                     row.append(InlineKeyboardButton("✏️ Изменить порог", callback_data=f"edit_tpl_threshold:{template_id}"))
                     row.append(InlineKeyboardButton("🗑️", callback_data=f"delete_tpl:{template_id}"))
                 keyboard.append(row)
-            if self.bot.get_permissions(user_id) in ["create", "admin"]:
+            if permissions in CREATE_PERMISSIONS:
                 keyboard.append([InlineKeyboardButton("➕ Создать", callback_data="new_template")])
             keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")])
             return InlineKeyboardMarkup(keyboard)
@@ -842,21 +1477,13 @@ class PollsBot:
             return InlineKeyboardMarkup(keyboard)
 
         def finish_poll_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("✅ Завершить создание", callback_data="finish_poll_creation")],
-                [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]
-            ])
+            return self._finish_poll_menu
 
         def finish_template_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("✅ Завершить создание", callback_data="finish_template_creation")],
-                [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]
-            ])
+            return self._finish_template_menu
 
         def back_to_templates_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_templates")]
-            ])
+            return self._back_to_templates_menu
 
         def confirm_delete_template_menu(self, template_name):
             return InlineKeyboardMarkup([
@@ -876,21 +1503,13 @@ class PollsBot:
             ])
 
         def admin_users_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("🔄 Обновить", callback_data="admin_users")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]
-            ])
+            return self._admin_users_menu
 
         def admin_stats_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("🔄 Обновить", callback_data="admin_stats")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]
-            ])
+            return self._admin_stats_menu
 
         def admin_back_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]
-            ])
+            return self._admin_back_menu
 
         def admin_setperm_menu(self, target_user_id):
             perms = [
@@ -910,9 +1529,7 @@ class PollsBot:
             ])
 
         def cancel_delete_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("❌ Отмена", callback_data="cancel_delete")]
-            ])
+            return self._cancel_delete_menu
 
         def ask_variable_menu(self, session_id):
             return InlineKeyboardMarkup([
@@ -920,41 +1537,42 @@ class PollsBot:
             ])
 
         def back_menu(self, to="main"):
-            if to == "main":
-                return InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]])
-            elif to == "templates":
-                return InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="back_to_templates")]])
-            else:
-                return InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data=f"back_to_{to}")]])
+            menu = self._back_menus.get(to)
+            if menu is None:
+                menu = self._back_menus[to] = InlineKeyboardMarkup(
+                    [[InlineKeyboardButton("⬅️ Назад", callback_data=f"back_to_{to}")]]
+                )
+            return menu
 
         def poll_type_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("📊 Простое голосование", callback_data="create_simple")],
-                [InlineKeyboardButton("📋 Голосование из шаблона", callback_data="create_from_template")],
-                [InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")]
-            ])
+            return self._poll_type_menu
+
+        DISPLAY_SETTINGS_OPTIONS = (
+            ("show_author", "👤 Автор"),
+            ("show_creation_date", "📅 Дата создания"),
+            ("show_vote_count", "👥 Кол-во проголосовавших"),
+            ("show_template", "🏷️ Шаблон"),
+            ("show_decision_status", "🎯 Статус решения"),
+            ("show_voter_names", "👥 Имена проголосовавших"),
+            ("show_decision_numbers", "🔢 Номер решения"),
+        )
 
         def display_settings_menu(self, user_id, user_settings, config):
-            opts = [
-                ("show_author", "👤 Автор"),
-                ("show_creation_date", "📅 Дата создания"),
-                ("show_vote_count", "👥 Кол-во проголосовавших"),
-                ("show_template", "🏷️ Шаблон"),
-                ("show_decision_status", "🎯 Статус решения"),
-                ("show_voter_names", "👥 Имена проголосовавших"),
-                ("show_decision_numbers", "🔢 Номер решения"),
-            ]
-            keyboard = []
-            for opt, label in opts:
-                val = user_settings.get(opt, config.get(opt, True))
-                btn = InlineKeyboardButton(f"{label}: {'✅' if val else '❌'}", callback_data=f"toggle_setting:{opt}")
-                keyboard.append([btn])
-            keyboard.append([InlineKeyboardButton("♻️ Сбросить к стандартным", callback_data="reset_settings")])
-            keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")])
-            return InlineKeyboardMarkup(keyboard)
+            # Меню зависит только от набора флагов: не более 2**7 вариантов, каждый собирается один раз
+            flags = tuple(bool(user_settings.get(opt, config.get(opt, True))) for opt, _ in self.DISPLAY_SETTINGS_OPTIONS)
+            menu = self._settings_menus.get(flags)
+            if menu is None:
+                keyboard = [
+                    [InlineKeyboardButton(f"{label}: {'✅' if val else '❌'}", callback_data=f"toggle_setting:{opt}")]
+                    for (opt, label), val in zip(self.DISPLAY_SETTINGS_OPTIONS, flags)
+                ]
+                keyboard.append([InlineKeyboardButton("♻️ Сбросить к стандартным", callback_data="reset_settings")])
+                keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")])
+                menu = self._settings_menus[flags] = InlineKeyboardMarkup(keyboard)
+            return menu
 
-        def decision_number_menu(self, user_id):
-            user_settings = self.bot.get_user_settings(user_id)
+        async def decision_number_menu(self, user_id):
+            user_settings = await self.bot.get_user_settings(user_id)
             last_num = user_settings.get('last_decision_number', 0)
             next_num = last_num + 1 if last_num else 1
             return InlineKeyboardMarkup([
@@ -966,16 +1584,7 @@ class PollsBot:
 
 
         def admin_logs_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("📊 Статистика логов", callback_data="admin_logs_stats")],
-                [InlineKeyboardButton("🧹 Очистить все логи", callback_data="admin_clear_all_logs")],
-                [InlineKeyboardButton("🔧 Очистить по уровням", callback_data="admin_clear_logs_by_level")],
-                [InlineKeyboardButton("📄 Последние логи", callback_data="admin_view_recent_logs")],
-                [InlineKeyboardButton("🔄 Ротация логов", callback_data="admin_rotate_logs")],
-                [InlineKeyboardButton("⚙️ Управление уровнями", callback_data="admin_logs_levels")],
-                [InlineKeyboardButton("🔌 Статус сторонних логгеров", callback_data="admin_third_party_loggers")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]
-            ])
+            return self._admin_logs_menu
 
         def admin_logs_levels_menu(self):
             """Меню управления уровнями логирования"""
@@ -995,62 +1604,31 @@ class PollsBot:
             return InlineKeyboardMarkup(keyboard)
 
         def admin_clear_logs_by_level_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("🐛 Debug", callback_data="admin_clear_logs:debug")],
-                [InlineKeyboardButton("ℹ️ Info", callback_data="admin_clear_logs:info")],
-                [InlineKeyboardButton("⚠️ Warning", callback_data="admin_clear_logs:warning")],
-                [InlineKeyboardButton("❌ Error", callback_data="admin_clear_logs:error")],
-                [InlineKeyboardButton("🚨 Critical", callback_data="admin_clear_logs:critical")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="admin_logs")]
-            ])
+            return self._admin_clear_logs_by_level_menu
 
         def admin_view_logs_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("🐛 Debug", callback_data="admin_view_logs:debug")],
-                [InlineKeyboardButton("ℹ️ Info", callback_data="admin_view_logs:info")],
-                [InlineKeyboardButton("⚠️ Warning", callback_data="admin_view_logs:warning")],
-                [InlineKeyboardButton("❌ Error", callback_data="admin_view_logs:error")],
-                [InlineKeyboardButton("🚨 Critical", callback_data="admin_view_logs:critical")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="admin_logs")]
-            ])
+            return self._admin_view_logs_menu
 
         def admin_rotate_logs_menu(self):
-            return InlineKeyboardMarkup([
-                [InlineKeyboardButton("🔙 Назад", callback_data="admin_logs")]
-            ])
-
-    def _load_config(self) -> Dict:
-        """Load configuration with comprehensive defaults"""
-        defaults = {
-            "bot_token": "",
-            "admin_chat_id": "",
-            "polling_interval": 2,
-            "max_poll_options": 10,
-            "rate_limit_hour": 10,
-            "web_port": 8080,
-            "default_decision_threshold": 50,
-            "auto_close_hours": 24,
-            "show_poll_stats": True,
-            "show_author": True,
-            "show_template": True,
-            "show_creation_date": True,
-            "show_vote_count": True,
-            "show_decision_status": True,
-            "non_anonymous_voting": False,
-            "show_voter_names": True,
-            "show_decision_numbers": True,
-            "max_voters_display": 5
-        }
+            return self._admin_rotate_logs_menu
 
-        if os.path.exists(CONFIG_PATH):
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def _load_config_cached(path: str) -> MappingProxyType:
+        """Read and merge config file once per path; result is read-only"""
+        if os.path.exists(path):
             try:
-                with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-                    config = json.load(f)
-                    return {**defaults, **config}
+                with open(path, 'rb') as f:
+                    config = json_loads(f.read())
+                    return MappingProxyType({**DEFAULT_CONFIG, **config})
             except Exception as e:
                 logger.error(f"Config load error: {e}")
 
-        return defaults
+        return DEFAULT_CONFIG
+
+    def _load_config(self) -> Dict:
+        """Load configuration with comprehensive defaults"""
+        return dict(self._load_config_cached(CONFIG_PATH))
 
     def _write_pid(self):
         """Write PID file"""
@@ -1061,16 +1639,25 @@ class PollsBot:
         except (OSError, IOError) as e:
             logger.warning(f"Could not write PID: {e}")
 
+    def _remove_pid(self):
+        """Remove PID file (blocking; called off the event loop)"""
+        try:
+            os.remove(PID_FILE)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove PID file: {e}")
+
     async def validate_bot_token(self, token: str) -> bool:
         """Validate bot token format and accessibility"""
-        if not token or not re.match(r'^\d+:[A-Za-z0-9_-]{35}$', token):
+        if not token or not BOT_TOKEN_RE.match(token):
             logger.error("Invalid bot token format")
             return False
 
         try:
-            app = Application.builder().token(token).build()
-            async with app:
-                bot_info = await app.bot.get_me()
+            # Одного Bot достаточно для getMe: без Application, Updater и JobQueue
+            async with Bot(token) as bot:
+                bot_info = await bot.get_me()
                 logger.info(f"Bot validated: {bot_info.username} ({bot_info.id})")
                 return True
         except Exception as e:
@@ -1082,59 +1669,7 @@ class PollsBot:
         if not data or len(data) > 100:
             return False
 
-        allowed_patterns = [
-            # Основные меню
-            r'^(create_poll|templates|active_polls|closed_polls|status|admin|help|display_settings|reset_settings)$',
-            r'^(back_to_main|back_to_templates|back_to_\w+)$',
-            
-            # Создание опросов
-            r'^(create_simple|create_from_template|new_template|finish_poll_creation|finish_template_creation)$',
-
-            r'^(enter_decision_number|next_decision_number)$',
-            
-            # Шаблоны
-            r'^use_tpl:\d+$',
-            r'^continue_tpl:\d+$',
-            r'^delete_tpl:\d+$',
-            r'^confirm_delete_template:\d+$',
-            r'^edit_tpl_threshold:\d+$',
-            
-            # Голосования
-            r'^vote:[a-f0-9-]{36}:\d+$',
-            r'^vote_option:\d+$',
-            r'^close_poll:[a-f0-9-]{36}$',
-            r'^edit_poll:[a-f0-9-]{36}$',
-            r'^delete_poll:[a-f0-9-]{36}$',
-            r'^confirm_delete_poll:[a-f0-9-]{36}$',
-            r'^edit_poll_question:[a-f0-9-]{36}$',
-            r'^edit_poll_options:[a-f0-9-]{36}$',
-            r'^show_poll:[a-f0-9-]{36}$',
-            r'^show_closed_poll:[a-f0-9-]{36}$',
-            
-            # Админка - пользователи
-            r'^admin_(users|stats|back)$',
-            r'^admin_setperm:\d+$',
-            r'^admin_perm_select:\d+:(use|create|admin)$',
-            r'^admin_revoke:\d+$',
-            r'^admin_delete:\d+$',
-            r'^admin_confirm_delete:\d+$',
-            
-            # Админка - логи
-            r'^admin_(logs|logs_stats|clear_all_logs|clear_logs_by_level|view_recent_logs|rotate_logs|logs_levels|third_party_loggers)$',
-            r'^admin_clear_logs:(debug|info|warning|error|critical)$',
-            r'^admin_view_logs:(debug|info|warning|error|critical)$',
-            r'^admin_toggle_logs:(debug|info|warning|error|critical)$',
-            
-            # Настройки
-            r'^toggle_setting:[\w_]+$',
-            
-            # Отмена и подтверждения
-            r'^cancel:[a-f0-9-]{36}$',
-            r'^cancel_delete$',
-            r'^confirm_delete:\d+$',
-        ]
-
-        return any(re.match(pattern, data) for pattern in allowed_patterns)
+        return CALLBACK_DATA_RE.match(data) is not None
 
     # Utility methods
     def sanitize(self, text: str, max_len: int = 200) -> str:
@@ -1142,8 +1677,8 @@ class PollsBot:
         if not text or not isinstance(text, str):
             return ""
 
-        text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
-        text = re.sub(r'\s+', ' ', text.strip())
+        # split() без аргументов схлопывает любые пробельные символы и обрезает края
+        text = ' '.join(text.translate(CONTROL_CHARS_TABLE).split())
 
         return text[:max_len] if len(text) > max_len else text
 
@@ -1152,13 +1687,19 @@ class PollsBot:
         if not option or not isinstance(option, str):
             return ""
         
-        # Remove markdown symbols that can cause display issues
-        cleaned = option.replace('**', '').replace('*', '').replace('`', '').replace('_', '')
-        
-        # Remove extra whitespace
-        cleaned = re.sub(r'\s+', ' ', cleaned.strip())
-        
-        return cleaned
+        # Remove markdown symbols that can cause display issues and extra whitespace
+        return ' '.join(option.translate(MARKDOWN_CHARS_TABLE).split())
+
+    @staticmethod
+    def _option_emoji(option_lower: str, index: int) -> str:
+        """Emoji for a poll option by its lowercased text: за/да, против/нет, воздержался или номер"""
+        if "да" in option_lower or "за" in option_lower:
+            return "✅"
+        if "нет" in option_lower or "против" in option_lower:
+            return "❌"
+        if "воздерж" in option_lower:
+            return "🟡"
+        return f"{index+1}️⃣"
 
     def format_username_for_display(self, username: str) -> str:
         """Format username for display in Markdown, properly escaping special characters"""
@@ -1177,22 +1718,25 @@ class PollsBot:
 
     def extract_variables(self, text: str) -> List[str]:
         """Extract variables like {ФИО}, {Дата}, {email} (1-30 символов, любые буквы/цифры/_)"""
-        variables = re.findall(r'\{([\w\sА-Яа-яЁёA-Za-z0-9@#\-\.,:;/!\?&%+=\'\"\(\)\[\]]{1,30})\}', text, re.UNICODE)
-        return sorted(list(set(variables)))
+        # Порядок вопросов пользователю — алфавитный, поэтому sorted() остаётся; лишняя копия list() не нужна
+        return sorted(set(VARIABLE_RE.findall(text)))
 
     def substitute_variables(self, text: str, values: Dict[str, str]) -> str:
         """Replace variables with values and validate"""
-        result = text
-        for var, value in values.items():
-            placeholder = f"{{{var}}}"
-            if placeholder in result:
-                result = result.replace(placeholder, str(value))
-        # Найти все неразрешённые переменные
-        remaining_vars = re.findall(r'\{([\w\sА-Яа-яЁёA-Za-z0-9@#\-\.,:;/!\?&%+=\'\"\(\)\[\]]{1,30})\}', result, re.UNICODE)
+        remaining_vars = []
+
+        def replace(match):
+            var = match.group(1)
+            value = values.get(var)
+            if value is None:
+                # Неразрешённая переменная
+                remaining_vars.append(var)
+                return f"[{var}]"
+            return str(value)
+
+        result = VARIABLE_RE.sub(replace, text)
         if remaining_vars:
             logger.warning(f"Unresolved variables in template: {remaining_vars}")
-            for var in remaining_vars:
-                result = result.replace(f"{{{var}}}", f"[{var}]")
         return result
 
     def validate_poll_data(self, question: str, options: List[str]) -> Tuple[bool, str]:
@@ -1217,166 +1761,96 @@ class PollsBot:
 
         return True, ""
 
+    @staticmethod
+    def _resolve_sender(update_or_query):
+        """Bound coroutine that delivers text for this update/query: edit, reply or send to chat (None if unknown)"""
+        if hasattr(update_or_query, 'edit_message_text'):
+            return update_or_query.edit_message_text
+        if hasattr(update_or_query, 'message') and update_or_query.message:
+            return update_or_query.message.reply_text
+        if hasattr(update_or_query, 'effective_chat'):
+            return update_or_query.effective_chat.send_message
+        return None
+
     async def send_message(self, update_or_query, text: str, reply_markup=None):
         """Universal message sender with Markdown fallback"""
         logger.debug(f"send_message called: text='{text}', reply_markup={reply_markup}")
+        sender = self._resolve_sender(update_or_query)
+        if sender is None:
+            logger.error(f"Unknown update_or_query type: {type(update_or_query)}")
+            return False
         for attempt in range(MAX_RETRIES):
             try:
                 # Сначала пробуем отправить с Markdown
-                if hasattr(update_or_query, 'edit_message_text'):
-                    logger.debug(f"Calling edit_message_text with text='{text}' and reply_markup={reply_markup}")
-                    await update_or_query.edit_message_text(
-                        text,
-                        parse_mode=ParseMode.MARKDOWN,
-                        reply_markup=reply_markup
-                    )
-                elif hasattr(update_or_query, 'message') and update_or_query.message:
-                    logger.debug(f"Calling reply_text with text='{text}' and reply_markup={reply_markup}")
-                    await update_or_query.message.reply_text(
-                        text,
-                        parse_mode=ParseMode.MARKDOWN,
-                        reply_markup=reply_markup
-                    )
-                elif hasattr(update_or_query, 'effective_chat'):
-                    logger.debug(f"Calling send_message with text='{text}' and reply_markup={reply_markup}")
-                    await update_or_query.effective_chat.send_message(
-                        text,
-                        parse_mode=ParseMode.MARKDOWN,
-                        reply_markup=reply_markup
-                    )
-                else:
-                    logger.error(f"Unknown update_or_query type: {type(update_or_query)}")
-                    return False
+                async with self._send_limiter:
+                    await sender(text, parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
                 logger.debug("send_message success")
                 return True
 
-            except TelegramError as e:
-                logger.error(f"TelegramError in send_message: {e}")
+            except RetryAfter as e:
+                logger.error(f"RetryAfter in send_message: {e}")
+                if attempt < MAX_RETRIES - 1:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                else:
+                    logger.error(f"Max retries exceeded for send_message")
+                    return False
+            except BadRequest as e:
+                # BadRequest наследует NetworkError, но повтор его не исправит
+                logger.error(f"BadRequest in send_message: {e}")
                 if "can't parse entities" in str(e).lower() or "can't find end of the entity" in str(e).lower():
                     # Если ошибка парсинга Markdown - отправляем без форматирования
                     logger.warning(f"Markdown parse error, sending as plain text: {e}")
                     try:
                         # Очищаем текст от markdown символов
-                        clean_text = text.replace('**', '').replace('`', '').replace('*', '').replace('_', '')
+                        clean_text = text.translate(MARKDOWN_CHARS_TABLE)
                         logger.debug(f"Fallback to plain text: '{clean_text}'")
-                        if hasattr(update_or_query, 'edit_message_text'):
-                            await update_or_query.edit_message_text(clean_text, reply_markup=reply_markup)
-                        elif hasattr(update_or_query, 'message') and update_or_query.message:
-                            await update_or_query.message.reply_text(clean_text, reply_markup=reply_markup)
-                        elif hasattr(update_or_query, 'effective_chat'):
-                            await update_or_query.effective_chat.send_message(clean_text, reply_markup=reply_markup)
-                        else:
-                            logger.error(f"Unknown update_or_query type in fallback: {type(update_or_query)}")
-                            return False
+                        async with self._send_limiter:
+                            await sender(clean_text, reply_markup=reply_markup)
                         logger.debug("send_message fallback success")
                         return True
                     except Exception as fallback_error:
                         logger.error(f"Fallback send failed: {fallback_error}")
-                        if attempt < MAX_RETRIES - 1:
-                            await asyncio.sleep(RETRY_DELAY)
-                            continue
-                        else:
-                            return False
-                else:
-                    # Другие ошибки - повторяем попытку
-                    if attempt < MAX_RETRIES - 1:
-                        await asyncio.sleep(RETRY_DELAY)
-                        continue
-                    else:
-                        logger.error(f"Failed to send message after {MAX_RETRIES} attempts: {e}")
                         return False
-
-            except RetryAfter as e:
-                logger.error(f"RetryAfter in send_message: {e}")
+                return False
+            except NetworkError as e:
+                # Временные сетевые ошибки (включая TimedOut) - повторяем с экспоненциальной задержкой
+                logger.error(f"NetworkError in send_message: {e}")
                 if attempt < MAX_RETRIES - 1:
-                    await asyncio.sleep(e.retry_after)
+                    await asyncio.sleep(backoff_delay(attempt))
                     continue
                 else:
-                    logger.error(f"Max retries exceeded for send_message")
+                    logger.error(f"Failed to send message after {MAX_RETRIES} attempts: {e}")
                     return False
+            except TelegramError as e:
+                # Остальные ошибки Telegram (Forbidden...) повтором не исправить
+                logger.error(f"TelegramError in send_message: {e}")
+                return False
             except Exception as e:
                 logger.error(f"Exception in send_message: {e}")
-                if attempt < MAX_RETRIES - 1:
-                    await asyncio.sleep(RETRY_DELAY)
-                    continue
-                else:
-                    logger.error(f"Failed to send message after {MAX_RETRIES} attempts: {e}")
-                    return False
+                return False
 
     # Decision logic
-    def get_next_decision_number(self) -> int:
+    async def get_next_decision_number(self) -> int:
         """Get next decision number"""
-        result = self.db.query("SELECT MAX(decision_number) FROM polls WHERE decision_number IS NOT NULL")
-        if result and result[0][0]:
-            return result[0][0] + 1
-        return 1
+        return (await self.db.scalar(SQL_LAST_DECISION_NUMBER) or 0) + 1
 
-    def assign_decision_number(self, poll_id: str) -> int:
+    async def assign_decision_number(self, poll_id: str) -> int:
         """Assign decision number to poll"""
-        decision_number = self.get_next_decision_number()
-        self.db.execute("UPDATE polls SET decision_number = ? WHERE poll_id = ?",
-                       (decision_number, poll_id))
-        return decision_number
+        # Номер вычисляется внутри UPDATE: два одновременных закрытия не получат одинаковый номер,
+        # а повторный вызов для уже пронумерованного опроса ничего не меняет и возвращает прежний номер
+        await self.db.execute(SQL_ASSIGN_DECISION_NUMBER, (poll_id,))
+        return await self.db.scalar("SELECT decision_number FROM polls WHERE poll_id = ?", (poll_id,)) or 0
 
     def determine_voting_type(self, options: List[str]) -> str:
         """Determine voting type based on options with improved detection"""
-        try:
-            # Расширенные ключевые слова для лучшего определения
-            positive_keywords = [
-                'за', 'да', 'одобрить', 'согласен', 'поддерживаю', 'принять', 'утвердить',
-                'согласие', 'поддержка', 'одобрение', 'утверждение', 'принятие',
-                'за', 'да', 'согласен', 'поддерживаю', 'принимаю', 'утверждаю',
-                'положительно', 'в пользу', 'за принятие', 'за утверждение',
-                'соглашаюсь', 'одобряю', 'поддерживаю', 'принимаю', 'утверждаю',
-                'да', 'конечно', 'разумеется', 'безусловно', 'несомненно',
-                'за', 'за!', 'за.', 'за,', 'за?', 'за...',
-                'да', 'да!', 'да.', 'да,', 'да?', 'да...',
-                'согласен', 'согласен!', 'согласен.', 'согласен,', 'согласен?',
-                'одобряю', 'одобряю!', 'одобряю.', 'одобряю,', 'одобряю?',
-                'поддерживаю', 'поддерживаю!', 'поддерживаю.', 'поддерживаю,',
-                'принимаю', 'принимаю!', 'принимаю.', 'принимаю,', 'принимаю?',
-                'утверждаю', 'утверждаю!', 'утверждаю.', 'утверждаю,', 'утверждаю?'
-            ]
-            
-            negative_keywords = [
-                'против', 'нет', 'отклонить', 'не согласен', 'отказать',
-                'отклонение', 'отказ', 'несогласие', 'против принятия',
-                'против', 'нет', 'не согласен', 'отклоняю', 'отказываю',
-                'отрицательно', 'против принятия', 'против утверждения',
-                'не согласен', 'не соглашаюсь', 'не одобряю', 'не поддерживаю',
-                'не принимаю', 'не утверждаю', 'отклоняю', 'отказываю',
-                'нет', 'не', 'ни', 'никогда', 'ни за что',
-                'против', 'против!', 'против.', 'против,', 'против?', 'против...',
-                'нет', 'нет!', 'нет.', 'нет,', 'нет?', 'нет...',
-                'не согласен', 'не согласен!', 'не согласен.', 'не согласен,',
-                'не одобряю', 'не одобряю!', 'не одобряю.', 'не одобряю,',
-                'не поддерживаю', 'не поддерживаю!', 'не поддерживаю.', 'не поддерживаю,',
-                'не принимаю', 'не принимаю!', 'не принимаю.', 'не принимаю,',
-                'отклоняю', 'отклоняю!', 'отклоняю.', 'отклоняю,', 'отклоняю?',
-                'отказываю', 'отказываю!', 'отказываю.', 'отказываю,', 'отказываю?'
-            ]
-            
-            abstain_keywords = [
-                'воздержался', 'воздержаться', 'нейтрально', 'не определился',
-                'воздержание', 'нейтральная позиция', 'не определился',
-                'воздержался', 'нейтрально', 'не определился', 'не знаю',
-                'затрудняюсь ответить', 'не могу определиться',
-                'воздержался', 'воздержался!', 'воздержался.', 'воздержался,', 'воздержался?',
-                'воздержаться', 'воздержаться!', 'воздержаться.', 'воздержаться,',
-                'нейтрально', 'нейтрально!', 'нейтрально.', 'нейтрально,', 'нейтрально?',
-                'не определился', 'не определился!', 'не определился.', 'не определился,',
-                'не знаю', 'не знаю!', 'не знаю.', 'не знаю,', 'не знаю?',
-                'затрудняюсь', 'затрудняюсь ответить', 'затрудняюсь!', 'затрудняюсь.',
-                'не могу определиться', 'не могу определиться!', 'не могу определиться.',
-                'не определился', 'не определился!', 'не определился.', 'не определился,',
-                'не определился?', 'не определился...',
-                'не знаю', 'не знаю!', 'не знаю.', 'не знаю,', 'не знаю?', 'не знаю...',
-                'затрудняюсь ответить', 'затрудняюсь ответить!', 'затрудняюсь ответить.',
-                'не могу определиться', 'не могу определиться!', 'не могу определиться.',
-                'нейтральная позиция', 'нейтральная позиция!', 'нейтральная позиция.',
-                'воздержание', 'воздержание!', 'воздержание.', 'воздержание,'
-            ]
+        return self._determine_voting_type_cached(tuple(options))
 
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def _determine_voting_type_cached(options: Tuple[str, ...]) -> str:
+        """Классификация вариантов; результат кэшируется по кортежу вариантов"""
+        try:
             # Нормализуем варианты ответов и убираем дубликаты
             options_lower = []
             seen_options = set()
@@ -1394,66 +1868,13 @@ class PollsBot:
                 logger.warning("No valid options provided for voting type detection")
                 return "choice"
 
-            # Проверяем наличие ключевых слов в каждом варианте
-            positive_matches = []
-            negative_matches = []
-            abstain_matches = []
-            
+            # Каждый вариант попадает в первую подходящую категорию (за, затем против, затем воздержался)
+            matches = ([], [], [])
             for i, option in enumerate(options_lower):
-                # Проверяем точные совпадения и частичные совпадения
-                option_words = option.split()  # Разбиваем на слова
-                
-                # Проверяем каждое слово в варианте
-                for word in option_words:
-                    # Нормализуем слово (убираем знаки препинания)
-                    word_clean = word.strip('.,!?;:()[]{}"\'').lower()
-                    
-                    # Проверяем положительные ключевые слова
-                    for keyword in positive_keywords:
-                        if (keyword == word_clean or 
-                            keyword in word_clean or 
-                            word_clean in keyword or
-                            keyword in option or 
-                            option in keyword):
-                            positive_matches.append(i)
-                            break
-                    if i in positive_matches:
-                        break
-                
-                # Проверяем отрицательные ключевые слова
-                if i not in positive_matches:
-                    for word in option_words:
-                        word_clean = word.strip('.,!?;:()[]{}"\'').lower()
-                        for keyword in negative_keywords:
-                            if (keyword == word_clean or 
-                                keyword in word_clean or 
-                                word_clean in keyword or
-                                keyword in option or 
-                                option in keyword):
-                                negative_matches.append(i)
-                                break
-                        if i in negative_matches:
-                            break
-                
-                # Проверяем нейтральные ключевые слова
-                if i not in positive_matches and i not in negative_matches:
-                    for word in option_words:
-                        word_clean = word.strip('.,!?;:()[]{}"\'').lower()
-                        for keyword in abstain_keywords:
-                            if (keyword == word_clean or 
-                                keyword in word_clean or 
-                                word_clean in keyword or
-                                keyword in option or 
-                                option in keyword):
-                                abstain_matches.append(i)
-                                break
-                        if i in abstain_matches:
-                            break
-
-            # Убираем дубликаты
-            positive_matches = list(set(positive_matches))
-            negative_matches = list(set(negative_matches))
-            abstain_matches = list(set(abstain_matches))
+                category = PollsBot._classify_option(option)
+                if category is not None:
+                    matches[category].append(i)
+            positive_matches, negative_matches, abstain_matches = matches
 
             has_positive = len(positive_matches) > 0
             has_negative = len(negative_matches) > 0
@@ -1497,10 +1918,52 @@ class PollsBot:
             logger.error(f"Error in determine_voting_type: {e}")
             return "choice"  # По умолчанию обычный выбор
 
-    def check_decision_status(self, poll_id: str) -> Dict:
+    @staticmethod
+    def _classify_option(option: str) -> Optional[int]:
+        """Index of the first keyword category (за, против, воздержался) matching a normalized option, or None"""
+        # Слова без знаков препинания по краям
+        words_clean = [word.strip('.,!?;:()[]{}"\'') for word in option.split()]
+        for category, (keywords_re, keywords_joined) in enumerate(VOTING_KEYWORD_MATCHERS):
+            # Ключевое слово входит в вариант, либо вариант или одно из его слов входит в ключевое слово
+            if (keywords_re.search(option)
+                    or ('\n' not in option and option in keywords_joined)
+                    or any(word in keywords_joined for word in words_clean)):
+                return category
+        return None
+
+    async def get_poll_snapshot(self, poll_id: str) -> Optional[Tuple[tuple, Dict[int, List[str]], Dict[int, int], int]]:
+        """Poll row, voters and vote counts per option and total votes for rendering, cached until the poll changes"""
+        snapshot = self._poll_cache.get(poll_id)
+        if snapshot is not None:
+            return snapshot
+        generation = self._poll_cache_generation
+        poll_data = await self.db.query(SQL_POLL_RENDER_ROW, (poll_id,))
+        if not poll_data:
+            return None
+        votes_data = await self.db.query(SQL_POLL_RENDER_VOTES, (poll_id,))
+        # Голоса группируются один раз на версию опроса, а не при каждой отрисовке
+        votes_by_option = defaultdict(list)
+        for option_id, username in votes_data:
+            votes_by_option[option_id].append(username)
+        vote_counts = {option_id: len(voters) for option_id, voters in votes_by_option.items()}
+        snapshot = (tuple(poll_data[0]), dict(votes_by_option), vote_counts, len(votes_data))
+        # Не кэшируем, если во время чтения опрос успели изменить
+        if generation == self._poll_cache_generation:
+            self._poll_cache.set(poll_id, snapshot)
+        return snapshot
+
+    def invalidate_poll_cache(self, poll_id: Optional[str] = None):
+        """Drop cached snapshot of one poll, or of all polls when poll_id is None"""
+        self._poll_cache_generation += 1
+        if poll_id is None:
+            self._poll_cache.clear()
+        else:
+            self._poll_cache.pop(poll_id)
+
+    async def check_decision_status(self, poll_id: str) -> Dict:
         """Check decision status based on threshold and voting type"""
         try:
-            poll_data = self.db.query("""
+            poll_data = await self.db.query("""
                 SELECT threshold, total_voters, options, voting_type, status, max_participants FROM polls WHERE poll_id = ?
             """, (poll_id,))
 
@@ -1514,28 +1977,38 @@ class PollsBot:
                 return {"status": "pending", "percentage": 0, "threshold": threshold}
 
             # Get vote counts for each option
-            votes_data = self.db.query("""
+            votes_data = await self.db.query("""
                 SELECT option_id, COUNT(*) as vote_count
                 FROM poll_votes WHERE poll_id = ?
                 GROUP BY option_id ORDER BY vote_count DESC
             """, (poll_id,))
 
-            if not votes_data:
-                return {"status": "pending", "percentage": 0, "threshold": threshold}
-
             # Use saved voting type or determine automatically
             voting_type = saved_voting_type if saved_voting_type else self.determine_voting_type(options)
+            return self._compute_decision_status(threshold, total_voters, options, voting_type,
+                                                 poll_status, max_participants, dict(votes_data))
+
+        except Exception as e:
+            logger.error(f"Error checking decision status: {e}")
+            return {"status": "error", "percentage": 0, "threshold": 50}
+
+    @staticmethod
+    def _compute_decision_status(threshold: int, total_voters: int, options: List[str], voting_type: str,
+                                 poll_status: str, max_participants: int, vote_counts: Dict[int, int]) -> Dict:
+        """Decision status from already fetched poll fields and {option_id: votes}, без запросов к БД"""
+        try:
+            if not total_voters or not vote_counts:
+                return {"status": "pending", "percentage": 0, "threshold": threshold}
 
-            # Find the option with the most votes
-            max_votes = votes_data[0][1]
-            max_option_id = votes_data[0][0]
+            # Find the option with the most votes; ties go to the option with the highest number
+            # (явное правило: прежний ORDER BY vote_count DESC порядок при равенстве не определял)
+            max_option_id, max_votes = max(vote_counts.items(), key=lambda item: (item[1], item[0]))
             max_option_text = options[max_option_id]
 
             # Calculate percentage based on voting type
             if voting_type == "approval":
                 # For approval voting (за/против/воздержался), only "за" votes count for approval
-                positive_keywords = ['за', 'да', 'одобрить', 'согласен', 'поддерживаю', 'принять', 'утвердить']
-                is_positive_option = any(keyword in max_option_text.lower() for keyword in positive_keywords)
+                is_positive_option = DECISION_POSITIVE_RE.search(max_option_text.lower()) is not None
 
                 if is_positive_option:
                     base_count = max_participants if max_participants and max_participants > 0 else total_voters
@@ -1559,8 +2032,7 @@ class PollsBot:
 
             elif voting_type == "binary":
                 # For binary voting (за/против), check if positive option wins
-                positive_keywords = ['за', 'да', 'одобрить', 'согласен', 'поддерживаю', 'принять', 'утвердить']
-                is_positive_option = any(keyword in max_option_text.lower() for keyword in positive_keywords)
+                is_positive_option = DECISION_POSITIVE_RE.search(max_option_text.lower()) is not None
 
                 base_count = max_participants if max_participants and max_participants > 0 else total_voters
                 percentage = (max_votes / base_count) * 100
@@ -1602,14 +2074,14 @@ class PollsBot:
             logger.error(f"Error checking decision status: {e}")
             return {"status": "error", "percentage": 0, "threshold": 50}
 
-    def format_poll_message(self, poll_id: str, show_results: bool = True, for_user_id: int = 0) -> Tuple[str, InlineKeyboardMarkup]:
+    async def format_poll_message(self, poll_id: str, show_results: bool = True, for_user_id: int = 0) -> Tuple[str, InlineKeyboardMarkup]:
         """Format poll message with results (Vote-style)"""
         try:
             logger.info(f"format_poll_message called for poll_id: {poll_id}, for_user_id: {for_user_id}")
 
             # Получаем индивидуальные настройки пользователя (если for_user_id > 0)
             if for_user_id:
-                user_settings = self.get_user_settings(for_user_id)
+                user_settings = await self.get_user_settings(for_user_id)
                 logger.debug(f"Formatting poll {poll_id} for user {for_user_id} with settings: {user_settings}")
             else:
                 user_settings = {}
@@ -1617,69 +2089,48 @@ class PollsBot:
             def get_opt(opt):
                 return user_settings.get(opt, self.config.get(opt, True))
 
-            # Get poll data
-            logger.info("Querying poll data from database...")
-            poll_data = self.db.query("""
-                SELECT question, options, threshold, non_anonymous, decision_number,
-                       created_date, template_used, creator_id, decision_status, status, max_participants
-                FROM polls WHERE poll_id = ?
-            """, (poll_id,))
+            # Get poll data and votes (cached between changes of the poll)
+            logger.info("Loading poll snapshot...")
+            snapshot = await self.get_poll_snapshot(poll_id)
 
             # Проверяем, что данные опроса найдены
-            if not poll_data:
+            if not snapshot:
                 logger.error(f"Poll {poll_id} not found in database")
                 return "❌ Голосование не найдено", InlineKeyboardMarkup([[]])
 
-            logger.info(f"Poll data found: {len(poll_data)} rows")
-            poll_data = poll_data[0]  # Берем первую (и единственную) запись
+            poll_data, votes_by_option, vote_counts, total_votes = snapshot
 
             question, options_str, threshold, non_anonymous, decision_number, \
-            created_date, template_used, creator_id, decision_status, status, max_participants = poll_data
+            created_date, template_used, creator_id, decision_status, voting_type, status, max_participants = poll_data
 
             logger.info(f"Question: {question[:50]}..., Options: {options_str[:50]}..., Status: {status}")
 
             options = options_str.split('|')
             logger.info(f"Split options: {options}")
+            # Нижний регистр, подписи и эмодзи вариантов считаем один раз на отрисовку
+            options_lower = [option.lower() for option in options]
+            labels = [option.replace('**', '') for option in options]
+            emojis = [self._option_emoji(option_lower, i) for i, option_lower in enumerate(options_lower)]
 
-            # Get votes data
-            logger.info("Querying votes data...")
-            votes_data = self.db.query("""
-                SELECT option_id, username FROM poll_votes
-                WHERE poll_id = ? ORDER BY vote_date
-            """, (poll_id,))
-
-            logger.info(f"Votes data: {len(votes_data)} votes")
-
-            # Group votes by option
-            votes_by_option = defaultdict(list)
-            for option_id, username in votes_data:
-                votes_by_option[option_id].append(username)
-
-            total_votes = len(votes_data)
             logger.info(f"Total votes: {total_votes}")
 
             # Build message - убираем "📊 Вопрос: " из начала
-            text = f"**{question}**\n\n"
+            parts = [f"**{question}**\n\n"]
 
-            max_votes = 0
-            for option_votes in votes_by_option.values():
-                if len(option_votes) > max_votes:
-                    max_votes = len(option_votes)
+            max_votes = max(vote_counts.values(), default=0)
 
             # Объединенная статистика и порог в одну строку
             if status != 'closed':
-                # Определяем тип голосования и находим голоса "за"
-                voting_type = self.determine_voting_type(options)
+                # Тип голосования берём из БД, определяем заново только для старых записей без него
+                voting_type = voting_type or self.determine_voting_type(options)
                 
                 if voting_type in ["approval", "binary"]:
                     # Для approval/binary подсчитываем только голоса "за"
-                    positive_keywords = ['за', 'да', 'одобрить', 'согласен', 'поддерживаю', 'принять', 'утвердить']
                     positive_votes = 0
                     
-                    for i, option in enumerate(options):
-                        if any(keyword in option.lower() for keyword in positive_keywords):
-                            option_voters = votes_by_option.get(i, [])
-                            positive_votes = len(option_voters)
+                    for i, option_lower in enumerate(options_lower):
+                        if DECISION_POSITIVE_RE.search(option_lower):
+                            positive_votes = vote_counts.get(i, 0)
                             break
                     
                     current_votes = positive_votes
@@ -1690,11 +2141,11 @@ class PollsBot:
                 if max_participants and max_participants > 0:
                     needed_votes = max(1, int((threshold * max_participants) / 100))
                     percent = int((total_votes / max_participants) * 100)
-                    text += f" {threshold}% порог ({needed_votes}/{max_participants}) | 👥 {total_votes} голосов ({percent}%) | ✅ {current_votes}/{needed_votes}\n\n"
+                    parts.append(f" {threshold}% порог ({needed_votes}/{max_participants}) | 👥 {total_votes} голосов ({percent}%) | ✅ {current_votes}/{needed_votes}\n\n")
                 else:
                     # Исправляем формулу для случая без max_participants - убираем +1
                     needed_votes = max(1, int((threshold * total_votes) / 100))
-                    text += f" {threshold}% порог | 👥 {total_votes} голосов | ✅ {current_votes}/{needed_votes}\n\n"
+                    parts.append(f" {threshold}% порог | 👥 {total_votes} голосов | ✅ {current_votes}/{needed_votes}\n\n")
 
             # Build keyboard and results
             keyboard = []
@@ -1703,28 +2154,18 @@ class PollsBot:
             # Проверяем, является ли голосование закрытым
             is_closed = status == 'closed'
 
-            if show_results and votes_data:
-                text += "🗳️ **Результаты голосования:**\n\n"
+            if show_results and total_votes:
+                parts.append("🗳️ **Результаты голосования:**\n\n")
 
-                for i, option in enumerate(options):
+                for i, (emoji, label) in enumerate(zip(emojis, labels)):
                     voters = votes_by_option.get(i, [])
                     count = len(voters)
                     percentage = (count / total_votes * 100) if total_votes > 0 else 0
 
-                    # Emoji for option
-                    if "да" in option.lower() or "за" in option.lower():
-                        emoji = "✅"
-                    elif "нет" in option.lower() or "против" in option.lower():
-                        emoji = "❌"
-                    elif "воздерж" in option.lower():
-                        emoji = "🟡"
-                    else:
-                        emoji = f"{i+1}️⃣"
-
-                    text += f"**{emoji} {option.replace('**', '')}** - {count} голос"
+                    parts.append(f"**{emoji} {label}** - {count} голос")
                     if count != 1:
-                        text += "ов"
-                    text += f" ({percentage:.0f}%)\n"
+                        parts.append("ов")
+                    parts.append(f" ({percentage:.0f}%)\n")
 
                     # Show voter names if enabled
                     if get_opt('show_voter_names') and voters:
@@ -1737,17 +2178,17 @@ class PollsBot:
                         if len(voters) > max_display:
                             voters_text += f" и еще {len(voters) - max_display}"
 
-                        text += f"    👥 {voters_text}\n"
+                        parts.append(f"    👥 {voters_text}\n")
                     elif voters:
-                        text += f"    👥 {count} человек\n"
+                        parts.append(f"    👥 {count} человек\n")
                     else:
-                        text += f"    👥 —\n"
+                        parts.append(f"    👥 —\n")
 
-                    text += "\n"
+                    parts.append("\n")
 
                     # Add vote button only if poll is not closed
                     if not is_closed:
-                        button_text = f"{emoji} {option.replace('**', '')}"
+                        button_text = f"{emoji} {label}"
                         if count > 0:
                             button_text += f" ({count})"
 
@@ -1758,17 +2199,9 @@ class PollsBot:
             else:
                 # No results yet, just show voting buttons (only if poll is not closed)
                 if not is_closed:
-                    for i, option in enumerate(options):
-                        emoji = f"{i+1}️⃣"
-                        if "да" in option.lower() or "за" in option.lower():
-                            emoji = "✅"
-                        elif "нет" in option.lower() or "против" in option.lower():
-                            emoji = "❌"
-                        elif "воздерж" in option.lower():
-                            emoji = "🟡"
-
+                    for i, (emoji, label) in enumerate(zip(emojis, labels)):
                         keyboard.append([InlineKeyboardButton(
-                            f"{emoji} {option.replace('**', '')}",
+                            f"{emoji} {label}",
                             callback_data=f"vote:{poll_id}:{i}"
                         )])
 
@@ -1777,7 +2210,10 @@ class PollsBot:
             # Check and show decision status
             if show_results and total_votes > 0:
                 logger.info("Checking decision status...")
-                decision_info = self.check_decision_status(poll_id)
+                # Статус решения считаем по уже загруженным голосам, без повторных запросов
+                decision_info = self._compute_decision_status(
+                    threshold, total_votes, options, voting_type or self.determine_voting_type(options),
+                    status, max_participants, vote_counts)
                 logger.info(f"Decision info: {decision_info}")
 
                 if get_opt('show_decision_status'):
@@ -1794,13 +2230,14 @@ class PollsBot:
                         else:
                             status_text += f" принято**"
 
-                        text += f"\n{status_text}\n\n"
+                        parts.append(f"\n{status_text}\n\n")
 
                         # Assign decision number if not assigned
                         if not decision_number:
-                            self.assign_decision_number(poll_id)
-                            self.db.execute("UPDATE polls SET decision_status = ? WHERE poll_id = ?",
+                            await self.assign_decision_number(poll_id)
+                            await self.db.execute("UPDATE polls SET decision_status = ? WHERE poll_id = ?",
                                           ('accepted', poll_id))
+                            self.invalidate_poll_cache(poll_id)
 
                     elif decision_info['status'] == 'rejected' and (total_votes >= 3 or status == 'closed'):
                         status_text = "❌ **Решение"
@@ -1815,21 +2252,22 @@ class PollsBot:
                         else:
                             status_text += f" не принято**"
 
-                        text += f"\n{status_text}\n\n"
+                        parts.append(f"\n{status_text}\n\n")
 
                         # Assign decision number if not assigned
                         if not decision_number:
-                            self.assign_decision_number(poll_id)
-                            self.db.execute("UPDATE polls SET decision_status = ? WHERE poll_id = ?",
+                            await self.assign_decision_number(poll_id)
+                            await self.db.execute("UPDATE polls SET decision_status = ? WHERE poll_id = ?",
                                           ('rejected', poll_id))
+                            self.invalidate_poll_cache(poll_id)
 
 
                     else:
-                        text += f"\n⏳ **Голосование продолжается**\n"
+                        parts.append(f"\n⏳ **Голосование продолжается**\n")
 
                     # Add closed status indicator after decision status
                     if status == 'closed':
-                        text += "🔒 **Голосование закрыто**\n"
+                        parts.append("🔒 **Голосование закрыто**\n")
 
             # Show additional info if enabled
             info_parts = []
@@ -1850,10 +2288,10 @@ class PollsBot:
                 info_parts.append(f"👤 Автор: {creator_id}")
 
             if info_parts:
-                text += f"\n{' • '.join(info_parts)}\n"
+                parts.append(f"\n{' • '.join(info_parts)}\n")
 
             # Add share button - только для создателя и админов
-            if for_user_id == creator_id or self.get_permissions(for_user_id) == "admin":
+            if for_user_id == creator_id or await self.get_permissions(for_user_id) == "admin":
                 keyboard.append([InlineKeyboardButton(
                     "🌎 Поделиться голосованием",
                     switch_inline_query=f"share_{poll_id}"
@@ -1871,6 +2309,7 @@ class PollsBot:
                         InlineKeyboardButton("🗑️ Удалить", callback_data=f"delete_poll:{poll_id}")
                     ])
 
+            text = "".join(parts)
             logger.info(f"format_poll_message completed successfully. Text length: {len(text)}, Keyboard rows: {len(keyboard)}")
             return text, InlineKeyboardMarkup(keyboard)
 
@@ -1879,14 +2318,14 @@ class PollsBot:
             logger.debug(f"Error in format_poll_message for poll {poll_id}: {e}")
             return "❌ Ошибка отображения опроса", InlineKeyboardMarkup([[]])
 
-    def format_poll_message_public(self, poll_id: str, show_results: bool = True, for_user_id: int = 0) -> Tuple[str, InlineKeyboardMarkup]:
+    async def format_poll_message_public(self, poll_id: str, show_results: bool = True, for_user_id: int = 0) -> Tuple[str, InlineKeyboardMarkup]:
         """Format poll message for public sharing (without admin controls)"""
         try:
             logger.info(f"format_poll_message_public called for poll_id: {poll_id}, for_user_id: {for_user_id}")
 
             # Получаем индивидуальные настройки пользователя (если for_user_id > 0)
             if for_user_id:
-                user_settings = self.get_user_settings(for_user_id)
+                user_settings = await self.get_user_settings(for_user_id)
                 logger.debug(f"Formatting public poll {poll_id} for user {for_user_id} with settings: {user_settings}")
             else:
                 user_settings = {}
@@ -1895,65 +2334,47 @@ class PollsBot:
             def get_opt(opt):
                 return user_settings.get(opt, self.config.get(opt, True))
 
-            # Get poll data
-            logger.info("Querying poll data from database...")
-            poll_data = self.db.query("""
-                SELECT question, options, threshold, non_anonymous, decision_number,
-                       created_date, template_used, creator_id, decision_status, voting_type, status, max_participants
-                FROM polls WHERE poll_id = ?
-            """, (poll_id,))
+            # Get poll data and votes (cached between changes of the poll)
+            logger.info("Loading poll snapshot...")
+            snapshot = await self.get_poll_snapshot(poll_id)
 
-            if not poll_data:
+            if not snapshot:
                 logger.error(f"Poll {poll_id} not found")
                 return "❌ Голосование не найдено", InlineKeyboardMarkup([[]])
 
+            poll_data, votes_by_option, vote_counts, total_votes = snapshot
+
             question, options_str, threshold, non_anonymous, decision_number, \
-            created_date, template_used, creator_id, decision_status, voting_type, status, max_participants = poll_data[0]
+            created_date, template_used, creator_id, decision_status, voting_type, status, max_participants = poll_data
 
             logger.info(f"Question: {question[:50]}..., Options: {options_str[:50]}..., Status: {status}")
 
             options = options_str.split('|')
             logger.info(f"Split options: {options}")
+            # Нижний регистр, подписи и эмодзи вариантов считаем один раз на отрисовку
+            options_lower = [option.lower() for option in options]
+            labels = [option.replace('**', '') for option in options]
+            emojis = [self._option_emoji(option_lower, i) for i, option_lower in enumerate(options_lower)]
 
-            # Get votes data
-            logger.info("Querying votes data...")
-            votes_data = self.db.query("""
-                SELECT option_id, username FROM poll_votes
-                WHERE poll_id = ? ORDER BY vote_date
-            """, (poll_id,))
-
-            logger.info(f"Votes data: {len(votes_data)} votes")
-
-            # Group votes by option
-            votes_by_option = defaultdict(list)
-            for option_id, username in votes_data:
-                votes_by_option[option_id].append(username)
-
-            total_votes = len(votes_data)
             logger.info(f"Total votes: {total_votes}")
 
             # Build message - убираем "📊 Вопрос: " из начала
-            text = f"**{question}**\n\n"
+            parts = [f"**{question}**\n\n"]
 
-            max_votes = 0
-            for option_votes in votes_by_option.values():
-                if len(option_votes) > max_votes:
-                    max_votes = len(option_votes)
+            max_votes = max(vote_counts.values(), default=0)
 
             # Объединенная статистика и порог в одну строку
             if status != 'closed':
-                # Определяем тип голосования и находим голоса "за"
-                voting_type = self.determine_voting_type(options)
+                # Тип голосования берём из БД, определяем заново только для старых записей без него
+                voting_type = voting_type or self.determine_voting_type(options)
                 
                 if voting_type in ["approval", "binary"]:
                     # Для approval/binary подсчитываем только голоса "за"
-                    positive_keywords = ['за', 'да', 'одобрить', 'согласен', 'поддерживаю', 'принять', 'утвердить']
                     positive_votes = 0
                     
-                    for i, option in enumerate(options):
-                        if any(keyword in option.lower() for keyword in positive_keywords):
-                            option_voters = votes_by_option.get(i, [])
-                            positive_votes = len(option_voters)
+                    for i, option_lower in enumerate(options_lower):
+                        if DECISION_POSITIVE_RE.search(option_lower):
+                            positive_votes = vote_counts.get(i, 0)
                             break
                     
                     current_votes = positive_votes
@@ -1964,11 +2385,11 @@ class PollsBot:
                 if max_participants and max_participants > 0:
                     needed_votes = max(1, int((threshold * max_participants) / 100))
                     percent = int((total_votes / max_participants) * 100)
-                    text += f" {threshold}% порог ({needed_votes}/{max_participants}) | 👥 {total_votes} голосов ({percent}%) | ✅ {current_votes}/{needed_votes}\n\n"
+                    parts.append(f" {threshold}% порог ({needed_votes}/{max_participants}) | 👥 {total_votes} голосов ({percent}%) | ✅ {current_votes}/{needed_votes}\n\n")
                 else:
                     # Исправляем формулу для случая без max_participants - убираем +1
                     needed_votes = max(1, int((threshold * total_votes) / 100))
-                    text += f" {threshold}% порог | 👥 {total_votes} голосов | ✅ {current_votes}/{needed_votes}\n\n"
+                    parts.append(f" {threshold}% порог | 👥 {total_votes} голосов | ✅ {current_votes}/{needed_votes}\n\n")
 
             # Build keyboard and results
             keyboard = []
@@ -1977,28 +2398,18 @@ class PollsBot:
             # Проверяем, является ли голосование закрытым
             is_closed = status == 'closed'
 
-            if show_results and votes_data:
-                text += "🗳️ **Результаты голосования:**\n\n"
+            if show_results and total_votes:
+                parts.append("🗳️ **Результаты голосования:**\n\n")
 
-                for i, option in enumerate(options):
+                for i, (emoji, label) in enumerate(zip(emojis, labels)):
                     voters = votes_by_option.get(i, [])
                     count = len(voters)
                     percentage = (count / total_votes * 100) if total_votes > 0 else 0
 
-                    # Emoji for option
-                    if "да" in option.lower() or "за" in option.lower():
-                        emoji = "✅"
-                    elif "нет" in option.lower() or "против" in option.lower():
-                        emoji = "❌"
-                    elif "воздерж" in option.lower():
-                        emoji = "🟡"
-                    else:
-                        emoji = f"{i+1}️⃣"
-
-                    text += f"**{emoji} {option.replace('**', '')}** - {count} голос"
+                    parts.append(f"**{emoji} {label}** - {count} голос")
                     if count != 1:
-                        text += "ов"
-                    text += f" ({percentage:.0f}%)\n"
+                        parts.append("ов")
+                    parts.append(f" ({percentage:.0f}%)\n")
 
                     # Show voter names if enabled
                     if get_opt('show_voter_names') and voters:
@@ -2011,17 +2422,17 @@ class PollsBot:
                         if len(voters) > max_display:
                             voters_text += f" и еще {len(voters) - max_display}"
 
-                        text += f"    👥 {voters_text}\n"
+                        parts.append(f"    👥 {voters_text}\n")
                     elif voters:
-                        text += f"    👥 {count} человек\n"
+                        parts.append(f"    👥 {count} человек\n")
                     else:
-                        text += f"    👥 —\n"
+                        parts.append(f"    👥 —\n")
 
-                    text += "\n"
+                    parts.append("\n")
 
                     # Add vote button only if poll is not closed
                     if not is_closed:
-                        button_text = f"{emoji} {option.replace('**', '')}"
+                        button_text = f"{emoji} {label}"
                         if count > 0:
                             button_text += f" ({count})"
 
@@ -2032,17 +2443,9 @@ class PollsBot:
             else:
                 # No results yet, just show voting buttons (only if poll is not closed)
                 if not is_closed:
-                    for i, option in enumerate(options):
-                        emoji = f"{i+1}️⃣"
-                        if "да" in option.lower() or "за" in option.lower():
-                            emoji = "✅"
-                        elif "нет" in option.lower() or "против" in option.lower():
-                            emoji = "❌"
-                        elif "воздерж" in option.lower():
-                            emoji = "🟡"
-
+                    for i, (emoji, label) in enumerate(zip(emojis, labels)):
                         keyboard.append([InlineKeyboardButton(
-                            f"{emoji} {option.replace('**', '')}",
+                            f"{emoji} {label}",
                             callback_data=f"vote:{poll_id}:{i}"
                         )])
 
@@ -2051,7 +2454,10 @@ class PollsBot:
             # Check and show decision status
             if show_results and total_votes > 0:
                 logger.info("Checking decision status...")
-                decision_info = self.check_decision_status(poll_id)
+                # Статус решения считаем по уже загруженным голосам, без повторных запросов
+                decision_info = self._compute_decision_status(
+                    threshold, total_votes, options, voting_type or self.determine_voting_type(options),
+                    status, max_participants, vote_counts)
                 logger.info(f"Decision info: {decision_info}")
 
                 if get_opt('show_decision_status'):
@@ -2068,7 +2474,7 @@ class PollsBot:
                         else:
                             status_text += f" принято**"
 
-                        text += f"\n{status_text}\n\n"
+                        parts.append(f"\n{status_text}\n\n")
 
                     elif decision_info['status'] == 'rejected' and (total_votes >= 3 or status == 'closed'):
                         status_text = "❌ **Решение"
@@ -2083,13 +2489,13 @@ class PollsBot:
                         else:
                             status_text += f" не принято**"
 
-                        text += f"\n{status_text}\n\n"
+                        parts.append(f"\n{status_text}\n\n")
                     else:
-                        text += f"\n⏳ **Голосование продолжается**\n"
+                        parts.append(f"\n⏳ **Голосование продолжается**\n")
 
                     # Add closed status indicator after decision status
                     if status == 'closed':
-                        text += "🔒 **Голосование закрыто**\n"
+                        parts.append("🔒 **Голосование закрыто**\n")
 
             # Show additional info if enabled
             info_parts = []
@@ -2110,9 +2516,10 @@ class PollsBot:
                 info_parts.append(f"👤 Автор: {creator_id}")
 
             if info_parts:
-                text += f"\n{' • '.join(info_parts)}\n"
+                parts.append(f"\n{' • '.join(info_parts)}\n")
 
             # НЕ добавляем админские кнопки в публичную версию
+            text = "".join(parts)
             logger.info(f"format_poll_message_public completed successfully. Text length: {len(text)}, Keyboard rows: {len(keyboard)}")
             return text, InlineKeyboardMarkup(keyboard)
 
@@ -2122,48 +2529,160 @@ class PollsBot:
             return "❌ Ошибка отображения опроса", InlineKeyboardMarkup([[]])
 
     # Enhanced user state management (database-backed)
-    def get_user_state(self, user_id: int) -> Dict:
-        """Get user state from database"""
+    async def get_user_state(self, user_id: int) -> Dict:
+        """Get user state (in-process LRU, lazily loaded from database)"""
         try:
-            result = self.db.query("SELECT state, data FROM user_states WHERE user_id = ?", (user_id,))
-            if result:
-                state_data = json.loads(result[0][1]) if result[0][1] else {}
-                return {"state": result[0][0], "data": state_data}
-            return {"state": UserState.IDLE, "data": {}}
-        except (Exception, json.JSONDecodeError) as e:
+            # Очередь и пакет, который сейчас пишется, новее БД, даже если запись уже вытеснена из LRU
+            cached = (self._pending_states.get(user_id) or self._flushing_states.get(user_id)
+                      or self._state_cache.get(user_id))
+            if cached is None:
+                result = await self.db.query(SQL_GET_USER_STATE, (user_id,))
+                cached = (result[0][0], result[0][1]) if result else (UserState.IDLE, None)
+                self._state_cache.set(user_id, cached)
+            state, raw_data = cached
+            state_data = json_loads(raw_data) if raw_data else {}
+            return {"state": state, "data": state_data}
+        except Exception as e:
             logger.error(f"Get user state error: {e}")
             return {"state": UserState.IDLE, "data": {}}
 
-    def set_user_state(self, user_id: int, state: str, data: Optional[Dict] = None):
-        """Set user state in database"""
+    async def set_user_state(self, user_id: int, state: str, data: Optional[Dict] = None):
+        """Set user state (write-behind: coalesced per user and flushed to database in batches)"""
         try:
             if data is None:
                 data = {}
 
-            self.db.execute("""
-                INSERT OR REPLACE INTO user_states (user_id, state, data, updated_date)
-                VALUES (?, ?, ?, ?)
-            """, (user_id, state, json.dumps(data), datetime.now().isoformat()))
+            raw_data = json_dumps(data)
+            self._state_cache.set(user_id, (state, raw_data))
+            self._pending_states[user_id] = (state, raw_data)
+            if self._state_flush_task is None or self._state_flush_task.done():
+                self._state_flush_task = asyncio.create_task(self._flush_user_states())
 
         except Exception as e:
             logger.error(f"Set user state error: {e}")
 
-    def clear_user_state(self, user_id: int):
+    async def _flush_user_states(self, delay: float = STATE_FLUSH_DELAY):
+        """Write pending user states to database, one transaction per batch"""
+        if delay:
+            await asyncio.sleep(delay)
+        failures = 0
+        while self._pending_states:
+            self._flushing_states, self._pending_states = self._pending_states, {}
+            rows = [(user_id, state, raw_data) for user_id, (state, raw_data) in self._flushing_states.items()]
+            written = await self.db.execute_many(SQL_SET_USER_STATE, rows)
+            failed, self._flushing_states = self._flushing_states, {}
+            if written:
+                failures = 0
+                continue
+            # Неудачный пакет возвращается в очередь; состояния, поставленные за это время, новее и важнее
+            for user_id, entry in failed.items():
+                self._pending_states.setdefault(user_id, entry)
+            if failures >= MAX_RETRIES:
+                logger.error(f"Failed to write user states of {len(self._pending_states)} users after {failures + 1} attempts, "
+                             f"keeping them queued for the next flush")
+                return
+            logger.warning(f"Failed to write {len(rows)} user states, retrying (attempt {failures + 1}/{MAX_RETRIES})")
+            await asyncio.sleep(backoff_delay(failures))
+            failures += 1
+
+    async def record_vote(self, poll_id: str, user_id: int, username: str, option_id: int) -> bool:
+        """Queue vote for the next group commit and wait until it is written (last vote per user wins)"""
+        self._pending_votes[(poll_id, user_id)] = (poll_id, user_id, username, option_id)
+        if self._vote_flush_task is None:
+            self._vote_flush_task = asyncio.create_task(self._flush_votes())
+        return await asyncio.shield(self._vote_flush_task)
+
+    async def _flush_votes(self, delay: float = VOTE_FLUSH_DELAY) -> bool:
+        """Write queued votes and refresh total_voters of affected polls in one transaction"""
+        if delay:
+            await asyncio.sleep(delay)
+        # Votes queued from here on start the next batch
+        pending, self._pending_votes = self._pending_votes, {}
+        self._vote_flush_task = None
+        if not pending:
+            return True
+        poll_ids = {poll_id for poll_id, _ in pending}
+        statements = [(SQL_RECORD_VOTE, row) for row in pending.values()]
+        statements.extend((SQL_UPDATE_TOTAL_VOTERS, (poll_id, poll_id)) for poll_id in poll_ids)
+        try:
+            return await self.db.execute_batch(statements)
+        finally:
+            for poll_id in poll_ids:
+                self.invalidate_poll_cache(poll_id)
+
+    @staticmethod
+    def _poll_edit_key(query):
+        return query.inline_message_id or (query.message.chat_id, query.message.message_id)
+
+    def schedule_poll_edit(self, query, text: str, keyboard: InlineKeyboardMarkup):
+        """Queue poll message redraw; only the latest text within POLL_EDIT_DEBOUNCE is sent to Telegram"""
+        key = self._poll_edit_key(query)
+        self._pending_edits[key] = (query, text, keyboard)
+        if key not in self._edit_flush_tasks:
+            self._edit_flush_tasks[key] = asyncio.create_task(self._flush_poll_edit(key))
+
+    def cancel_poll_edit(self, query):
+        """Drop queued redraw of this message before editing it directly, so an older render can't overwrite the edit"""
+        key = self._poll_edit_key(query)
+        self._pending_edits.pop(key, None)
+        task = self._edit_flush_tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    async def _flush_poll_edit(self, key, delay: float = POLL_EDIT_DEBOUNCE):
+        """Send the latest queued redraw of one poll message"""
+        await asyncio.sleep(delay)
+        # Redraws queued from here on start the next window
+        self._edit_flush_tasks.pop(key, None)
+        query, text, keyboard = self._pending_edits.pop(key)
+        try:
+            async with self._send_limiter:
+                await query.edit_message_text(text=text, parse_mode=ParseMode.MARKDOWN, reply_markup=keyboard)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.error(f"Failed to update poll message: {e}")
+        except Exception as e:
+            logger.error(f"Failed to update poll message: {e}")
+
+    async def clear_user_state(self, user_id: int):
         """Clear user state"""
-        self.set_user_state(user_id, UserState.IDLE, {})
+        await self.set_user_state(user_id, UserState.IDLE, {})
 
     # User management
-    def get_permissions(self, user_id: int) -> str:
+    async def get_permissions(self, user_id: int) -> str:
         """Get user permissions with safe result handling"""
         try:
-            result = self.db.query("SELECT permissions FROM users WHERE user_id = ?", (user_id,))
-            if result and len(result) > 0 and len(result[0]) > 0:
-                return result[0][0]
-            return "none"
+            cached = self._permissions_cache.get(user_id)
+            if cached is not None:
+                return cached
+            permissions = await self.db.scalar(SQL_GET_PERMISSIONS, (user_id,), default="none")
+            self._permissions_cache.set(user_id, permissions)
+            return permissions
         except Exception as e:
             logger.error(f"Error getting permissions for user {user_id}: {e}")
             return "none"
 
+    async def delete_user_data(self, user_id: int) -> bool:
+        """Delete user with votes, state and template sessions in one transaction"""
+        success = await self.db.execute_batch([
+            ("DELETE FROM users WHERE user_id = ?", (user_id,)),
+            ("DELETE FROM poll_votes WHERE user_id = ?", (user_id,)),
+            ("DELETE FROM user_states WHERE user_id = ?", (user_id,)),
+            ("DELETE FROM template_sessions WHERE user_id = ?", (user_id,)),
+        ])
+        self.invalidate_user_cache(user_id)
+        self.invalidate_poll_cache()
+        return success
+
+    def invalidate_user_cache(self, user_id: int):
+        """Drop cached permissions and state after direct writes to users/user_states"""
+        self._permissions_cache.pop(user_id)
+        self._state_cache.pop(user_id)
+        # Queued write-behind state must not override (or re-create) what was written directly
+        self._pending_states.pop(user_id, None)
+        self._flushing_states.pop(user_id, None)
+        self._known_users.pop(user_id)
+
     async def is_user_in_chat(self, user_id: int, chat_id: int, context) -> bool:
         """Check if user is a member of the chat"""
         try:
@@ -2174,69 +2693,85 @@ class PollsBot:
             # If we can't check membership, allow access for safety
             return True
 
-    def add_user(self, user_id: int, username: str, permissions: str = "use"):
+    async def add_user(self, user_id: int, username: str, permissions: str = "use"):
         """Add or update user with validation. Не понижать права, если уже выше."""
         try:
             username = self.sanitize(username, 50)
+            # Пользователь уже записан недавно с тем же именем - повторная запись не нужна
+            if permissions == "use" and self._known_users.get(user_id) == username:
+                return
             # Получаем текущие права
-            current = self.db.query("SELECT permissions FROM users WHERE user_id = ?", (user_id,))
+            current = await self.db.query(SQL_GET_PERMISSIONS, (user_id,))
             if current:
                 current_perm = current[0][0]
                 # Если текущие права выше, не понижаем
-                perm_order = ["none", "use", "create", "admin"]
-                if perm_order.index(permissions) < perm_order.index(current_perm):
+                if PERMISSION_LEVELS[permissions] < PERMISSION_LEVELS.get(current_perm, 0):
                     permissions = current_perm
-            self.db.execute(
-                """
-                INSERT OR REPLACE INTO users (user_id, username, permissions, last_activity)
-                VALUES (?, ?, ?, ?)
-                """,
-                (user_id, username, permissions, datetime.now().isoformat())
-            )
+            if await self.db.execute(SQL_SET_USER, (user_id, username, permissions)):
+                self._known_users.set(user_id, username)
+            self._permissions_cache.pop(user_id)
         except Exception as e:
             logger.error(f"Add user error: {e}")
 
     # Template management (same as before, keeping existing methods)
-    def get_templates(self) -> List[Dict]:
-        """Get all templates with safe result handling"""
+    def invalidate_templates_cache(self):
+        """Force get_templates to reload from database after templates change"""
+        self._templates_cache = None
+
+    async def get_templates(self) -> List[Dict]:
+        """Get all templates with safe result handling (memoized for TEMPLATES_CACHE_TTL seconds)"""
+        if self._templates_cache is not None and time.monotonic() - self._templates_cache_time < TEMPLATES_CACHE_TTL:
+            return self._templates_cache
         try:
-            results = self.db.query("SELECT * FROM templates ORDER BY usage_count DESC")
+            results = await self.db.query(SQL_GET_TEMPLATES)
             templates = []
             for row in results:
                 template = dict(row)
                 try:
-                    template['variables'] = json.loads(template.get('variables', '[]'))
+                    template['variables'] = json_loads(template.get('variables', '[]'))
                 except json.JSONDecodeError:
                     template['variables'] = []
                 templates.append(template)
+            self._templates_cache = templates
+            self._templates_by_id = {template['id']: template for template in templates}
+            self._templates_cache_time = time.monotonic()
             return templates
         except Exception as e:
             logger.error(f"Get templates error: {e}")
             return []
 
-    def get_active_polls(self, user_id: Optional[int] = None, limit: int = 5) -> List[Dict]:
+    async def get_template(self, template_id) -> Optional[Dict]:
+        """Get single template by id from the memoized templates list"""
+        try:
+            template_id = int(template_id)
+        except (TypeError, ValueError):
+            return None
+        await self.get_templates()
+        return self._templates_by_id.get(template_id)
+
+    async def get_active_polls(self, user_id: Optional[int] = None, limit: int = 5) -> List[Dict]:
         """Получить список активных опросов с учетом прав пользователя"""
         try:
             logger.debug(f"Getting active polls for user {user_id} with limit {limit}")
 
             if user_id is None:
                 # Если user_id не передан, возвращаем все активные голосования (для админов)
-                results = self.db.query(
+                results = await self.db.query(
                     "SELECT poll_id, question, options, created_date FROM polls WHERE status = 'active' ORDER BY created_date DESC LIMIT ?",
                     (limit,)
                 )
             else:
-                user_perm = self.get_permissions(user_id)
+                user_perm = await self.get_permissions(user_id)
 
                 if user_perm == "admin":
                     # Администратор видит все активные голосования
-                    results = self.db.query(
+                    results = await self.db.query(
                         "SELECT poll_id, question, options, created_date FROM polls WHERE status = 'active' ORDER BY created_date DESC LIMIT ?",
                         (limit,)
                     )
                 elif user_perm == "create":
                     # Пользователи с правом create видят свои голосования + те, в которых участвовали
-                    results = self.db.query(
+                    results = await self.db.query(
                         """SELECT DISTINCT p.poll_id, p.question, p.options, p.created_date
                            FROM polls p
                            LEFT JOIN poll_votes pv ON p.poll_id = pv.poll_id AND pv.user_id = ?
@@ -2247,7 +2782,7 @@ class PollsBot:
                     )
                 else:
                     # Обычные пользователи видят только те голосования, в которых участвовали
-                    results = self.db.query(
+                    results = await self.db.query(
                         """SELECT p.poll_id, p.question, p.options, p.created_date
                            FROM polls p
                            INNER JOIN poll_votes pv ON p.poll_id = pv.poll_id
@@ -2272,21 +2807,21 @@ class PollsBot:
             logger.debug(f"Error in get_active_polls: {e}")
             return []
 
-    def get_closed_polls(self, user_id: int, limit: int = 10) -> List[Dict]:
+    async def get_closed_polls(self, user_id: int, limit: int = 10) -> List[Dict]:
         """Получить список закрытых голосований с учетом прав доступа и участия пользователя"""
         try:
-            user_perm = self.get_permissions(user_id)
+            user_perm = await self.get_permissions(user_id)
 
             if user_perm == "admin":
                 # Администратор видит все закрытые голосования
-                results = self.db.query(
+                results = await self.db.query(
                     """SELECT poll_id, question, options, created_date, creator_id, total_voters, decision_number
                        FROM polls WHERE status = 'closed' ORDER BY created_date DESC LIMIT ?""",
                     (limit,)
                 )
             elif user_perm == "create":
                 # Пользователи с правом create видят свои закрытые голосования + те, в которых участвовали
-                results = self.db.query(
+                results = await self.db.query(
                     """SELECT DISTINCT p.poll_id, p.question, p.options, p.created_date, p.creator_id, p.total_voters, p.decision_number
                        FROM polls p
                        LEFT JOIN poll_votes pv ON p.poll_id = pv.poll_id AND pv.user_id = ?
@@ -2297,7 +2832,7 @@ class PollsBot:
                 )
             else:
                 # Обычные пользователи видят только те закрытые голосования, в которых участвовали
-                results = self.db.query(
+                results = await self.db.query(
                     """SELECT p.poll_id, p.question, p.options, p.created_date, p.creator_id, p.total_voters, p.decision_number
                        FROM polls p
                        INNER JOIN poll_votes pv ON p.poll_id = pv.poll_id
@@ -2323,51 +2858,50 @@ class PollsBot:
             logger.error(f"Get closed polls error: {e}")
             return []
 
-    def create_template_session(self, user_id: int, template_name: str, variables: List[str], chat_id: int) -> str:
+    async def create_template_session(self, user_id: int, template_name: str, variables: List[str], chat_id: int) -> str:
         """Create template session with cleanup of old sessions and global limits"""
         try:
-            # 🔍 ДОБАВЬТЕ ЭТО:
-            print(f"🔍 DEBUG creating template session for user {user_id}, template {template_name}")
-            import traceback
-            traceback.print_stack()  # Покажет, откуда вызывается
-            total_sessions = len(self.db.query("SELECT session_id FROM template_sessions"))
+            logger.debug(f"Creating template session for user {user_id}, template {template_name}")
+            statements = []
+            total_sessions = await self.db.scalar("SELECT COUNT(*) FROM template_sessions", default=0)
             if total_sessions > 100:
                 logger.warning(f"Global session limit reached: {total_sessions}")
-                self.db.execute("""
+                statements.append(("""
                     DELETE FROM template_sessions
                     WHERE session_id IN (
                         SELECT session_id FROM template_sessions
-                        ORDER BY created_date ASC LIMIT 50
+                        ORDER BY created_ts ASC LIMIT 50
                     )
-                """)
+                """, ()))
 
             session_id = str(uuid.uuid4())
 
-            self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (user_id,))
-
-            success = self.db.execute("""
-                INSERT INTO template_sessions (session_id, user_id, template_name, variables_needed, chat_id)
-                VALUES (?, ?, ?, ?, ?)
-            """, (session_id, user_id, template_name, json.dumps(variables), chat_id))
+            # Eviction, replacing the user's previous session and the insert share one transaction
+            statements.append(("DELETE FROM template_sessions WHERE user_id = ?", (user_id,)))
+            statements.append((f"""
+                INSERT INTO template_sessions (session_id, user_id, template_name, variables_needed, chat_id, created_ts)
+                VALUES (?, ?, ?, ?, ?, {SQL_NOW_TS})
+            """, (session_id, user_id, template_name, json_dumps(variables), chat_id)))
+            success = await self.db.execute_batch(statements)
 
             return session_id if success else ""
         except Exception as e:
             logger.error(f"Create session error: {e}")
             return ""
 
-    def get_template_session(self, user_id: int) -> Optional[Dict]:
+    async def get_template_session(self, user_id: int) -> Optional[Dict]:
         """Get active template session with safe result handling"""
         try:
-            result = self.db.query("""
+            result = await self.db.query("""
                 SELECT session_id, template_name, variables_needed, variables_values, current_variable, chat_id
-                FROM template_sessions WHERE user_id = ? ORDER BY created_date DESC LIMIT 1
+                FROM template_sessions WHERE user_id = ? ORDER BY created_ts DESC LIMIT 1
             """, (user_id,))
 
             if result and len(result) > 0:
                 row = result[0]
                 try:
-                    variables_needed = json.loads(row[2]) if row[2] else []
-                    variables_values = json.loads(row[3]) if row[3] else {}
+                    variables_needed = json_loads(row[2]) if row[2] else []
+                    variables_values = json_loads(row[3]) if row[3] else {}
                 except json.JSONDecodeError:
                     variables_needed = []
                     variables_values = {}
@@ -2385,11 +2919,11 @@ class PollsBot:
             logger.error(f"Get session error: {e}")
             return None
 
-    def update_template_session(self, session_id: str, value: str) -> bool:
+    async def update_template_session(self, session_id: str, value: str) -> bool:
         """Update session with variable value and bounds checking"""
         try:
             value = self.sanitize(value, 100)
-            result = self.db.query("""
+            result = await self.db.query("""
                 SELECT variables_needed, variables_values, current_variable
                 FROM template_sessions WHERE session_id = ?
             """, (session_id,))
@@ -2398,8 +2932,8 @@ class PollsBot:
                 return False
 
             try:
-                variables_needed = json.loads(result[0][0]) if result[0][0] else []
-                variables_values = json.loads(result[0][1]) if result[0][1] else {}
+                variables_needed = json_loads(result[0][0]) if result[0][0] else []
+                variables_values = json_loads(result[0][1]) if result[0][1] else {}
             except json.JSONDecodeError:
                 variables_needed = []
                 variables_values = {}
@@ -2413,25 +2947,26 @@ class PollsBot:
             var_name = variables_needed[current]
             variables_values[var_name] = value
 
-            return self.db.execute("""
+            return await self.db.execute("""
                 UPDATE template_sessions SET variables_values = ?, current_variable = ? WHERE session_id = ?
-            """, (json.dumps(variables_values), current + 1, session_id))
+            """, (json_dumps(variables_values), current + 1, session_id))
 
         except Exception as e:
             logger.error(f"Update session error: {e}")
             return False
 
-    def complete_session(self, session_id: str):
+    async def complete_session(self, session_id: str):
         """Remove completed session"""
         try:
-            self.db.execute("DELETE FROM template_sessions WHERE session_id = ?", (session_id,))
+            await self.db.execute("DELETE FROM template_sessions WHERE session_id = ?", (session_id,))
         except (sqlite3.Error, Exception) as e:
             logger.error(f"Complete session error: {e}")
 
-    def increment_template_usage(self, template_name: str):
+    async def increment_template_usage(self, template_name: str):
         """Increment template usage counter"""
         try:
-            self.db.execute("UPDATE templates SET usage_count = usage_count + 1 WHERE name = ?", (template_name,))
+            await self.db.execute("UPDATE templates SET usage_count = usage_count + 1 WHERE name = ?", (template_name,))
+            self.invalidate_templates_cache()
         except (sqlite3.Error, Exception) as e:
             logger.error(f"Increment usage error: {e}")
 
@@ -2452,7 +2987,7 @@ class PollsBot:
 
             # Check for recent duplicates (last hour)
             hour_ago = (datetime.now() - timedelta(hours=1)).isoformat()
-            existing = self.db.query("""
+            existing = await self.db.query("""
                 SELECT poll_id FROM polls
                 WHERE creator_id = ? AND question = ? AND created_date > ?
             """, (creator_id, question, hour_ago))
@@ -2469,7 +3004,7 @@ class PollsBot:
             # Create poll in database
             poll_id = str(uuid.uuid4())
 
-            success = self.db.execute("""
+            success = await self.db.execute("""
                 INSERT INTO polls (poll_id, question, options, chat_id,
                                  creator_id, template_used, threshold, non_anonymous, voting_type, max_participants)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -2481,7 +3016,7 @@ class PollsBot:
                 return False
 
             # Send poll message with Vote-style inline buttons
-            text, keyboard = self.format_poll_message(poll_id, show_results=False, for_user_id=creator_id)
+            text, keyboard = await self.format_poll_message(poll_id, show_results=False, for_user_id=creator_id)
 
             try:
                 if not self.application:
@@ -2495,12 +3030,13 @@ class PollsBot:
                     reply_markup=keyboard
                 )
 
-                # Update message_id in database
-                self.db.execute("UPDATE polls SET message_id = ? WHERE poll_id = ?",
-                               (message.message_id, poll_id))
-
+                # Update message_id and template usage counter in one transaction
+                statements = [("UPDATE polls SET message_id = ? WHERE poll_id = ?", (message.message_id, poll_id))]
+                if template_name:
+                    statements.append(("UPDATE templates SET usage_count = usage_count + 1 WHERE name = ?", (template_name,)))
+                await self.db.execute_batch(statements)
                 if template_name:
-                    self.increment_template_usage(template_name)
+                    self.invalidate_templates_cache()
 
                 logger.info(f"Vote-style poll created successfully: {poll_id} by user {creator_id}")
                 return True
@@ -2508,7 +3044,8 @@ class PollsBot:
             except Exception as e:
                 logger.error(f"Failed to send poll message: {e}")
                 # Clean up database entry
-                self.db.execute("DELETE FROM polls WHERE poll_id = ?", (poll_id,))
+                await self.db.execute("DELETE FROM polls WHERE poll_id = ?", (poll_id,))
+                self.invalidate_poll_cache(poll_id)
                 return False
 
         except Exception as e:
@@ -2521,16 +3058,16 @@ class PollsBot:
         """Handle /start command with enhanced user management"""
         if update.effective_chat.type != "private":
             bot_username = getattr(context.bot, 'username', 'BotName')
-            await self.send_message(update, f"❌ В группах команды не поддерживаются. Для публикации и голосования используйте inline-режим: @{bot_username} ...")
+            await self.send_message(update, GROUP_COMMANDS_TEXT.format(bot_username=bot_username))
             return
         user = update.effective_user
-        self.add_user(user.id, user.username or user.first_name or str(user.id))
-        self.clear_user_state(user.id)
-        permissions = self.get_permissions(user.id)
+        await self.add_user(user.id, user.username or user.first_name or str(user.id))
+        await self.clear_user_state(user.id)
+        permissions = await self.get_permissions(user.id)
         if permissions == "none":
-            await self.send_message(update, f"❌ У вас нет доступа к боту.\nВаш ID: `{user.id}`\nОбратитесь к администратору.")
+            await self.send_message(update, NO_ACCESS_TEXT.format(user_id=user.id))
             return
-        await self.send_message(update, "🗳️ Главное меню:", self.menus.main_menu(user.id))
+        await self.send_message(update, "🗳️ Главное меню:", await self.menus.main_menu(user.id))
 
     @error_handler
     @permission_required(["create"])
@@ -2538,12 +3075,12 @@ class PollsBot:
         """Handle /create command"""
         if update.effective_chat.type != "private":
             bot_username = getattr(context.bot, 'username', 'BotName')
-            await self.send_message(update, f"❌ В группах команды не поддерживаются. Для публикации и голосования используйте inline-режим: @{bot_username} ...")
+            await self.send_message(update, GROUP_COMMANDS_TEXT.format(bot_username=bot_username))
             return
-        self.clear_user_state(update.effective_user.id)
+        await self.clear_user_state(update.effective_user.id)
 
         await self.send_message(update, "🗳️ **Создание голосования**\n\nВыберите тип:",
-                               self.menus.main_menu())
+                               await self.menus.main_menu())
 
     # Vote handler (NEW - main feature)
     @error_handler
@@ -2564,17 +3101,19 @@ class PollsBot:
             option_id = int(option_id_str)
 
             # Check if poll exists
-            poll_data = self.db.query("SELECT chat_id, status FROM polls WHERE poll_id = ?", (poll_id,))
+            poll_data = await self.db.query("SELECT chat_id, status FROM polls WHERE poll_id = ?", (poll_id,))
             if not poll_data:
+                self.cancel_poll_edit(query)
                 await query.edit_message_text("❌ Голосование не найдено")
                 return
 
             chat_id, status = poll_data[0]
             if status != 'active':
                 # Показываем результаты закрытого голосования вместо ошибки
-                text, keyboard = self.format_poll_message(poll_id, show_results=True, for_user_id=user_id)
+                text, keyboard = await self.format_poll_message(poll_id, show_results=True, for_user_id=user_id)
                 
                 try:
+                    self.cancel_poll_edit(query)
                     await query.edit_message_text(
                         text=text,
                         parse_mode=ParseMode.MARKDOWN,
@@ -2588,10 +3127,10 @@ class PollsBot:
                 return
 
             # Check user permissions
-            user_perms = self.get_permissions(user_id)
+            user_perms = await self.get_permissions(user_id)
 
             # Allow voting if user has "use" permissions or higher
-            if user_perms in ["use", "create", "admin"]:
+            if user_perms in VOTE_PERMISSIONS:
                 can_vote = True
             else:
                 # Check if user is in the chat where poll is posted
@@ -2601,73 +3140,52 @@ class PollsBot:
                 await query.answer("❌ У вас нет прав для голосования в этом опросе", show_alert=True)
                 return
 
-            # Record vote (replace if user already voted)
-            success = self.db.execute("""
-                INSERT OR REPLACE INTO poll_votes (poll_id, user_id, username, option_id)
-                VALUES (?, ?, ?, ?)
-            """, (poll_id, user_id, username, option_id))
+            # Record vote (replace if user already voted) and update total voters count;
+            # concurrent votes are group-committed in one transaction
+            success = await self.record_vote(poll_id, user_id, username, option_id)
 
             if not success:
                 await query.answer("❌ Ошибка записи голоса", show_alert=True)
                 return
 
-            # Update total voters count
-            self.db.execute("""
-                UPDATE polls SET total_voters = (
-                    SELECT COUNT(DISTINCT user_id) FROM poll_votes WHERE poll_id = ?
-                ) WHERE poll_id = ?
-            """, (poll_id, poll_id))
-
             # АВТОМАТИЧЕСКОЕ ЗАКРЫТИЕ ОПРОСА
-            poll_info = self.db.query("SELECT max_participants, total_voters, creator_id FROM polls WHERE poll_id = ?", (poll_id,))
+            poll_info = await self.db.query("SELECT max_participants, total_voters, creator_id FROM polls WHERE poll_id = ?", (poll_id,))
             auto_closed = False
 
             if poll_info:
                 max_participants, total_voters, creator_id = poll_info[0]
                 if max_participants and max_participants > 0 and total_voters >= max_participants:
-                    self.db.execute("UPDATE polls SET status = 'closed' WHERE poll_id = ?", (poll_id,))
+                    await self.db.execute("UPDATE polls SET status = 'closed' WHERE poll_id = ?", (poll_id,))
+                    self.invalidate_poll_cache(poll_id)
                     auto_closed = True
                     
                     # Уведомление создателю (только если это не тот же пользователь)
                     if creator_id != user_id:
                         try:
-                            poll_details = self.db.query("SELECT question FROM polls WHERE poll_id = ?", (poll_id,))
+                            poll_details = await self.db.query("SELECT question FROM polls WHERE poll_id = ?", (poll_id,))
                             if poll_details:
                                 question = poll_details[0][0]
                                 notification_text = (
                                     f"🛑 **Голосование автоматически закрыто**\n\n"
                                     f"❓ Вопрос: {question}\n"
-                                    f"👥 Проголосовали все {max_participants} участников"
-                                )
-                                await self.send_message(creator_id, notification_text)
-                                logger.info(f"Auto-close notification sent to creator {creator_id}")
-                        except Exception as e:
-                            logger.error(f"Failed to send auto-close notification: {e}")
-
-            # Update message with new results
-            text, keyboard = self.format_poll_message(poll_id, show_results=True, for_user_id=user_id)
-
-            try:
-                await query.edit_message_text(
-                    text=text,
-                    parse_mode=ParseMode.MARKDOWN,
-                    reply_markup=keyboard
-                )
-                
-                # Показываем соответствующее уведомление
-                if auto_closed:
-                    await query.answer("✅ Ваш голос учтен! Голосование автоматически закрыто.", show_alert=False)
-                else:
-                    await query.answer("✅ Ваш голос учтен!", show_alert=False)
-                    
-                logger.info(f"Vote recorded: poll {poll_id}, user {user_id}, option {option_id}")
+                                    f"👥 Проголосовали все {max_participants} участников"
+                                )
+                                await self.send_message(creator_id, notification_text)
+                                logger.info(f"Auto-close notification sent to creator {creator_id}")
+                        except Exception as e:
+                            logger.error(f"Failed to send auto-close notification: {e}")
 
-            except Exception as e:
-                logger.error(f"Failed to update poll message: {e}")
-                if auto_closed:
-                    await query.answer("✅ Голос учтен! Голосование закрыто.", show_alert=False)
-                else:
-                    await query.answer("✅ Голос учтен, но не удалось обновить отображение")
+            # Update message with new results; bursts of votes on one poll share a single redraw
+            text, keyboard = await self.format_poll_message(poll_id, show_results=True, for_user_id=user_id)
+            self.schedule_poll_edit(query, text, keyboard)
+
+            # Показываем соответствующее уведомление
+            if auto_closed:
+                await query.answer("✅ Ваш голос учтен! Голосование автоматически закрыто.", show_alert=False)
+            else:
+                await query.answer("✅ Ваш голос учтен!", show_alert=False)
+
+            logger.info(f"Vote recorded: poll {poll_id}, user {user_id}, option {option_id}")
 
         except Exception as e:
             logger.error(f"Vote handler error: {e}")
@@ -2689,13 +3207,13 @@ class PollsBot:
             poll_id = data.split(":", 1)[1]
 
             # Check permissions
-            poll_data = self.db.query("SELECT creator_id, status FROM polls WHERE poll_id = ?", (poll_id,))
+            poll_data = await self.db.query("SELECT creator_id, status FROM polls WHERE poll_id = ?", (poll_id,))
             if not poll_data:
                 await query.answer("❌ Голосование не найдено", show_alert=True)
                 return
 
             creator_id, status = poll_data[0]
-            user_perms = self.get_permissions(user_id)
+            user_perms = await self.get_permissions(user_id)
 
             # Allow closing only if user is creator or admin
             if user_id != creator_id and user_perms != "admin":
@@ -2707,11 +3225,13 @@ class PollsBot:
                 return
 
             # Close poll
-            self.db.execute("UPDATE polls SET status = 'closed' WHERE poll_id = ?", (poll_id,))
+            await self.db.execute("UPDATE polls SET status = 'closed' WHERE poll_id = ?", (poll_id,))
+            self.invalidate_poll_cache(poll_id)
 
             # Update message
-            text, _ = self.format_poll_message(poll_id, show_results=True, for_user_id=user_id)
+            text, _ = await self.format_poll_message(poll_id, show_results=True, for_user_id=user_id)
 
+            self.cancel_poll_edit(query)
             await query.edit_message_text(
                 text=text,
                 parse_mode=ParseMode.MARKDOWN
@@ -2740,13 +3260,13 @@ class PollsBot:
             poll_id = data.split(":", 1)[1]
 
             # Check permissions
-            poll_data = self.db.query("SELECT creator_id, status, question FROM polls WHERE poll_id = ?", (poll_id,))
+            poll_data = await self.db.query("SELECT creator_id, status, question FROM polls WHERE poll_id = ?", (poll_id,))
             if not poll_data:
                 await query.answer("❌ Голосование не найдено", show_alert=True)
                 return
 
             creator_id, status, question = poll_data[0]
-            user_perms = self.get_permissions(user_id)
+            user_perms = await self.get_permissions(user_id)
 
             # Allow editing only if user is creator or admin
             if user_id != creator_id and user_perms != "admin":
@@ -2758,7 +3278,7 @@ class PollsBot:
                 return
 
             # Set user state for editing
-            self.set_user_state(user_id, UserState.WAITING_POLL_QUESTION, {
+            await self.set_user_state(user_id, UserState.WAITING_POLL_QUESTION, {
                 "type": "edit",
                 "poll_id": poll_id,
                 "original_question": question
@@ -2771,6 +3291,7 @@ class PollsBot:
                 [InlineKeyboardButton("⬅️ Назад", callback_data=f"show_poll:{poll_id}")]
             ]
 
+            self.cancel_poll_edit(query)
             await query.edit_message_text(
                 text=f"✏️ **Редактирование опроса**\n\n❓ Вопрос: {question}\n\nВыберите, что хотите изменить:",
                 reply_markup=InlineKeyboardMarkup(keyboard),
@@ -2797,13 +3318,13 @@ class PollsBot:
             poll_id = data.split(":", 1)[1]
 
             # Check permissions
-            poll_data = self.db.query("SELECT creator_id, question FROM polls WHERE poll_id = ?", (poll_id,))
+            poll_data = await self.db.query("SELECT creator_id, question FROM polls WHERE poll_id = ?", (poll_id,))
             if not poll_data:
                 await query.answer("❌ Голосование не найдено", show_alert=True)
                 return
 
             creator_id, question = poll_data[0]
-            user_perms = self.get_permissions(user_id)
+            user_perms = await self.get_permissions(user_id)
 
             # Allow deletion only if user is creator or admin
             if user_id != creator_id and user_perms != "admin":
@@ -2816,6 +3337,7 @@ class PollsBot:
                 [InlineKeyboardButton("❌ Отмена", callback_data=f"show_poll:{poll_id}")]
             ]
 
+            self.cancel_poll_edit(query)
             await query.edit_message_text(
                 text=f"🗑️ **Удаление опроса**\n\n❓ Вопрос: {question}\n\n⚠️ **Внимание!** Это действие нельзя отменить.\n\nВы уверены, что хотите удалить этот опрос?",
                 reply_markup=InlineKeyboardMarkup(keyboard),
@@ -2848,37 +3370,23 @@ class PollsBot:
                 return
 
             # Add user to database if not exists
-            self.add_user(user_id, query.from_user.username or str(user_id))
+            await self.add_user(user_id, query.from_user.username or str(user_id))
+
+            # Simple delegating actions go through the route table
+            action, _, arg = data.partition(":")
+            route = self._callback_routes.get(action)
+            if route is not None:
+                await route(update, context, arg)
+                return
 
             # Handle different callback types
             if data == "create_poll":
-                if self.get_permissions(user_id) in ["create", "admin"]:
+                if await self.get_permissions(user_id) in CREATE_PERMISSIONS:
                     await self.send_message(query, "Выберите тип опроса:", self.menus.poll_type_menu())
                 else:
                     await self.send_message(query, "❌ Недостаточно прав для создания голосований")
                 return
 
-            elif data == "templates":
-                await self.show_templates_for_use(query)
-                return
-
-            elif data == "active_polls":
-                await self.show_active_polls(query)
-                return
-
-            elif data == "closed_polls":
-                await self.show_closed_polls(query)
-                return
-
-            elif data.startswith("use_tpl:"):
-                template_id = data.split(":", 1)[1]
-                await self.handle_use_template(query, template_id)
-                return
-
-            elif data == "status":
-                await self.status_command(query, context)
-                return
-
             elif data == "admin":
                 try:
                     await self.admin_command(query, context)
@@ -2887,10 +3395,6 @@ class PollsBot:
                     await query.edit_message_text("❌ Внутренняя ошибка. Обратитесь к администратору.")
                 return
 
-            elif data == "help":
-                await self.help_command(query, context)
-                return
-
             elif data.startswith("admin_"):
                 try:
                     await self.handle_admin_callback(query, data)
@@ -2901,18 +3405,17 @@ class PollsBot:
 
             elif data.startswith("delete_tpl:"):
                 template_id = data.split(":", 1)[1]
-                result = self.db.query("SELECT created_by FROM templates WHERE id = ?", (template_id,))
-                if not result:
+                template = await self.get_template(template_id)
+                if not template:
                     await query.answer("❌ Шаблон не найден", show_alert=True)
                     return
-                created_by = result[0][0]
-                if (created_by == user_id) or (self.get_permissions(user_id) == "admin"):
+                created_by = template['created_by']
+                if (created_by == user_id) or (await self.get_permissions(user_id) == "admin"):
                     keyboard = [
                         [InlineKeyboardButton("✅ Да, удалить", callback_data=f"confirm_delete_template:{template_id}")],
                         [InlineKeyboardButton("❌ Отмена", callback_data="back_to_templates")]
                     ]
-                    template_name_row = self.db.query("SELECT name FROM templates WHERE id = ?", (template_id,))
-                    template_name = template_name_row[0][0] if template_name_row else str(template_id)
+                    template_name = template['name']
                     await self.send_message(query, f"🗑️ Вы уверены, что хотите удалить шаблон **{template_name}**?",
                                           reply_markup=InlineKeyboardMarkup(keyboard))
                 else:
@@ -2921,24 +3424,21 @@ class PollsBot:
 
             elif data.startswith("confirm_delete_template:"):
                 template_id = data.split(":", 1)[1]
-                template_name_row = self.db.query("SELECT name FROM templates WHERE id = ?", (template_id,))
-                template_name = template_name_row[0][0] if template_name_row else str(template_id)
-                self.db.execute("DELETE FROM templates WHERE id = ?", (template_id,))
+                template = await self.get_template(template_id)
+                template_name = template['name'] if template else str(template_id)
+                await self.db.execute("DELETE FROM templates WHERE id = ?", (template_id,))
+                self.invalidate_templates_cache()
                 await self.send_message(query, f"✅ Шаблон **{template_name}** удалён.")
                 # После удаления возвращаем пользователя к списку шаблонов
                 await self.show_templates_for_use(query)
                 return
 
-            elif data == "back_to_templates":
-                await self.show_templates_for_use(query)
-                return
-
             elif data.startswith("continue_tpl:"):
                 template_id = data.split(":", 1)[1]
                 # Получаем переменные из шаблона
-                variables_json = self.db.query("SELECT variables FROM templates WHERE id = ?", (template_id,))
-                variables = json.loads(variables_json[0][0]) if variables_json and variables_json[0][0] else []
-                session_id = self.create_template_session(
+                template = await self.get_template(template_id)
+                variables = template['variables'] if template else []
+                session_id = await self.create_template_session(
                     query.from_user.id, template_id, variables, query.message.chat_id
                 )
                 if session_id:
@@ -2947,45 +3447,6 @@ class PollsBot:
                     await self.send_message(query, "❌ Ошибка создания сессии")
                 return
 
-            # Handle vote callbacks
-            elif data.startswith("vote:"):
-                await self.vote_handler(update, context)
-                return
-
-            elif data.startswith("close_poll:"):
-                await self.close_poll_handler(update, context)
-                return
-
-            elif data.startswith("edit_poll:"):
-                await self.edit_poll_handler(update, context)
-                return
-
-            elif data.startswith("delete_poll:"):
-                await self.delete_poll_handler(update, context)
-                return
-
-            elif data.startswith("confirm_delete_poll:"):
-                await self.confirm_delete_poll_handler(update, context)
-                return
-
-            elif data.startswith("edit_poll_question:"):
-                await self.start_edit_poll_question(update, context)
-                return
-
-            elif data.startswith("edit_poll_options:"):
-                await self.start_edit_poll_options(update, context)
-                return
-
-            elif data.startswith("show_poll:"):
-                poll_id = data.split(":", 1)[1]
-                await self.show_single_poll(query, poll_id)
-                return
-
-            elif data.startswith("show_closed_poll:"):
-                poll_id = data.split(":", 1)[1]
-                await self.show_single_poll(query, poll_id)
-                return
-
             # Handle user deletion confirmation
             elif data.startswith("confirm_delete:"):
                 await self.handle_user_deletion(query, data)
@@ -2997,13 +3458,13 @@ class PollsBot:
 
             elif data.startswith("cancel:"):
                 session_id = data.split(":", 1)[1]
-                self.complete_session(session_id)
-                self.clear_user_state(user_id)
+                await self.complete_session(session_id)
+                await self.clear_user_state(user_id)
                 await query.edit_message_text("❌ Отменено")
 
             elif data == "create_simple":
-                if self.get_permissions(user_id) in ["create", "admin"]:
-                    self.set_user_state(user_id, UserState.WAITING_POLL_QUESTION, {"type": "simple"})
+                if await self.get_permissions(user_id) in CREATE_PERMISSIONS:
+                    await self.set_user_state(user_id, UserState.WAITING_POLL_QUESTION, {"type": "simple"})
                     await self.send_message(query, "📝 Введите вопрос для простого опроса:")
                 else:
                     await self.send_message(query, "❌ Недостаточно прав для создания голосований")
@@ -3011,24 +3472,24 @@ class PollsBot:
 
 
             elif data == "create_from_template":
-                if self.get_permissions(user_id) in ["create", "admin"]:
+                if await self.get_permissions(user_id) in CREATE_PERMISSIONS:
                     await self.show_templates_for_use(query)
                 else:
                     await query.edit_message_text("❌ Недостаточно прав для создания голосований")
 
             elif data == "new_template":
-                if self.get_permissions(user_id) in ["create", "admin"]:
+                if await self.get_permissions(user_id) in CREATE_PERMISSIONS:
                     # Очищаем старые template_sessions для этого пользователя
-                    self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (user_id,))
+                    await self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (user_id,))
                     
-                    self.set_user_state(user_id, UserState.WAITING_TEMPLATE_NAME)
+                    await self.set_user_state(user_id, UserState.WAITING_TEMPLATE_NAME)
                     await query.edit_message_text("📋 Введите название шаблона:")
                 else:
                     await query.edit_message_text("❌ Недостаточно прав")
                 return
 
             elif data == "finish_poll_creation":
-                user_state = self.get_user_state(user_id)
+                user_state = await self.get_user_state(user_id)
                 state_data = user_state.get("data", {})
                 question = state_data.get("question", "")
                 options = state_data.get("options", [])
@@ -3037,7 +3498,7 @@ class PollsBot:
                 return
 
             elif data == "finish_template_creation":
-                user_state = self.get_user_state(user_id)
+                user_state = await self.get_user_state(user_id)
                 state_data = user_state.get("data", {})
                 name = state_data.get("name", "")
                 question = state_data.get("question", "")
@@ -3047,41 +3508,41 @@ class PollsBot:
                 return
 
             elif data == "display_settings":
-                user_settings = self.get_user_settings(user_id)
+                user_settings = await self.get_user_settings(user_id)
                 await self.send_message(query, "⚙️ Настройки отображения опросов:", self.menus.display_settings_menu(user_id, user_settings, self.config))
                 return
 
             elif data.startswith("toggle_setting:"):
                 opt = data.split(":", 1)[1]
-                user_settings = self.get_user_settings(user_id)
+                user_settings = await self.get_user_settings(user_id)
                 current = user_settings.get(opt, self.config.get(opt, True))
                 user_settings[opt] = not current
-                self.set_user_settings(user_id, user_settings)
+                await self.set_user_settings(user_id, user_settings)
                 logger.info(f"User {user_id} toggled setting '{opt}' from {current} to {user_settings[opt]}")
                 await self.send_message(query, "⚙️ Настройки обновлены:", self.menus.display_settings_menu(user_id, user_settings, self.config))
                 return
 
             elif data == "reset_settings":
-                self.db.execute("DELETE FROM user_settings WHERE user_id = ?", (user_id,))
+                await self.db.execute("DELETE FROM user_settings WHERE user_id = ?", (user_id,))
                 await self.send_message(query, "⚙️ Настройки сброшены к стандартным", self.menus.display_settings_menu(user_id, {}, self.config))
                 return
 
             elif data == "enter_decision_number":
-                user_state = self.get_user_state(user_id)
+                user_state = await self.get_user_state(user_id)
                 state_data = user_state.get("data", {})
-                self.set_user_state(user_id, UserState.WAITING_DECISION_NUMBER_INPUT, state_data)
+                await self.set_user_state(user_id, UserState.WAITING_DECISION_NUMBER_INPUT, state_data)
                 await self.send_message(query, "Введите номер решения (целое число):",
                                       self.menus.back_menu("main"))
                 return
 
             elif data == "next_decision_number":
-                user_state = self.get_user_state(user_id)
+                user_state = await self.get_user_state(user_id)
                 state_data = user_state.get("data", {})
-                user_settings = self.get_user_settings(user_id)
+                user_settings = await self.get_user_settings(user_id)
                 last_num = user_settings.get('last_decision_number', 0)
                 next_num = last_num + 1 if last_num else 1
                 user_settings['last_decision_number'] = next_num
-                self.set_user_settings(user_id, user_settings)
+                await self.set_user_settings(user_id, user_settings)
                 max_participants = state_data.get("max_participants", 0)
                 await self.create_poll_from_template_with_max_participants(
                     query, 
@@ -3099,18 +3560,18 @@ class PollsBot:
                 return
 
             elif data == "back_to_main":
-                await self.send_message(query, "🗳️ Главное меню:", self.menus.main_menu(user_id))
+                await self.send_message(query, "🗳️ Главное меню:", await self.menus.main_menu(user_id))
                 return
 
             elif data.startswith("edit_tpl_threshold:"):
                 template_id = data.split(":", 1)[1]
-                result = self.db.query("SELECT threshold, name, created_by FROM templates WHERE id = ?", (template_id,))
-                if not result:
+                template = await self.get_template(template_id)
+                if not template:
                     await query.answer("❌ Шаблон не найден", show_alert=True)
                     return
-                threshold, name, created_by = result[0]
-                if (created_by == user_id) or (self.get_permissions(user_id) == "admin"):
-                    self.set_user_state(user_id, UserState.WAITING_EDIT_TEMPLATE_THRESHOLD,
+                threshold, name, created_by = template['threshold'], template['name'], template['created_by']
+                if (created_by == user_id) or (await self.get_permissions(user_id) == "admin"):
+                    await self.set_user_state(user_id, UserState.WAITING_EDIT_TEMPLATE_THRESHOLD,
                                       {"template_id": template_id, "name": name})
                     await self.send_message(query, f"Текущий порог шаблона **{name}**: {threshold}%\nВведите новый порог (целое число):")
                 else:
@@ -3194,12 +3655,14 @@ class PollsBot:
                 _, target_user_id, new_perm = data.split(":")
                 target_user_id = int(target_user_id)
                 # Обновляем права
-                self.db.execute("UPDATE users SET permissions = ? WHERE user_id = ?", (new_perm, target_user_id))
+                await self.db.execute("UPDATE users SET permissions = ? WHERE user_id = ?", (new_perm, target_user_id))
+                self.invalidate_user_cache(target_user_id)
                 await query.edit_message_text(f"✅ Права пользователя `{target_user_id}` обновлены на `{new_perm}`.")
                 await self.show_admin_users_list(query)
             elif data.startswith("admin_revoke:"):
                 target_user_id = int(data.split(":")[1])
-                self.db.execute("UPDATE users SET permissions = 'use' WHERE user_id = ?", (target_user_id,))
+                await self.db.execute("UPDATE users SET permissions = 'use' WHERE user_id = ?", (target_user_id,))
+                self.invalidate_user_cache(target_user_id)
                 await query.edit_message_text(f"✅ Права пользователя `{target_user_id}` отозваны (установлено 'use').")
                 await self.show_admin_users_list(query)
             elif data.startswith("admin_delete:"):
@@ -3211,12 +3674,11 @@ class PollsBot:
                 await query.edit_message_text(f"⚠️ Подтвердите удаление пользователя `{target_user_id}`:", reply_markup=InlineKeyboardMarkup(keyboard))
             elif data.startswith("admin_confirm_delete:"):
                 target_user_id = int(data.split(":")[1])
-                self.db.execute("DELETE FROM users WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM poll_votes WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM user_states WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (target_user_id,))
-                await query.edit_message_text(f"✅ Пользователь `{target_user_id}` и все его данные удалены.")
-                await self.show_admin_users_list(query)
+                if await self.delete_user_data(target_user_id):
+                    await query.edit_message_text(f"✅ Пользователь `{target_user_id}` и все его данные удалены.")
+                    await self.show_admin_users_list(query)
+                else:
+                    await query.edit_message_text("❌ Ошибка удаления пользователя")
             elif data == "admin_clear_logs":
                 await self.clear_all_logs(query)
             elif data.startswith("admin_logs_"):
@@ -3255,25 +3717,19 @@ class PollsBot:
     async def handle_use_template(self, query, template_id: str):
         """Handle template usage with enhanced validation"""
         try:
-            result = self.db.query("""
-                SELECT question, options, variables, threshold, non_anonymous
-                FROM templates WHERE id = ?
-            """, (template_id,))
+            template = await self.get_template(template_id)
 
-            if not result or len(result) == 0:
+            if not template:
                 if hasattr(query, 'edit_message_text'):
                     await query.edit_message_text("❌ Шаблон не найден")
                 else:
                     await self.send_message(query, "❌ Шаблон не найден")
                 return
-            question, options, variables_json, threshold, non_anonymous = result[0]
-            try:
-                variables = json.loads(variables_json) if variables_json else []
-            except:
-                variables = []
+            question, options = template['question'], template['options']
+            threshold, non_anonymous = template['threshold'], template['non_anonymous']
+            variables = template['variables']
             chat_id = query.message.chat_id
-            template_name_row = self.db.query("SELECT name FROM templates WHERE id = ?", (template_id,))
-            template_name = template_name_row[0][0] if template_name_row else str(template_id)
+            template_name = template['name']
             text = f"📋 **Шаблон:** {template_name}\n"
             text += f"❓ {question}\n"
             text += f"📋 Варианты: {options.replace('|', ', ')}\n"
@@ -3312,7 +3768,7 @@ class PollsBot:
     async def ask_next_variable(self, query_or_update, session_id: str):
         """Ask for next template variable with enhanced validation"""
         try:
-            result = self.db.query("""
+            result = await self.db.query("""
                 SELECT template_name, variables_needed, variables_values, current_variable
                 FROM template_sessions WHERE session_id = ?
             """, (session_id,))
@@ -3324,8 +3780,8 @@ class PollsBot:
             template_name, variables_json, values_json, current = result[0]
 
             try:
-                variables = json.loads(variables_json) if variables_json else []
-                values = json.loads(values_json) if values_json else {}
+                variables = json_loads(variables_json) if variables_json else []
+                values = json_loads(values_json) if values_json else {}
             except json.JSONDecodeError:
                 variables = []
                 values = {}
@@ -3353,7 +3809,7 @@ class PollsBot:
     async def finalize_template_poll(self, query_or_update, session_id: str):
         """Create poll from completed template with validation"""
         try:
-            result = self.db.query("""
+            result = await self.db.query("""
                 SELECT template_name, variables_values, chat_id, user_id FROM template_sessions WHERE session_id = ?
             """, (session_id,))
 
@@ -3364,24 +3820,21 @@ class PollsBot:
             template_id, values_json, chat_id, user_id = result[0]
 
             try:
-                values = json.loads(values_json) if values_json else {}
+                values = json_loads(values_json) if values_json else {}
             except json.JSONDecodeError:
                 values = {}
 
-            template_result = self.db.query(
-                "SELECT question, options, threshold, non_anonymous FROM templates WHERE id = ?",
-                (template_id,)
-            )
+            template = await self.get_template(template_id)
 
-            if template_result and len(template_result) > 0:
-                question, options, threshold, non_anonymous = template_result[0]
+            if template:
+                question, options = template['question'], template['options']
+                threshold, non_anonymous = template['threshold'], template['non_anonymous']
                 # шаг выбора номера решения
-                user_settings = self.get_user_settings(user_id)
+                user_settings = await self.get_user_settings(user_id)
                 show_decision_numbers = user_settings.get('show_decision_numbers', self.config.get('show_decision_numbers', True))
                 if show_decision_numbers:
-                    template_data = self.db.query("SELECT max_participants FROM templates WHERE id = ?", (template_id,))
-                    template_max_participants = template_data[0][0] if template_data else 0
-                    self.set_user_state(user_id, UserState.WAITING_DECISION_NUMBER, {
+                    template_max_participants = template['max_participants'] or 0
+                    await self.set_user_state(user_id, UserState.WAITING_DECISION_NUMBER, {
                         "template_id": template_id,
                         "question": question,
                         "options": options,
@@ -3391,10 +3844,10 @@ class PollsBot:
                         "chat_id": chat_id,
                         "max_participants": template_max_participants
                     })
-                    await self.send_message(query_or_update, "Выберите способ нумерации решения:", self.menus.decision_number_menu(user_id))
+                    await self.send_message(query_or_update, "Выберите способ нумерации решения:", await self.menus.decision_number_menu(user_id))
                     return
                 # Запрашиваем максимальное количество участников
-                self.set_user_state(user_id, UserState.WAITING_MAX_PARTICIPANTS, {
+                await self.set_user_state(user_id, UserState.WAITING_MAX_PARTICIPANTS, {
                     "template_id": template_id,
                     "question": question,
                     "options": options,
@@ -3412,7 +3865,7 @@ class PollsBot:
             else:
                 await self.send_message(query_or_update, "❌ Шаблон не найден")
 
-            self.complete_session(session_id)
+            await self.complete_session(session_id)
 
         except Exception as e:
             logger.error(f"Finalize poll error: {e}")
@@ -3431,7 +3884,7 @@ class PollsBot:
                 user_id = user_id or query_or_update.effective_user.id
 
             # Проверяем права на создание опросов
-            if self.get_permissions(user_id) not in ["create", "admin"]:
+            if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
                 await self.send_message(query_or_update, "❌ Недостаточно прав для создания голосований")
                 return
 
@@ -3449,7 +3902,7 @@ class PollsBot:
 
             # Если decision_number задан, сохраняем его в polls
             poll_id = str(uuid.uuid4())
-            success = self.db.execute(
+            success = await self.db.execute(
                 "INSERT INTO polls (poll_id, question, options, chat_id, creator_id, template_used, threshold, non_anonymous, voting_type, decision_number, max_participants) "
                 "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)" if decision_number is not None else
                 "INSERT INTO polls (poll_id, question, options, chat_id, creator_id, template_used, threshold, non_anonymous, voting_type, max_participants) "
@@ -3461,7 +3914,7 @@ class PollsBot:
                 await self.send_message(query_or_update, "❌ Ошибка создания голосования")
                 return
             # Отправляем сообщение с опросом
-            text, keyboard = self.format_poll_message(poll_id, show_results=False, for_user_id=user_id)
+            text, keyboard = await self.format_poll_message(poll_id, show_results=False, for_user_id=user_id)
             if not self.application:
                 logger.error("Application not initialized")
                 return
@@ -3471,11 +3924,15 @@ class PollsBot:
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=keyboard
             )
-            self.db.execute("UPDATE polls SET message_id = ? WHERE poll_id = ?", (message.message_id, poll_id))
-            # Увеличиваем usage_count шаблона
-            template_name_row = self.db.query("SELECT name FROM templates WHERE id = ?", (template_id,))
-            template_name = template_name_row[0][0] if template_name_row else str(template_id)
-            self.increment_template_usage(template_name)
+            template = await self.get_template(template_id)
+            template_name = template['name'] if template else str(template_id)
+
+            # Сохраняем message_id и увеличиваем usage_count шаблона одной транзакцией
+            await self.db.execute_batch([
+                ("UPDATE polls SET message_id = ? WHERE poll_id = ?", (message.message_id, poll_id)),
+                ("UPDATE templates SET usage_count = usage_count + 1 WHERE id = ?", (template_id,)),
+            ])
+            self.invalidate_templates_cache()
             
             # Автоматически определяем тип голосования
             voting_type = self.determine_voting_type(final_options)
@@ -3511,7 +3968,7 @@ class PollsBot:
                 user_id = user_id or query_or_update.effective_user.id
 
             # Проверяем права на создание опросов
-            if self.get_permissions(user_id) not in ["create", "admin"]:
+            if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
                 await self.send_message(query_or_update, "❌ Недостаточно прав для создания голосований")
                 return
 
@@ -3531,13 +3988,13 @@ class PollsBot:
             poll_id = str(uuid.uuid4())
 
             if decision_number is not None:
-                success = self.db.execute(
+                success = await self.db.execute(
                     "INSERT INTO polls (poll_id, question, options, chat_id, creator_id, template_used, threshold, non_anonymous, voting_type, max_participants, decision_number) "
                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
                     (poll_id, final_question, "|".join(final_options), chat_id, user_id, template_id, threshold, 1 if non_anonymous else 0, voting_type, max_participants, decision_number)
                 )
             else:
-                success = self.db.execute(
+                success = await self.db.execute(
                     "INSERT INTO polls (poll_id, question, options, chat_id, creator_id, template_used, threshold, non_anonymous, voting_type, max_participants) "
                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
                     (poll_id, final_question, "|".join(final_options), chat_id, user_id, template_id, threshold, 1 if non_anonymous else 0, voting_type, max_participants)
@@ -3547,7 +4004,7 @@ class PollsBot:
                 return
                 
             # Отправляем сообщение с опросом
-            text, keyboard = self.format_poll_message(poll_id, show_results=False, for_user_id=user_id)
+            text, keyboard = await self.format_poll_message(poll_id, show_results=False, for_user_id=user_id)
             if not self.application:
                 logger.error("Application not initialized")
                 return
@@ -3557,12 +4014,15 @@ class PollsBot:
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=keyboard
             )
-            self.db.execute("UPDATE polls SET message_id = ? WHERE poll_id = ?", (message.message_id, poll_id))
-            
-            # Увеличиваем usage_count шаблона
-            template_name_row = self.db.query("SELECT name FROM templates WHERE id = ?", (template_id,))
-            template_name = template_name_row[0][0] if template_name_row else str(template_id)
-            self.increment_template_usage(template_name)
+            template = await self.get_template(template_id)
+            template_name = template['name'] if template else str(template_id)
+
+            # Сохраняем message_id и увеличиваем usage_count шаблона одной транзакцией
+            await self.db.execute_batch([
+                ("UPDATE polls SET message_id = ? WHERE poll_id = ?", (message.message_id, poll_id)),
+                ("UPDATE templates SET usage_count = usage_count + 1 WHERE id = ?", (template_id,)),
+            ])
+            self.invalidate_templates_cache()
             
             msg = f"✅ Голосование создано из шаблона **{template_name}**!"
             if values:
@@ -3588,17 +4048,6 @@ class PollsBot:
         user_id = update.effective_user.id
         text = self.sanitize(update.message.text, 500)
 
-        # 🔍 ДОБАВЬТЕ ЭТО ДЛЯ ДИАГНОСТИКИ:
-        user_state = self.get_user_state(user_id)
-        state = user_state.get("state", UserState.IDLE)
-        session = self.get_template_session(user_id)
-        
-        print(f"🔍 DEBUG user {user_id}: state={state}, text='{text[:20]}...'")
-        if session:
-            print(f"🔍 DEBUG session found: {session}")
-        else:
-            print(f"🔍 DEBUG no session")
-
         if not text:
             return
 
@@ -3607,294 +4056,251 @@ class PollsBot:
             return
 
         # Get user state
-        user_state = self.get_user_state(user_id)
+        user_state = await self.get_user_state(user_id)
         state = user_state.get("state", UserState.IDLE)
         state_data = user_state.get("data", {})
 
         # Check template session only if user is not in poll creation state
-        if state not in [UserState.WAITING_POLL_QUESTION, UserState.WAITING_POLL_OPTION, UserState.WAITING_POLL_OPTIONS, UserState.WAITING_DECISION_NUMBER_INPUT, UserState.WAITING_TEMPLATE_NAME, UserState.WAITING_TEMPLATE_QUESTION, UserState.WAITING_TEMPLATE_OPTION, UserState.WAITING_TEMPLATE_OPTIONS, UserState.WAITING_TEMPLATE_THRESHOLD, UserState.WAITING_EDIT_TEMPLATE_THRESHOLD, UserState.WAITING_MAX_PARTICIPANTS, UserState.WAITING_TEMPLATE_CREATION_THRESHOLD, UserState.WAITING_TEMPLATE_POLL_THRESHOLD, UserState.WAITING_POLL_THRESHOLD]:
-            session = self.get_template_session(user_id)
+        handler = self._text_state_handlers.get(state)
+        if handler is None:
+            session = await self.get_template_session(user_id)
             if session:
                 try:
-                    if self.update_template_session(session["session_id"], text):
+                    if await self.update_template_session(session["session_id"], text):
                         await self.ask_next_variable(update, session["session_id"])
                     else:
                         logger.error(f"Failed to update template session {session['session_id']} for user {user_id}")
                         await self.send_message(update, "❌ Ошибка обновления сессии. Попробуйте еще раз или начните заново.")
-                        self.complete_session(session["session_id"])
-                        self.clear_user_state(user_id)
+                        await self.complete_session(session["session_id"])
+                        await self.clear_user_state(user_id)
                 except Exception as e:
                     logger.error(f"Template session error for user {user_id}: {e}")
                     await self.send_message(update, "❌ Ошибка обработки шаблона. Попробуйте еще раз.")
-                    self.complete_session(session["session_id"])
-                    self.clear_user_state(user_id)
-                return
+                    await self.complete_session(session["session_id"])
+                    await self.clear_user_state(user_id)
+            return
 
         try:
-            if state == UserState.WAITING_POLL_QUESTION:
-                await self.handle_poll_question_input(update, text, state_data)
-
-            elif state == UserState.WAITING_POLL_OPTION:
-                await self.handle_poll_option_input(update, text, state_data)
+            await handler(update, text, state_data)
 
-            elif state == UserState.WAITING_POLL_OPTIONS:
-                await self.handle_poll_options_input(update, text, state_data)
-
-            elif state == UserState.WAITING_TEMPLATE_OPTION:
-                await self.handle_template_option_input(update, text, state_data)
+        except Exception as e:
+            logger.error(f"Text handler error for user {user_id}: {e}")
+            await self.clear_user_state(user_id)
+            await self.send_message(update, "❌ Произошла ошибка. Попробуйте снова.")
 
-            elif state == UserState.WAITING_TEMPLATE_NAME:
-                await self.handle_template_name_input(update, text)
+    async def handle_decision_number_input(self, update: Update, text: str, state_data: Dict):
+        """Handle decision number input for a poll created from template"""
+        user_id = update.effective_user.id
+        try:
+            num = int(text)
+            user_settings = await self.get_user_settings(user_id)
+            user_settings['last_decision_number'] = num
+            await self.set_user_settings(user_id, user_settings)
+            max_participants = state_data.get("max_participants", 0)
+            await self.create_poll_from_template_with_max_participants(
+                update, 
+                state_data["template_id"], 
+                state_data["question"], 
+                state_data["options"], 
+                state_data["values"], 
+                state_data["threshold"], 
+                non_anonymous=state_data["non_anonymous"], 
+                chat_id=state_data["chat_id"], 
+                user_id=user_id, 
+                max_participants=max_participants,
+                decision_number=num
+            )
+            await self.clear_user_state(user_id)
+        except ValueError:
+            await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
 
-            elif state == UserState.WAITING_TEMPLATE_QUESTION:
-                await self.handle_template_question_input(update, text, state_data)
+    async def handle_template_threshold_input(self, update: Update, text: str, state_data: Dict):
+        """Handle threshold input when finishing template creation"""
+        user_id = update.effective_user.id
+        try:
+            threshold = int(text)
+            user_settings = await self.get_user_settings(user_id)
+            user_settings['threshold'] = threshold
+            await self.set_user_settings(user_id, user_settings)
+            await self.finalize_template_creation(update, state_data["name"], state_data["question"], state_data["variables"], state_data["options"])
+            return
+        except ValueError:
+            await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
 
-            elif state == UserState.WAITING_TEMPLATE_OPTIONS:
-                await self.handle_template_options_input(update, text, state_data)
+    async def handle_edit_template_threshold_input(self, update: Update, text: str, state_data: Dict):
+        """Handle new threshold input for an existing template"""
+        user_id = update.effective_user.id
+        try:
+            threshold = int(text)
+            template_id = state_data.get("template_id")
+            name = state_data.get("name", "")
+            if not template_id:
+                await self.send_message(update, "❌ Не удалось определить шаблон.", self.menus.back_menu("templates"))
+                await self.clear_user_state(user_id)
+                return
+            # Обновляем threshold в таблице templates
+            success = await self.db.execute("UPDATE templates SET threshold = ? WHERE id = ?", (threshold, template_id))
+            self.invalidate_templates_cache()
+            if success:
+                await self.clear_user_state(user_id)
+                await self.send_message(update, f"✅ Порог шаблона **{name}** обновлён: {threshold}%", self.menus.back_menu("templates"))
+            else:
+                await self.send_message(update, "❌ Ошибка обновления порога шаблона", self.menus.back_menu("templates"))
+            return
+        except ValueError:
+            await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
 
-            elif state == UserState.WAITING_DECISION_NUMBER_INPUT:
-                try:
-                    num = int(text)
-                    user_settings = self.get_user_settings(user_id)
-                    user_settings['last_decision_number'] = num
-                    self.set_user_settings(user_id, user_settings)
-                    # Получаем state_data
-                    state_data = user_state.get("data", {})
-                    max_participants = state_data.get("max_participants", 0)
-                    await self.create_poll_from_template_with_max_participants(
-                        update, 
-                        state_data["template_id"], 
-                        state_data["question"], 
-                        state_data["options"], 
-                        state_data["values"], 
-                        state_data["threshold"], 
-                        non_anonymous=state_data["non_anonymous"], 
-                        chat_id=state_data["chat_id"], 
-                        user_id=user_id, 
-                        max_participants=max_participants,
-                        decision_number=num
-                    )
-                    self.clear_user_state(user_id)
-                except ValueError:
-                    await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
+    async def handle_template_creation_threshold_input(self, update: Update, text: str, state_data: Dict):
+        """Handle threshold input and save the new template"""
+        user_id = update.effective_user.id
+        try:
+            threshold = int(text)
+            if threshold < 1 or threshold > 100:
+                await self.send_message(update, "❌ Порог должен быть от 1 до 100%!", self.menus.back_menu("main"))
                 return
-            elif state == UserState.WAITING_TEMPLATE_THRESHOLD:
-                try:
-                    threshold = int(text)
-                    user_settings = self.get_user_settings(user_id)
-                    user_settings['threshold'] = threshold
-                    self.set_user_settings(user_id, user_settings)
-                    await self.finalize_template_creation(update, state_data["name"], state_data["question"], state_data["variables"], state_data["options"])
-                    return
-                except ValueError:
-                    await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
+            # Получаем данные для создания шаблона
+            name = state_data.get("name", "")
+            question = state_data.get("question", "")
+            variables = state_data.get("variables", [])
+            options = state_data.get("options", [])
+            max_participants = state_data.get("max_participants", 0)
+
+            # Создаем шаблон с порогом
+            cleaned_options = [self.clean_poll_option(opt) for opt in options]
+            success = await self.db.execute(
+                "INSERT INTO templates (name, question, options, variables, created_by, max_participants, threshold) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, question, "|".join(cleaned_options), json_dumps(variables), user_id, max_participants, threshold)
+            )
+            self.invalidate_templates_cache()
+            
+            if success:
+                await self.clear_user_state(user_id)
+                await self.send_message(
+                    update,
+                    f"✅ Шаблон **{name}** сохранён!\n\n"
+                    f"❓ Вопрос: {question}\n"
+                    f"📋 Варианты: {', '.join(options)}\n"
+                    f"🎯 Порог: {threshold}%\n"
+                    f"👥 Максимум участников: {max_participants if max_participants else 'не ограничено'}"
+                )
                 return
-            elif state == UserState.WAITING_EDIT_TEMPLATE_THRESHOLD:
-                state_data = user_state.get("data", {})
-                is_template_creation = state_data.get("is_template_creation", False)
-                try:
-                    threshold = int(text)
-                    template_id = state_data.get("template_id")
-                    name = state_data.get("name", "")
-                    if not template_id:
-                        await self.send_message(update, "❌ Не удалось определить шаблон.", self.menus.back_menu("templates"))
-                        self.clear_user_state(user_id)
-                        return
-                    # Обновляем threshold в таблице templates
-                    success = self.db.execute("UPDATE templates SET threshold = ? WHERE id = ?", (threshold, template_id))
-                    if success:
-                        self.clear_user_state(user_id)
-                        await self.send_message(update, f"✅ Порог шаблона **{name}** обновлён: {threshold}%", self.menus.back_menu("templates"))
-                    else:
-                        await self.send_message(update, "❌ Ошибка обновления порога шаблона", self.menus.back_menu("templates"))
-                    return
-                except ValueError:
-                    if is_template_creation:
-                        state_data["is_template_creation"] = True
-                    await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
+            else:
+                await self.send_message(update, "❌ Ошибка сохранения шаблона")
                 return
-            elif state == UserState.WAITING_TEMPLATE_CREATION_THRESHOLD:
-                state_data = user_state.get("data", {})
-                is_template_creation = state_data.get("is_template_creation", False)
-                try:
-                    threshold = int(text)
-                    if threshold < 1 or threshold > 100:
-                        if is_template_creation:
-                            state_data["is_template_creation"] = True
-                        await self.send_message(update, "❌ Порог должен быть от 1 до 100%!", self.menus.back_menu("main"))
-                        return
-                    # Получаем данные для создания шаблона
-                    name = state_data.get("name", "")
-                    question = state_data.get("question", "")
-                    variables = state_data.get("variables", [])
-                    options = state_data.get("options", [])
-                    max_participants = state_data.get("max_participants", 0)
-                    user_id = update.effective_user.id
-                    
-                    # Создаем шаблон с порогом
-                    cleaned_options = [self.clean_poll_option(opt) for opt in options]
-                    success = self.db.execute(
-                        "INSERT INTO templates (name, question, options, variables, created_by, max_participants, threshold) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                        (name, question, "|".join(cleaned_options), json.dumps(variables), user_id, max_participants, threshold)
-                    )
-                    
-                    if success:
-                        self.clear_user_state(user_id)
-                        await self.send_message(
-                            update,
-                            f"✅ Шаблон **{name}** сохранён!\n\n"
-                            f"❓ Вопрос: {question}\n"
-                            f"📋 Варианты: {', '.join(options)}\n"
-                            f"🎯 Порог: {threshold}%\n"
-                            f"👥 Максимум участников: {max_participants if max_participants else 'не ограничено'}"
-                        )
-                        return
-                    else:
-                        await self.send_message(update, "❌ Ошибка сохранения шаблона")
-                        return
-                except ValueError:
-                    await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
+        except ValueError:
+            await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
+
+    async def handle_max_participants_input(self, update: Update, text: str, state_data: Dict):
+        """Handle max participants input and ask for the decision threshold"""
+        user_id = update.effective_user.id
+        try:
+            max_participants = int(text)
+            is_template_creation = state_data.get("is_template_creation", False)
+
+            if "is_template" in state_data and state_data["is_template"]:
+                # Создание опроса из шаблона - запрашиваем порог
+                threshold = state_data.get("threshold", 50)
+
+                # Сохраняем max_participants и переходим к запросу порога
+                state_data["max_participants"] = max_participants
+                await self.set_user_state(user_id, UserState.WAITING_TEMPLATE_POLL_THRESHOLD, state_data)
+                
+                await self.send_message(
+                    update,
+                    f"🎯 **Порог принятия решения**\n\n"
+                    f"Введите процент голосов для принятия решения (по умолчанию {threshold}%):"
+                )
                 return
-            elif state == UserState.WAITING_MAX_PARTICIPANTS:
-                try:
-                    max_participants = int(text)
-                    state_data = user_state.get("data", {})
-                    is_template_creation = state_data.get("is_template_creation", False)
-
-                    if "is_template" in state_data and state_data["is_template"]:
-                        # Создание опроса из шаблона - запрашиваем порог
-                        template_id = state_data.get("template_id")
-                        question = state_data.get("question", "")
-                        options = state_data.get("options", "")
-                        values = state_data.get("values", {})
-                        threshold = state_data.get("threshold", 50)
-                        non_anonymous = state_data.get("non_anonymous", False)
-                        chat_id = state_data.get("chat_id")
-                        user_id = update.effective_user.id
-                        
-                        # Сохраняем max_participants и переходим к запросу порога
-                        state_data["max_participants"] = max_participants
-                        #state_data["is_template_creation"] = True
-                        self.set_user_state(user_id, UserState.WAITING_TEMPLATE_POLL_THRESHOLD, state_data)
-                        
-                        await self.send_message(
-                            update,
-                            f"🎯 **Порог принятия решения**\n\n"
-                            f"Введите процент голосов для принятия решения (по умолчанию {threshold}%):"
-                        )
-                        return
-                    elif is_template_creation:
-                        # Это создание шаблона - запрашиваем порог
-                        name = state_data.get("name", "")
-                        question = state_data.get("question", "")
-                        variables = state_data.get("variables", [])
-                        options = state_data.get("options", [])
-                        user_id = update.effective_user.id
-                        
-                        # Сохраняем max_participants и переходим к запросу порога
-                        state_data["max_participants"] = max_participants
-                        self.set_user_state(user_id, UserState.WAITING_TEMPLATE_CREATION_THRESHOLD, state_data)
-                        
-                        await self.send_message(
-                            update,
-                            f"🎯 **Порог принятия решения**\n\n"
-                            f"Введите процент голосов для принятия решения (по умолчанию 50%):"
-                        )
-                        return
-                    else:
-                        # Обычный опрос - запрашиваем порог
-                        question = state_data.get("question", "")
-                        options = state_data.get("options", [])
-                        poll_type = state_data.get("poll_type", "simple")
-                        
-                        # Сохраняем max_participants и переходим к запросу порога
-                        state_data["max_participants"] = max_participants
-                        self.set_user_state(user_id, UserState.WAITING_POLL_THRESHOLD, state_data)
-                        
-                        await self.send_message(
-                            update,
-                            f"🎯 **Порог принятия решения**\n\n"
-                            f"Введите процент голосов для принятия решения (по умолчанию 50%):"
-                        )
-                        return
-                except ValueError:
-                    state_data = user_state.get("data", {})
-                    if state_data.get("is_template_creation", False):
-                        state_data["is_template_creation"] = True
-                    await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
+            elif is_template_creation:
+                # Это создание шаблона - сохраняем max_participants и запрашиваем порог
+                state_data["max_participants"] = max_participants
+                await self.set_user_state(user_id, UserState.WAITING_TEMPLATE_CREATION_THRESHOLD, state_data)
+                
+                await self.send_message(
+                    update,
+                    f"🎯 **Порог принятия решения**\n\n"
+                    f"Введите процент голосов для принятия решения (по умолчанию 50%):"
+                )
                 return
-            elif state == UserState.WAITING_TEMPLATE_POLL_THRESHOLD:
-                try:
-                    threshold = int(text)
-                    if threshold < 1 or threshold > 100:
-                        await self.send_message(update, "❌ Порог должен быть от 1 до 100%!")
-                        return
-                    
-                    # Получаем данные для создания опроса из шаблона
-                    template_id = state_data.get("template_id")
-                    question = state_data.get("question", "")
-                    options = state_data.get("options", "")
-                    values = state_data.get("values", {})
-                    non_anonymous = state_data.get("non_anonymous", False)
-                    chat_id = state_data.get("chat_id")
-                    max_participants = state_data.get("max_participants", 0)
-                    user_id = update.effective_user.id
-                    
-                    # Создаем опрос из шаблона с порогом
-                    await self.create_poll_from_template_with_max_participants(
-                        update, template_id, question, options, values, threshold, 
-                        non_anonymous=non_anonymous, chat_id=chat_id, user_id=user_id, max_participants=max_participants
-                    )
-                    self.clear_user_state(user_id)
-                except ValueError:
-                    await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
+            else:
+                # Обычный опрос - сохраняем max_participants и запрашиваем порог
+                state_data["max_participants"] = max_participants
+                await self.set_user_state(user_id, UserState.WAITING_POLL_THRESHOLD, state_data)
+                
+                await self.send_message(
+                    update,
+                    f"🎯 **Порог принятия решения**\n\n"
+                    f"Введите процент голосов для принятия решения (по умолчанию 50%):"
+                )
                 return
-            elif state == UserState.WAITING_POLL_THRESHOLD:
-                try:
-                    threshold = int(text)
-                    if threshold < 1 or threshold > 100:
-                        await self.send_message(update, "❌ Порог должен быть от 1 до 100%!")
-                        return
-                    
-                    # Получаем данные для создания опроса
-                    question = state_data.get("question", "")
-                    options = state_data.get("options", [])
-                    poll_type = state_data.get("poll_type", "simple")
-                    max_participants = state_data.get("max_participants", 0)
-                    chat_id = update.message.chat_id
-                    non_anonymous = self.config.get('non_anonymous_voting', False)
-                    voting_type = self.determine_voting_type(options)
-                    
-                    # Создаем опрос с порогом
-                    success = await self.create_poll(
-                        question, options, chat_id, user_id, None, threshold, non_anonymous, voting_type, max_participants
-                    )
-                    
-                    if success:
-                        self.clear_user_state(user_id)
-                        options_text = "\n".join([f"• {opt}" for opt in options])
-                        voting_type_text = self.get_voting_type_text(voting_type)
-                        await self.send_message(
-                            update,
-                            f"✅ Голосование создано!\n\n"
-                            f"❓ **{question}**\n\n"
-                            f"📋 Варианты:\n{options_text}\n\n"
-                            f"🎯 Порог: {threshold}%{voting_type_text}\n"
-                            f"👥 Максимум участников: {max_participants if max_participants else 'не ограничено'}"
-                        )
-                    else:
-                        await self.send_message(update, "❌ Ошибка создания голосования")
-                except ValueError:
-                    await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
+        except ValueError:
+            await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
+
+    async def handle_template_poll_threshold_input(self, update: Update, text: str, state_data: Dict):
+        """Handle threshold input and create poll from template"""
+        user_id = update.effective_user.id
+        try:
+            threshold = int(text)
+            if threshold < 1 or threshold > 100:
+                await self.send_message(update, "❌ Порог должен быть от 1 до 100%!")
                 return
-#            else:
-#                # Quick poll creation
-#                await self.handle_quick_poll_creation(update, text)
+            
+            # Получаем данные для создания опроса из шаблона
+            template_id = state_data.get("template_id")
+            question = state_data.get("question", "")
+            options = state_data.get("options", "")
+            values = state_data.get("values", {})
+            non_anonymous = state_data.get("non_anonymous", False)
+            chat_id = state_data.get("chat_id")
+            max_participants = state_data.get("max_participants", 0)
+
+            # Создаем опрос из шаблона с порогом
+            await self.create_poll_from_template_with_max_participants(
+                update, template_id, question, options, values, threshold, 
+                non_anonymous=non_anonymous, chat_id=chat_id, user_id=user_id, max_participants=max_participants
+            )
+            await self.clear_user_state(user_id)
+        except ValueError:
+            await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
 
-        except Exception as e:
-            logger.error(f"Text handler error for user {user_id}: {e}")
-            self.clear_user_state(user_id)
-            await self.send_message(update, "❌ Произошла ошибка. Попробуйте снова.")
+    async def handle_poll_threshold_input(self, update: Update, text: str, state_data: Dict):
+        """Handle threshold input and create simple poll"""
+        user_id = update.effective_user.id
+        try:
+            threshold = int(text)
+            if threshold < 1 or threshold > 100:
+                await self.send_message(update, "❌ Порог должен быть от 1 до 100%!")
+                return
+            
+            # Получаем данные для создания опроса
+            question = state_data.get("question", "")
+            options = state_data.get("options", [])
+            max_participants = state_data.get("max_participants", 0)
+            chat_id = update.message.chat_id
+            non_anonymous = self.config.get('non_anonymous_voting', False)
+            voting_type = self.determine_voting_type(options)
+            
+            # Создаем опрос с порогом
+            success = await self.create_poll(
+                question, options, chat_id, user_id, None, threshold, non_anonymous, voting_type, max_participants
+            )
+            
+            if success:
+                await self.clear_user_state(user_id)
+                options_text = "\n".join([f"• {opt}" for opt in options])
+                voting_type_text = self.get_voting_type_text(voting_type)
+                await self.send_message(
+                    update,
+                    f"✅ Голосование создано!\n\n"
+                    f"❓ **{question}**\n\n"
+                    f"📋 Варианты:\n{options_text}\n\n"
+                    f"🎯 Порог: {threshold}%{voting_type_text}\n"
+                    f"👥 Максимум участников: {max_participants if max_participants else 'не ограничено'}"
+                )
+            else:
+                await self.send_message(update, "❌ Ошибка создания голосования")
+        except ValueError:
+            await self.send_message(update, "❌ Введите целое число!", self.menus.back_menu("main"))
 
     async def handle_poll_question_input(self, update: Update, text: str, state_data: Dict):
         """Handle poll question input with validation"""
@@ -3908,19 +4314,19 @@ class PollsBot:
             poll_id = state_data.get("poll_id")
 
             # Проверяем права на редактирование
-            poll_data = self.db.query("SELECT creator_id FROM polls WHERE poll_id = ?", (poll_id,))
+            poll_data = await self.db.query("SELECT creator_id FROM polls WHERE poll_id = ?", (poll_id,))
             if not poll_data:
                 await self.send_message(update, "❌ Голосование не найдено")
-                self.clear_user_state(user_id)
+                await self.clear_user_state(user_id)
                 return
 
             creator_id = poll_data[0][0]
-            user_perms = self.get_permissions(user_id)
+            user_perms = await self.get_permissions(user_id)
 
             # Allow editing only if user is creator or admin
             if user_id != creator_id and user_perms != "admin":
                 await self.send_message(update, "❌ Недостаточно прав для редактирования опроса")
-                self.clear_user_state(user_id)
+                await self.clear_user_state(user_id)
                 return
 
             if len(text) > MAX_POLL_QUESTION:
@@ -3928,10 +4334,11 @@ class PollsBot:
                 return
 
             # Обновляем вопрос в базе данных
-            success = self.db.execute("UPDATE polls SET question = ? WHERE poll_id = ?", (text, poll_id))
+            success = await self.db.execute("UPDATE polls SET question = ? WHERE poll_id = ?", (text, poll_id))
+            self.invalidate_poll_cache(poll_id)
 
             if success:
-                self.clear_user_state(user_id)
+                await self.clear_user_state(user_id)
                 await self.send_message(update, f"✅ Вопрос обновлен: **{text}**")
                 logger.info(f"Poll question updated: {poll_id} by user {user_id}")
             else:
@@ -3941,9 +4348,9 @@ class PollsBot:
 
         # Создание нового опроса (существующая логика)
         # Проверяем права на создание опросов
-        if self.get_permissions(user_id) not in ["create", "admin"]:
+        if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
             await self.send_message(update, "❌ Недостаточно прав для создания голосований")
-            self.clear_user_state(user_id)
+            await self.clear_user_state(user_id)
             return
 
         if len(text) > MAX_POLL_QUESTION:
@@ -3952,7 +4359,7 @@ class PollsBot:
 
         poll_type = state_data.get("type", "simple")
         new_state_data = {**state_data, "question": text, "options": []}
-        self.set_user_state(user_id, UserState.WAITING_POLL_OPTION, new_state_data)
+        await self.set_user_state(user_id, UserState.WAITING_POLL_OPTION, new_state_data)
 
         await self.send_message(update, f"❓ Вопрос: **{text}**\n\n📝 Введите первый вариант ответа:",
                                reply_markup=InlineKeyboardMarkup([[
@@ -3971,19 +4378,19 @@ class PollsBot:
             poll_id = state_data.get("poll_id")
 
             # Проверяем права на редактирование
-            poll_data = self.db.query("SELECT creator_id FROM polls WHERE poll_id = ?", (poll_id,))
+            poll_data = await self.db.query("SELECT creator_id FROM polls WHERE poll_id = ?", (poll_id,))
             if not poll_data:
                 await self.send_message(update, "❌ Голосование не найдено")
-                self.clear_user_state(user_id)
+                await self.clear_user_state(user_id)
                 return
 
             creator_id = poll_data[0][0]
-            user_perms = self.get_permissions(user_id)
+            user_perms = await self.get_permissions(user_id)
 
             # Allow editing only if user is creator or admin
             if user_id != creator_id and user_perms != "admin":
                 await self.send_message(update, "❌ Недостаточно прав для редактирования опроса")
-                self.clear_user_state(user_id)
+                await self.clear_user_state(user_id)
                 return
 
             options = [self.clean_poll_option(opt.strip()) for opt in text.split(",") if opt.strip()]
@@ -4005,10 +4412,11 @@ class PollsBot:
             # Обновляем варианты в базе данных
             cleaned_options = [self.clean_poll_option(opt) for opt in options]
             options_str = "|".join(cleaned_options)
-            success = self.db.execute("UPDATE polls SET options = ? WHERE poll_id = ?", (options_str, poll_id))
+            success = await self.db.execute("UPDATE polls SET options = ? WHERE poll_id = ?", (options_str, poll_id))
+            self.invalidate_poll_cache(poll_id)
 
             if success:
-                self.clear_user_state(user_id)
+                await self.clear_user_state(user_id)
                 options_text = "\n".join([f"{i+1}. {opt}" for i, opt in enumerate(options)])
                 await self.send_message(update, f"✅ Варианты обновлены:\n\n{options_text}")
                 logger.info(f"Poll options updated: {poll_id} by user {user_id}")
@@ -4019,9 +4427,9 @@ class PollsBot:
 
         # Создание нового опроса (существующая логика)
         # Проверяем права на создание опросов
-        if self.get_permissions(user_id) not in ["create", "admin"]:
+        if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
             await self.send_message(update, "❌ Недостаточно прав для создания голосований")
-            self.clear_user_state(user_id)
+            await self.clear_user_state(user_id)
             return
 
         question = state_data.get("question", "")
@@ -4045,7 +4453,7 @@ class PollsBot:
                                        None, threshold, non_anonymous, voting_type)
 
         if success:
-            self.clear_user_state(user_id)
+            await self.clear_user_state(user_id)
             
             # Добавляем информацию о типе голосования в сообщение
             voting_type_text = self.get_voting_type_text(voting_type)
@@ -4058,7 +4466,7 @@ class PollsBot:
         """Handle quick poll creation from direct message"""
         user_id = update.effective_user.id
 
-        if self.get_permissions(user_id) not in ["create", "admin"]:
+        if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
             await self.send_message(update, "❌ Недостаточно прав для создания голосований")
             return
 
@@ -4066,7 +4474,7 @@ class PollsBot:
             await self.send_message(update, f"❌ Вопрос слишком длинный (макс. {MAX_POLL_QUESTION} символов)")
             return
 
-        self.set_user_state(user_id, UserState.WAITING_POLL_OPTION, {"question": text, "type": "quick", "options": []})
+        await self.set_user_state(user_id, UserState.WAITING_POLL_OPTION, {"question": text, "type": "quick", "options": []})
         await self.send_message(update, f"❓ Вопрос: **{text}**\n\n📝 Введите первый вариант ответа:",
                                reply_markup=InlineKeyboardMarkup([[
                                    InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")
@@ -4081,7 +4489,7 @@ class PollsBot:
 
         logger.debug(f"Inline query from user {user_id}: '{query}'")
 
-        if self.get_permissions(user_id) not in ["create", "admin"]:
+        if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
             logger.debug(f"User {user_id} has insufficient permissions")
             await update.inline_query.answer([])
             return
@@ -4093,28 +4501,23 @@ class PollsBot:
         if query.startswith("share_"):
             logger.debug("Обрабатываем share_ запрос!")
             logger.debug(f"Processing share request: {query}")
-            poll_id = query.split("_", 1)[1]
+            poll_id = query.partition("_")[2]
             logger.debug(f"Extracted poll_id: {poll_id}")
-            poll_data = self.db.query("""
-                SELECT question, options, threshold, non_anonymous, decision_number,
-                       created_date, template_used, creator_id, decision_status
-                FROM polls WHERE poll_id = ?
-            """, (poll_id,))
+            poll_data = await self.db.query("SELECT question, options FROM polls WHERE poll_id = ?", (poll_id,))
             if not poll_data:
                 logger.debug(f"Poll {poll_id} not found for sharing")
                 await update.inline_query.answer([])
                 return
-            question, options_str, threshold, non_anonymous, decision_number, \
-            created_date, template_used, creator_id, decision_status = poll_data[0]
-            options = options_str.split('|')
+            question, options_str = poll_data[0]
+            options_count = options_str.count('|') + 1
 
             # Используем публичную версию без админских кнопок для пересылки
-            text, keyboard = self.format_poll_message_public(poll_id, show_results=True, for_user_id=user_id)
+            text, keyboard = await self.format_poll_message_public(poll_id, show_results=True, for_user_id=user_id)
             logger.debug(f"Formatted public poll message for sharing, text length: {len(text)}")
             results = [InlineQueryResultArticle(
                 id=f"share_{poll_id}",
                 title=f"📤 {question[:50]}{'...' if len(question) > 50 else ''}",
-                description=f"Переслать опрос с {len(options)} вариантами",
+                description=f"Переслать опрос с {options_count} вариантами",
                 input_message_content=InputTextMessageContent(
                     text,
                     parse_mode=ParseMode.MARKDOWN
@@ -4132,18 +4535,18 @@ class PollsBot:
             logger.debug("Empty query, showing recent polls")
             
             # Активные опросы (последние 6)
-            active_polls = self.get_active_polls(limit=6)
+            active_polls = await self.get_active_polls(limit=6)
             logger.debug(f"Found {len(active_polls)} active polls")
             
             for poll in active_polls:
                 poll_id = poll["poll_id"]
                 question = poll["question"]
-                options = poll["options"].split("|")
+                options = poll["options"].split("|", 3)  # для превью нужны только первые три варианта
                 options_preview = ", ".join(options[:3])
                 if len(options) > 3:
                     options_preview += "..."
 
-                text, keyboard = self.format_poll_message_public(poll_id, show_results=True, for_user_id=user_id)
+                text, keyboard = await self.format_poll_message_public(poll_id, show_results=True, for_user_id=user_id)
                 deeplink = f"https://t.me/{bot_username}?start=showpoll_{poll_id}"
 
                 results.append(InlineQueryResultArticle(
@@ -4158,18 +4561,18 @@ class PollsBot:
                 ))
 
             # Закрытые опросы (последние 4)
-            closed_polls = self.get_closed_polls(user_id, limit=4)
+            closed_polls = await self.get_closed_polls(user_id, limit=4)
             logger.debug(f"Found {len(closed_polls)} closed polls")
             
             for poll in closed_polls:
                 poll_id = poll["poll_id"]
                 question = poll["question"]
-                options = poll["options"].split("|")
+                options = poll["options"].split("|", 3)  # для превью нужны только первые три варианта
                 options_preview = ", ".join(options[:3])
                 if len(options) > 3:
                     options_preview += "..."
 
-                text, keyboard = self.format_poll_message_public(poll_id, show_results=True, for_user_id=user_id)
+                text, keyboard = await self.format_poll_message_public(poll_id, show_results=True, for_user_id=user_id)
                 deeplink = f"https://t.me/{bot_username}?start=showpoll_{poll_id}"
 
                 results.append(InlineQueryResultArticle(
@@ -4188,8 +4591,8 @@ class PollsBot:
             logger.debug(f"Searching polls with query: '{query}'")
             
             # Получаем все опросы пользователя для поиска
-            all_active_polls = self.get_active_polls(limit=50)  # Больше для поиска
-            all_closed_polls = self.get_closed_polls(user_id, limit=50)  # Больше для поиска
+            all_active_polls = await self.get_active_polls(limit=50)  # Больше для поиска
+            all_closed_polls = await self.get_closed_polls(user_id, limit=50)  # Больше для поиска
             
             query_lower = query.lower()
             
@@ -4213,12 +4616,12 @@ class PollsBot:
             for poll in matching_active[:8]:
                 poll_id = poll["poll_id"]
                 question = poll["question"]
-                options = poll["options"].split("|")
+                options = poll["options"].split("|", 3)  # для превью нужны только первые три варианта
                 options_preview = ", ".join(options[:3])
                 if len(options) > 3:
                     options_preview += "..."
 
-                text, keyboard = self.format_poll_message_public(poll_id, show_results=True, for_user_id=user_id)
+                text, keyboard = await self.format_poll_message_public(poll_id, show_results=True, for_user_id=user_id)
                 deeplink = f"https://t.me/{bot_username}?start=showpoll_{poll_id}"
 
                 results.append(InlineQueryResultArticle(
@@ -4237,12 +4640,12 @@ class PollsBot:
             for poll in matching_closed[:remaining_slots]:
                 poll_id = poll["poll_id"]
                 question = poll["question"]
-                options = poll["options"].split("|")
+                options = poll["options"].split("|", 3)  # для превью нужны только первые три варианта
                 options_preview = ", ".join(options[:3])
                 if len(options) > 3:
                     options_preview += "..."
 
-                text, keyboard = self.format_poll_message_public(poll_id, show_results=True, for_user_id=user_id)
+                text, keyboard = await self.format_poll_message_public(poll_id, show_results=True, for_user_id=user_id)
                 deeplink = f"https://t.me/{bot_username}?start=showpoll_{poll_id}"
 
                 results.append(InlineQueryResultArticle(
@@ -4286,27 +4689,29 @@ class PollsBot:
     async def cleanup_old_data(self):
         """Enhanced cleanup with proper error handling"""
         try:
-            cutoff_time = datetime.now() - timedelta(seconds=SESSION_TIMEOUT)
-            cutoff_str = cutoff_time.isoformat()
-
-            old_sessions = self.db.query("SELECT COUNT(*) FROM template_sessions WHERE created_date < ?", (cutoff_str,))
-            sessions_count = old_sessions[0][0] if old_sessions else 0
-
-            self.db.execute("DELETE FROM template_sessions WHERE created_date < ?", (cutoff_str,))
-
-            hour_ago = (datetime.now() - timedelta(hours=1)).isoformat()
-            self.db.execute("DELETE FROM user_states WHERE state = ? AND updated_date < ?", (UserState.IDLE, hour_ago))
+            now = int(time.time())
+            cutoff_ts = now - SESSION_TIMEOUT
+            hour_ago_ts = now - 3600
+
+            # Both deletes share one transaction per chunk; LIMIT keeps each write-lock hold short
+            sessions_count = await self.db.execute_chunked([
+                ("DELETE FROM template_sessions WHERE rowid IN "
+                 "(SELECT rowid FROM template_sessions WHERE created_ts < ? LIMIT ?)", (cutoff_ts,)),
+                ("DELETE FROM user_states WHERE rowid IN "
+                 "(SELECT rowid FROM user_states WHERE state = ? AND updated_ts < ? LIMIT ?)", (UserState.IDLE, hour_ago_ts)),
+            ])
 
             self.rate_limiter.cleanup()
 
             if sessions_count > 0:
-                logger.info(f"Cleaned up {sessions_count} old template sessions")
+                logger.info(f"Cleaned up {sessions_count} old template sessions and idle user states")
 
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
 
     async def periodic_cleanup(self):
         """Periodic cleanup task with proper error handling and log rotation"""
+        last_checkpoint = time.monotonic()
         while True:
             try:
                 await asyncio.sleep(1800)  # 30 minutes
@@ -4314,9 +4719,14 @@ class PollsBot:
                 # Очистка старых данных
                 await self.cleanup_old_data()
 
+                # Раз в час переносим WAL в основной файл БД и обрезаем его
+                if time.monotonic() - last_checkpoint >= WAL_CHECKPOINT_INTERVAL:
+                    await self.db.checkpoint()
+                    last_checkpoint = time.monotonic()
+
                 # Автоматическая ротация логов (каждые 30 минут проверяем размер)
                 try:
-                    LogManager.rotate_logs(max_size_mb=5)  # Ротация при превышении 5MB
+                    LogManager.rotate_logs()  # Ротация при превышении LOG_MAX_SIZE_MB
                 except Exception as e:
                     logger.error(f"Log rotation error: {e}")
 
@@ -4327,6 +4737,39 @@ class PollsBot:
                 logger.error(f"Cleanup task error: {e}")
                 await asyncio.sleep(300)  # 5 minutes on error
 
+    async def watch_logging_config(self):
+        """Pick up hand edits of logging_config.json even when every level that would trigger the mtime check is off"""
+        while True:
+            try:
+                await asyncio.sleep(LOGGING_CONFIG_RECHECK)
+                # Перечитывает файл только при изменении mtime, перепривязывает методы и сторонние логгеры
+                LogManager._apply_config(LogManager.load_logging_config())
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Logging config watch error: {e}")
+
+    async def post_init(self, application):
+        """Start background tasks once the application event loop is running"""
+        self._cleanup_task = asyncio.create_task(self.periodic_cleanup())
+        self._log_config_task = asyncio.create_task(self.watch_logging_config())
+
+    async def post_shutdown(self, application):
+        """Flush pending writes, close database connections and remove PID file when application stops"""
+        for task in (self._cleanup_task, self._log_config_task):
+            if task is not None and not task.done():
+                task.cancel()
+        # Telegram client is already shut down: pending poll redraws can't be sent anymore
+        for task in self._edit_flush_tasks.values():
+            task.cancel()
+        if self._state_flush_task is not None and not self._state_flush_task.done():
+            await self._state_flush_task
+        await self._flush_user_states(delay=0)
+        if self._vote_flush_task is not None:
+            await self._vote_flush_task
+        await self.db.close()
+        await asyncio.to_thread(self._remove_pid)
+
     async def run(self):
         """Enhanced main bot runner with token validation"""
         if not self.config.get("bot_token"):
@@ -4334,7 +4777,15 @@ class PollsBot:
             return
 
         try:
-            self.application = Application.builder().token(self.config["bot_token"]).build()
+            self.application = (
+                Application.builder()
+                .token(self.config["bot_token"])
+                .connection_pool_size(TELEGRAM_POOL_SIZE)
+                .pool_timeout(TELEGRAM_POOL_TIMEOUT)
+                .post_init(self.post_init)
+                .post_shutdown(self.post_shutdown)
+                .build()
+            )
 
             # Add handlers
             handlers = [
@@ -4356,14 +4807,13 @@ class PollsBot:
             for handler in handlers:
                 self.application.add_handler(handler)
 
-            # Start cleanup task
-            self._cleanup_task = asyncio.create_task(self.periodic_cleanup())
-
             logger.info("Starting PollsBot v2.0...")
             logger.info("🚀 PollsBot запущен и готов к работе!")
 
             # Прямой запуск без asyncio.run()
-            self.application.run_polling(poll_interval=self.config.get("polling_interval", 2))
+            self.application.run_polling(
+                poll_interval=self.config.get("polling_interval", 2), timeout=TELEGRAM_LONG_POLL_TIMEOUT
+            )
 
         except Exception as e:
             logger.error(f"Bot error: {e}")
@@ -4375,24 +4825,24 @@ class PollsBot:
         user_id = update.effective_user.id
 
         # Очищаем старые template_sessions для этого пользователя
-        self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (user_id,))
+        await self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (user_id,))
 
         # Проверяем права на создание шаблонов
-        if self.get_permissions(user_id) not in ["create", "admin"]:
+        if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
             await self.send_message(update, "❌ Недостаточно прав для создания шаблонов")
-            self.clear_user_state(user_id)
+            await self.clear_user_state(user_id)
             return
 
         name = self.sanitize(text, MAX_TEMPLATE_NAME)
-        if not re.match(r'^[\w\s\-]{3,50}$', name, re.UNICODE):
+        if not TEMPLATE_NAME_RE.match(name):
             await self.send_message(update, "❌ Название должно быть буквами, цифрами, пробелами, _, - (3-50 символов)")
             return
         # Check if template exists
-        exists = self.db.query("SELECT name FROM templates WHERE name = ?", (name,))
+        exists = await self.db.query("SELECT name FROM templates WHERE name = ?", (name,))
         if exists:
             await self.send_message(update, "❌ Шаблон с таким названием уже существует")
             return
-        self.set_user_state(user_id, UserState.WAITING_TEMPLATE_QUESTION, {"name": name})
+        await self.set_user_state(user_id, UserState.WAITING_TEMPLATE_QUESTION, {"name": name})
         explanation = (
             "ℹ️ Шаблоны позволяют быстро создавать голосования с переменными. "
             "В тексте вопроса и вариантах ответа вы можете использовать переменные в фигурных скобках, например: {Имя}, {Дата}, {Сумма}. "
@@ -4412,9 +4862,9 @@ class PollsBot:
         user_id = update.effective_user.id
 
         # Проверяем права на создание шаблонов
-        if self.get_permissions(user_id) not in ["create", "admin"]:
+        if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
             await self.send_message(update, "❌ Недостаточно прав для создания шаблонов")
-            self.clear_user_state(user_id)
+            await self.clear_user_state(user_id)
             return
 
         name = state_data.get("name", "")
@@ -4423,7 +4873,7 @@ class PollsBot:
             await self.send_message(update, "❌ Вопрос не может быть пустым")
             return
         variables = self.extract_variables(question)
-        self.set_user_state(user_id, UserState.WAITING_TEMPLATE_OPTION, {"name": name, "question": question, "variables": variables, "options": []})
+        await self.set_user_state(user_id, UserState.WAITING_TEMPLATE_OPTION, {"name": name, "question": question, "variables": variables, "options": []})
         await self.send_message(update, f"❓ Вопрос: **{question}**\n\n📝 Введите первый вариант ответа для шаблона:",
                                reply_markup=InlineKeyboardMarkup([[
                                    InlineKeyboardButton("⬅️ Назад", callback_data="new_template")
@@ -4445,9 +4895,9 @@ class PollsBot:
             await self.handle_poll_option_input(update, text, state_data)
             return
 
-        if self.get_permissions(user_id) not in ["create", "admin"]:
+        if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
             await self.send_message(update, "❌ Недостаточно прав для создания шаблонов")
-            self.clear_user_state(user_id)
+            await self.clear_user_state(user_id)
             return
 
         name = state_data.get("name", "")
@@ -4472,7 +4922,7 @@ class PollsBot:
                                        InlineKeyboardButton("⬅️ Назад", callback_data="create_poll")
                                    ]]))
             new_state_data = {**state_data, "options": options}
-            self.set_user_state(user_id, UserState.WAITING_POLL_OPTION, new_state_data)
+            await self.set_user_state(user_id, UserState.WAITING_POLL_OPTION, new_state_data)
             return
 
         max_options = self.config.get('max_poll_options', 10)
@@ -4489,7 +4939,7 @@ class PollsBot:
             self.menus.finish_template_menu()
         )
         new_state_data = {**state_data, "options": options}
-        self.set_user_state(user_id, UserState.WAITING_TEMPLATE_OPTION, new_state_data)
+        await self.set_user_state(user_id, UserState.WAITING_TEMPLATE_OPTION, new_state_data)
 
     @error_handler
     async def finalize_template_creation(self, update_or_query, name, question, variables, options):
@@ -4500,7 +4950,7 @@ class PollsBot:
         )
 
         # Очищаем старые template_sessions для этого пользователя
-        self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (user_id,))
+        await self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (user_id,))
 
         if len(options) < 2:
             await self.send_message(update_or_query, "❌ Нужно минимум 2 варианта ответа для шаблона")
@@ -4512,7 +4962,7 @@ class PollsBot:
             return
 
         # Запрашиваем максимальное количество участников
-        self.set_user_state(user_id, UserState.WAITING_MAX_PARTICIPANTS, {
+        await self.set_user_state(user_id, UserState.WAITING_MAX_PARTICIPANTS, {
             "name": name,
             "question": question,
             "variables": variables,
@@ -4531,9 +4981,9 @@ class PollsBot:
         user_id = update.effective_user.id
 
         # Проверяем права на создание шаблонов
-        if self.get_permissions(user_id) not in ["create", "admin"]:
+        if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
             await self.send_message(update, "❌ Недостаточно прав для создания шаблонов")
-            self.clear_user_state(user_id)
+            await self.clear_user_state(user_id)
             return
 
         name = state_data.get("name", "")
@@ -4546,7 +4996,7 @@ class PollsBot:
             return
         
         # Запрашиваем максимальное количество участников
-        self.set_user_state(user_id, UserState.WAITING_MAX_PARTICIPANTS, {
+        await self.set_user_state(user_id, UserState.WAITING_MAX_PARTICIPANTS, {
             "name": name,
             "question": question,
             "variables": variables,
@@ -4574,7 +5024,7 @@ class PollsBot:
             await self.send_message(update_or_query, "❌ Не удалось определить пользователя.")
             return
         try:
-            permissions = self.get_permissions(user_id)
+            permissions = await self.get_permissions(user_id)
             logger.info(f"admin_command: permissions={permissions}")
             menu = self.menus.admin_menu()
             try:
@@ -4597,10 +5047,10 @@ class PollsBot:
         """Handle /users command - список пользователей"""
         if update.effective_chat.type != "private":
             bot_username = getattr(context.bot, 'username', 'BotName')
-            await self.send_message(update, f"❌ В группах команды не поддерживаются. Для публикации и голосования используйте inline-режим: @{bot_username} ...")
+            await self.send_message(update, GROUP_COMMANDS_TEXT.format(bot_username=bot_username))
             return
         try:
-            users = self.db.query("""
+            users = await self.db.query("""
                 SELECT user_id, username, permissions, last_activity
                 FROM users
                 ORDER BY last_activity DESC
@@ -4646,7 +5096,7 @@ class PollsBot:
         """Handle /grant command - выдать права пользователю"""
         if update.effective_chat.type != "private":
             bot_username = getattr(context.bot, 'username', 'BotName')
-            await self.send_message(update, f"❌ В группах команды не поддерживаются. Для публикации и голосования используйте inline-режим: @{bot_username} ...")
+            await self.send_message(update, GROUP_COMMANDS_TEXT.format(bot_username=bot_username))
             return
         if not context.args or len(context.args) < 2:
             await self.send_message(update,
@@ -4671,15 +5121,16 @@ class PollsBot:
                 return
 
             # Проверяем существование пользователя
-            existing_user = self.db.query("SELECT username, permissions FROM users WHERE user_id = ?", (target_user_id,))
+            existing_user = await self.db.query("SELECT username, permissions FROM users WHERE user_id = ?", (target_user_id,))
 
             if existing_user:
                 old_permissions = existing_user[0][1]
                 username = existing_user[0][0] or f"User{target_user_id}"
 
                 # Обновляем права
-                success = self.db.execute("UPDATE users SET permissions = ? WHERE user_id = ?",
+                success = await self.db.execute("UPDATE users SET permissions = ? WHERE user_id = ?",
                                         (new_permissions, target_user_id))
+                self.invalidate_user_cache(target_user_id)
 
                 if success:
                     await self.send_message(update,
@@ -4690,10 +5141,11 @@ class PollsBot:
                     await self.send_message(update, "❌ Ошибка обновления прав")
             else:
                 # Создаем нового пользователя
-                success = self.db.execute("""
+                success = await self.db.execute("""
                     INSERT INTO users (user_id, username, permissions, last_activity)
                     VALUES (?, ?, ?, ?)
                 """, (target_user_id, f"User{target_user_id}", new_permissions, datetime.now().isoformat()))
+                self.invalidate_user_cache(target_user_id)
 
                 if success:
                     await self.send_message(update,
@@ -4714,7 +5166,7 @@ class PollsBot:
         """Handle /revoke command - отозвать права пользователя"""
         if update.effective_chat.type != "private":
             bot_username = getattr(context.bot, 'username', 'BotName')
-            await self.send_message(update, f"❌ В группах команды не поддерживаются. Для публикации и голосования используйте inline-режим: @{bot_username} ...")
+            await self.send_message(update, GROUP_COMMANDS_TEXT.format(bot_username=bot_username))
             return
         if not context.args or len(context.args) < 1:
             await self.send_message(update,
@@ -4729,7 +5181,7 @@ class PollsBot:
             target_user_id = int(context.args[0])
 
             # Проверяем существование пользователя
-            existing_user = self.db.query("SELECT username, permissions FROM users WHERE user_id = ?", (target_user_id,))
+            existing_user = await self.db.query("SELECT username, permissions FROM users WHERE user_id = ?", (target_user_id,))
 
             if not existing_user:
                 await self.send_message(update, "❌ Пользователь не найден")
@@ -4739,7 +5191,8 @@ class PollsBot:
             username = existing_user[0][0] or f"User{target_user_id}"
 
             # Отзываем права (устанавливаем 'use')
-            success = self.db.execute("UPDATE users SET permissions = 'use' WHERE user_id = ?", (target_user_id,))
+            success = await self.db.execute("UPDATE users SET permissions = 'use' WHERE user_id = ?", (target_user_id,))
+            self.invalidate_user_cache(target_user_id)
 
             if success:
                 await self.send_message(update,
@@ -4760,7 +5213,7 @@ class PollsBot:
         """Handle /delete_user command - удалить пользователя"""
         if update.effective_chat.type != "private":
             bot_username = getattr(context.bot, 'username', 'BotName')
-            await self.send_message(update, f"❌ В группах команды не поддерживаются. Для публикации и голосования используйте inline-режим: @{bot_username} ...")
+            await self.send_message(update, GROUP_COMMANDS_TEXT.format(bot_username=bot_username))
             return
         if not context.args or len(context.args) < 1:
             await self.send_message(update,
@@ -4775,7 +5228,7 @@ class PollsBot:
             target_user_id = int(context.args[0])
 
             # Проверяем существование пользователя
-            existing_user = self.db.query("SELECT username, permissions FROM users WHERE user_id = ?", (target_user_id,))
+            existing_user = await self.db.query("SELECT username, permissions FROM users WHERE user_id = ?", (target_user_id,))
 
             if not existing_user:
                 await self.send_message(update, "❌ Пользователь не найден")
@@ -4807,7 +5260,7 @@ class PollsBot:
     async def handle_admin_callback(self, query, data: str):
         """Handle admin panel callbacks (buttons for all admin actions)"""
         user_id = query.from_user.id
-        if self.get_permissions(user_id) != "admin":
+        if await self.get_permissions(user_id) != "admin":
             await query.answer("❌ Недостаточно прав", show_alert=True)
             return
         await query.answer()
@@ -4889,12 +5342,14 @@ class PollsBot:
                 _, target_user_id, new_perm = data.split(":")
                 target_user_id = int(target_user_id)
                 # Обновляем права
-                self.db.execute("UPDATE users SET permissions = ? WHERE user_id = ?", (new_perm, target_user_id))
+                await self.db.execute("UPDATE users SET permissions = ? WHERE user_id = ?", (new_perm, target_user_id))
+                self.invalidate_user_cache(target_user_id)
                 await query.edit_message_text(f"✅ Права пользователя `{target_user_id}` обновлены на `{new_perm}`.")
                 await self.show_admin_users_list(query)
             elif data.startswith("admin_revoke:"):
                 target_user_id = int(data.split(":")[1])
-                self.db.execute("UPDATE users SET permissions = 'use' WHERE user_id = ?", (target_user_id,))
+                await self.db.execute("UPDATE users SET permissions = 'use' WHERE user_id = ?", (target_user_id,))
+                self.invalidate_user_cache(target_user_id)
                 await query.edit_message_text(f"✅ Права пользователя `{target_user_id}` отозваны (установлено 'use').")
                 await self.show_admin_users_list(query)
             elif data.startswith("admin_delete:"):
@@ -4906,12 +5361,11 @@ class PollsBot:
                 await query.edit_message_text(f"⚠️ Подтвердите удаление пользователя `{target_user_id}`:", reply_markup=InlineKeyboardMarkup(keyboard))
             elif data.startswith("admin_confirm_delete:"):
                 target_user_id = int(data.split(":")[1])
-                self.db.execute("DELETE FROM users WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM poll_votes WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM user_states WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (target_user_id,))
-                await query.edit_message_text(f"✅ Пользователь `{target_user_id}` и все его данные удалены.")
-                await self.show_admin_users_list(query)
+                if await self.delete_user_data(target_user_id):
+                    await query.edit_message_text(f"✅ Пользователь `{target_user_id}` и все его данные удалены.")
+                    await self.show_admin_users_list(query)
+                else:
+                    await query.edit_message_text("❌ Ошибка удаления пользователя")
             elif data == "admin_clear_logs":
                 await self.clear_all_logs(query)
             elif data.startswith("admin_logs_"):
@@ -4934,7 +5388,7 @@ class PollsBot:
         user_id = query.from_user.id
 
         # Проверяем права администратора
-        if self.get_permissions(user_id) != "admin":
+        if await self.get_permissions(user_id) != "admin":
             await query.answer("❌ Недостаточно прав", show_alert=True)
             return
 
@@ -4944,7 +5398,7 @@ class PollsBot:
             target_user_id = int(data.split(":", 1)[1])
 
             # Получаем информацию о пользователе
-            user_info = self.db.query("SELECT username, permissions FROM users WHERE user_id = ?", (target_user_id,))
+            user_info = await self.db.query("SELECT username, permissions FROM users WHERE user_id = ?", (target_user_id,))
 
             if not user_info:
                 await query.edit_message_text("❌ Пользователь не найден")
@@ -4952,15 +5406,9 @@ class PollsBot:
 
             username = user_info[0][0] or f"User{target_user_id}"
 
-            # Удаляем пользователя и все связанные данные
-            success = self.db.execute("DELETE FROM users WHERE user_id = ?", (target_user_id,))
+            success = await self.delete_user_data(target_user_id)
 
             if success:
-                # Также удаляем связанные данные
-                self.db.execute("DELETE FROM poll_votes WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM user_states WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (target_user_id,))
-
                 await query.edit_message_text(
                     f"✅ Пользователь удален!\n\n"
                     f"👤 **{username}** (`{target_user_id}`)\n"
@@ -4976,7 +5424,7 @@ class PollsBot:
     async def show_admin_users_list(self, query):
         """Show admin users list with management options (buttons)"""
         try:
-            users = self.db.query("""
+            users = await self.db.query("""
                 SELECT user_id, username, permissions, last_activity
                 FROM users
                 ORDER BY last_activity DESC
@@ -5020,23 +5468,26 @@ class PollsBot:
     async def show_admin_stats(self, query):
         """Show detailed system statistics for admin"""
         try:
-            # Получаем статистику
-            stats = {
-                'total_users': len(self.db.query("SELECT user_id FROM users")),
-                'admin_users': len(self.db.query("SELECT user_id FROM users WHERE permissions = 'admin'")),
-                'create_users': len(self.db.query("SELECT user_id FROM users WHERE permissions = 'create'")),
-                'use_users': len(self.db.query("SELECT user_id FROM users WHERE permissions = 'use'")),
-                'total_polls': len(self.db.query("SELECT poll_id FROM polls")),
-                'active_polls': len(self.db.query("SELECT poll_id FROM polls WHERE status = 'active'")),
-                'total_votes': len(self.db.query("SELECT poll_id FROM poll_votes")),
-                'templates': len(self.db.query("SELECT name FROM templates")),
-                'decisions': len(self.db.query("SELECT poll_id FROM polls WHERE decision_number IS NOT NULL"))
-            }
-
-            # Активность за последние 24 часа
+            # Получаем всю статистику одним запросом (COUNT без выборки строк)
             day_ago = (datetime.now() - timedelta(days=1)).isoformat()
-            recent_users = self.db.query("SELECT COUNT(*) FROM users WHERE last_activity > ?", (day_ago,))
-            recent_polls = self.db.query("SELECT COUNT(*) FROM polls WHERE created_date > ?", (day_ago,))
+            rows = await self.db.query("""
+                SELECT
+                    (SELECT COUNT(*) FROM users) AS total_users,
+                    (SELECT COUNT(*) FROM users WHERE permissions = 'admin') AS admin_users,
+                    (SELECT COUNT(*) FROM users WHERE permissions = 'create') AS create_users,
+                    (SELECT COUNT(*) FROM users WHERE permissions = 'use') AS use_users,
+                    (SELECT COUNT(*) FROM users WHERE last_activity > ?) AS recent_users,
+                    (SELECT COUNT(*) FROM polls) AS total_polls,
+                    (SELECT COUNT(*) FROM polls WHERE status = 'active') AS active_polls,
+                    (SELECT COUNT(*) FROM polls WHERE created_date > ?) AS recent_polls,
+                    (SELECT COUNT(*) FROM polls WHERE decision_number IS NOT NULL) AS decisions,
+                    (SELECT COUNT(*) FROM poll_votes) AS total_votes,
+                    (SELECT COUNT(*) FROM templates) AS templates
+            """, (day_ago, day_ago))
+            if not rows:
+                await self.send_message(query, "❌ Ошибка получения статистики")
+                return
+            stats = dict(rows[0])
 
             text = "📊 **Статистика системы**\n\n"
 
@@ -5045,12 +5496,12 @@ class PollsBot:
             text += f"• Админы: {stats['admin_users']}\n"
             text += f"• Создатели: {stats['create_users']}\n"
             text += f"• Пользователи: {stats['use_users']}\n"
-            text += f"• Активны за 24ч: {recent_users[0][0] if recent_users else 0}\n\n"
+            text += f"• Активны за 24ч: {stats['recent_users']}\n\n"
 
             text += "🗳️ **Опросы:**\n"
             text += f"• Всего: {stats['total_polls']}\n"
             text += f"• Активных: {stats['active_polls']}\n"
-            text += f"• Создано за 24ч: {recent_polls[0][0] if recent_polls else 0}\n"
+            text += f"• Создано за 24ч: {stats['recent_polls']}\n"
             text += f"• Всего голосов: {stats['total_votes']}\n"
             text += f"• Принято решений: {stats['decisions']}\n\n"
 
@@ -5059,7 +5510,7 @@ class PollsBot:
 
             text += "💾 **Система:**\n"
             text += f"• БД: {'✅' if os.path.exists(DB_PATH) else '❌'}\n"
-            text += f"• Лимит запросов: {self.config.get('rate_limit_hour', 10)}/час\n"
+            text += f"• Лимит запросов: {self.rate_limit_hour}/час\n"
 
             await self.send_message(query, text, self.menus.admin_stats_menu())
 
@@ -5125,9 +5576,9 @@ class PollsBot:
         user_id = update.effective_user.id
 
         # Проверяем права на создание опросов
-        if self.get_permissions(user_id) not in ["create", "admin"]:
+        if await self.get_permissions(user_id) not in CREATE_PERMISSIONS:
             await self.send_message(update, "❌ Недостаточно прав для создания голосований")
-            self.clear_user_state(user_id)
+            await self.clear_user_state(user_id)
             return
 
         question = state_data.get("question", "")
@@ -5153,7 +5604,7 @@ class PollsBot:
                                        InlineKeyboardButton("⬅️ Назад", callback_data="create_poll")
                                    ]]))
             new_state_data = {**state_data, "options": options}
-            self.set_user_state(user_id, UserState.WAITING_POLL_OPTION, new_state_data)
+            await self.set_user_state(user_id, UserState.WAITING_POLL_OPTION, new_state_data)
             return
 
         # Проверяем максимальное количество вариантов
@@ -5174,7 +5625,7 @@ class PollsBot:
         )
 
         new_state_data = {**state_data, "options": options}
-        self.set_user_state(user_id, UserState.WAITING_TEMPLATE_OPTION, new_state_data)
+        await self.set_user_state(user_id, UserState.WAITING_TEMPLATE_OPTION, new_state_data)
 
     async def finalize_poll_creation(self, update: Update, question: str, options: List[str], poll_type: str):
         """Finalize poll creation with collected options"""
@@ -5199,7 +5650,7 @@ class PollsBot:
         if user_id is None or chat_id is None:
             await self.send_message(update, "❌ Не удалось определить пользователя или чат для создания опроса")
             if user_id:
-                self.clear_user_state(user_id)
+                await self.clear_user_state(user_id)
             return
 
         # Автоматически определяем тип голосования на основе вариантов ответов
@@ -5209,11 +5660,11 @@ class PollsBot:
         valid, error_msg = self.validate_poll_data(question, options)
         if not valid:
             await self.send_message(update, f"❌ {error_msg}")
-            self.clear_user_state(user_id)
+            await self.clear_user_state(user_id)
             return
 
         # Запрашиваем максимальное количество участников
-        self.set_user_state(user_id, UserState.WAITING_MAX_PARTICIPANTS, {
+        await self.set_user_state(user_id, UserState.WAITING_MAX_PARTICIPANTS, {
             "question": question,
             "options": options,
             "poll_type": poll_type
@@ -5266,54 +5717,55 @@ class PollsBot:
             @wraps(func)
             async def wrapper(self, update_or_query, context):
                 user_id = self.get_user_id(update_or_query)
-                user_perm = self.get_permissions(user_id)
+                user_perm = await self.get_permissions(user_id)
                 if user_perm not in permissions and user_perm != "admin":
                     await self.send_message(update_or_query, "❌ Недостаточно прав для выполнения команды.")
                     return
-                rate_limit = self.config.get('rate_limit_hour', 10)
-                if not self.rate_limiter.is_allowed(user_id, rate_limit):
+                if not self.rate_limiter.is_allowed(user_id, self.rate_limit_hour):
                     await self.send_message(update_or_query, "⚠️ Превышен лимит запросов. Попробуйте позже.")
                     return
                 return await func(self, update_or_query, context)
             return wrapper
         return decorator
 
-    def get_user_settings(self, user_id: int) -> dict:
-        row = self.db.query("SELECT settings FROM user_settings WHERE user_id = ?", (user_id,))
-        if row and row[0][0]:
+    async def get_user_settings(self, user_id: int) -> dict:
+        settings = await self.db.scalar("SELECT settings FROM user_settings WHERE user_id = ?", (user_id,))
+        if settings:
             try:
-                return json.loads(row[0][0])
+                return json_loads(settings)
             except Exception:
                 return {}
         return {}
 
-    def set_user_settings(self, user_id: int, settings: dict):
-        self.db.execute(
+    async def set_user_settings(self, user_id: int, settings: dict):
+        await self.db.execute(
             "INSERT OR REPLACE INTO user_settings (user_id, settings) VALUES (?, ?)",
-            (user_id, json.dumps(settings, ensure_ascii=False))
+            (user_id, json_dumps(settings))
         )
 
     async def show_templates_for_use(self, query):
         """Show templates for use with proper error handling"""
         try:
-            templates = self.get_templates()
+            templates = await self.get_templates()
             logger.debug(f"Found {len(templates)} templates")
             if templates:
                 logger.debug(f"Template names: {[t.get('name', 'NO_NAME') for t in templates]}")
                 logger.debug(f"Template IDs: {[t.get('id', t.get('template_id', 'NO_ID')) for t in templates]}")
-                text = "📋 **Доступные шаблоны:**\n\n"
+                parts = ["📋 **Доступные шаблоны:**\n\n"]
                 for t in templates:
-                    text += (
+                    question = t.get('question', '')
+                    variables = t.get('variables')
+                    parts.append(
                         f"• **{t.get('name', 'NO_NAME')}**\n"
-                        f"  ❓ {t.get('question', '')[:60]}{'...' if len(t.get('question', '')) > 60 else ''}\n"
-                        f"  📝 Вариантов: {len(t.get('options', '').split('|'))}\n"
-                        f"  🔧 Переменных: {', '.join(t.get('variables', [])) if t.get('variables') else 'нет'}\n\n"
+                        f"  ❓ {question[:60]}{'...' if len(question) > 60 else ''}\n"
+                        f"  📝 Вариантов: {t.get('options', '').count('|') + 1}\n"
+                        f"  🔧 Переменных: {', '.join(variables) if variables else 'нет'}\n\n"
                     )
-                await self.send_message(query, text, self.menus.template_menu(templates, query.from_user.id))
+                await self.send_message(query, "".join(parts), await self.menus.template_menu(templates, query.from_user.id))
             else:
                 # Создаем клавиатуру с кнопкой создания шаблона
                 keyboard = []
-                if self.get_permissions(query.from_user.id) in ["create", "admin"]:
+                if await self.get_permissions(query.from_user.id) in CREATE_PERMISSIONS:
                     keyboard.append([InlineKeyboardButton("➕ Создать шаблон", callback_data="new_template")])
                 keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")])
                 await self.send_message(query, "📋 Шаблоны не найдены. Создайте первый шаблон!", InlineKeyboardMarkup(keyboard))
@@ -5326,7 +5778,7 @@ class PollsBot:
         """Show active polls with voting buttons"""
         try:
             user_id = query.from_user.id
-            active_polls = self.get_active_polls(user_id=user_id, limit=10)
+            active_polls = await self.get_active_polls(user_id=user_id, limit=10)
             
             if not active_polls:
                 # Отправляем сообщение с клавиатурой, даже если опросов нет
@@ -5334,17 +5786,16 @@ class PollsBot:
                 await self.send_message(query, "🗳️ В данный момент нет активных голосований, в которых вы участвовали.", InlineKeyboardMarkup(keyboard))
                 return
 
-            text = "🗳️ **Активные опросы:**\n\n"
+            parts = ["🗳️ **Активные опросы:**\n\n"]
             keyboard = []
 
             for i, poll in enumerate(active_polls[:5]):  # Показываем максимум 5 опросов
                 poll_id = poll["poll_id"]
                 question = poll["question"]
-                options = poll["options"].split("|")
 
                 # Обрезаем длинный вопрос
                 display_question = question[:60] + "..." if len(question) > 60 else question
-                text += f"**{i+1}. {display_question}**\n"
+                parts.append(f"**{i+1}. {display_question}**\n")
 
                 # Добавляем кнопку для просмотра опроса
                 keyboard.append([InlineKeyboardButton(
@@ -5353,11 +5804,11 @@ class PollsBot:
                 )])
 
             if len(active_polls) > 5:
-                text += f"\n... и еще {len(active_polls) - 5} опросов"
+                parts.append(f"\n... и еще {len(active_polls) - 5} опросов")
 
             keyboard.append([InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")])
 
-            await self.send_message(query, text, InlineKeyboardMarkup(keyboard))
+            await self.send_message(query, "".join(parts), InlineKeyboardMarkup(keyboard))
 
         except Exception as e:
             logger.error(f"Show active polls error: {e}")
@@ -5368,7 +5819,7 @@ class PollsBot:
         try:
             logger.info(f"show_single_poll called for poll_id: {poll_id}")
 
-            result = self.db.query("""
+            result = await self.db.query("""
                 SELECT poll_id, question, options, created_date, creator_id, status,
                        total_voters, decision_number, template_used, threshold, non_anonymous
                 FROM polls WHERE poll_id = ?
@@ -5385,7 +5836,7 @@ class PollsBot:
             logger.info(f"Poll data retrieved: {poll[1][:50]}...")  # Первые 50 символов вопроса
 
             logger.info("Calling format_poll_message...")
-            text, keyboard = self.format_poll_message(poll_id, show_results=True, for_user_id=query.from_user.id)
+            text, keyboard = await self.format_poll_message(poll_id, show_results=True, for_user_id=query.from_user.id)
             logger.info(f"format_poll_message returned: text length={len(text)}, keyboard type={type(keyboard)}")
 
             # Проверяем, что форматирование прошло успешно
@@ -5396,11 +5847,11 @@ class PollsBot:
 
             # Добавляем дополнительную информацию
             logger.info("Adding additional poll information...")
-            creator_info = self.db.query("SELECT username FROM users WHERE user_id = ?", (poll[4],))
+            creator_info = await self.db.query("SELECT username FROM users WHERE user_id = ?", (poll[4],))
             creator_name = f"@{creator_info[0][0]}" if creator_info else f"ID: {poll[4]}"
 
             # Получаем настройки пользователя
-            user_settings = self.get_user_settings(query.from_user.id)
+            user_settings = await self.get_user_settings(query.from_user.id)
             config = self.config
             show_voter_names = user_settings.get('show_voter_names', config.get('show_voter_names', True))
 
@@ -5462,7 +5913,7 @@ class PollsBot:
         """Показать список закрытых голосований"""
         try:
             user_id = query.from_user.id
-            closed_polls = self.get_closed_polls(user_id, limit=10)
+            closed_polls = await self.get_closed_polls(user_id, limit=10)
 
             if not closed_polls:
                 # Отправляем сообщение с клавиатурой, даже если опросов нет
@@ -5478,7 +5929,7 @@ class PollsBot:
                 question = poll['question'][:50] + "..." if len(poll['question']) > 50 else poll['question']
 
                 # Получаем имя создателя
-                creator_info = self.db.query("SELECT username FROM users WHERE user_id = ?", (poll['creator_id'],))
+                creator_info = await self.db.query("SELECT username FROM users WHERE user_id = ?", (poll['creator_id'],))
                 creator_name = f"@{creator_info[0][0]}" if creator_info else f"ID: {poll['creator_id']}"
 
                 # Форматируем дату
@@ -5509,73 +5960,7 @@ class PollsBot:
         await self.send_message(update_or_query, "Статистика пока не реализована.")
 
     async def help_command(self, update_or_query, context):
-        help_text = """ℹ️ **Справка по системе голосований**
-
-👥 **Права пользователей:**
-
-• **👤 use** - Базовые права
-  - Просмотр активных опросов (только тех, в которых участвовали)
-  - Просмотр закрытых опросов (только тех, в которых участвовали)
-  - Голосование в опросах
-  - Просмотр результатов
-
-• **📝 create** - Права создателя
-  - Все права уровня "use"
-  - Создание новых опросов
-  - Создание и использование шаблонов
-  - Просмотр своих созданных опросов + опросов, в которых участвовали
-  - Редактирование своих опросов
-
-• **🛠 admin** - Административные права
-  - Все права уровня "create"
-  - Просмотр всех опросов (активных и закрытых)
-  - Управление пользователями
-  - Просмотр статистики системы
-  - Редактирование любых опросов
-  - Удаление опросов и пользователей
-
-🗳️ **Как работает система:**
-
-1. **Создание опроса** - Выберите тип (простой или из шаблона)
-2. **Голосование** - Нажмите на вариант ответа в опросе
-3. **Результаты** - Отображаются в реальном времени
-4. **Закрытие** - Автоматическое или ручное закрытие опросов
-5. **Шаблоны** - Используйте {Переменная} для быстрого создания
-
-🔒 **Приватность голосований:**
-
-• **Пользователи "use"** видят только те голосования, в которых участвовали
-• **Пользователи "create"** видят свои созданные голосования + те, в которых участвовали
-• **Администраторы** видят все голосования в системе
-
-🔧 **Переменные в шаблонах:**
-
-Переменные позволяют создавать универсальные шаблоны опросов:
-
-• **Формат:** `{НазваниеПеременной}` - в фигурных скобках
-• **Примеры:** `{Дата}`, `{Место}`, `{Время}`, `{Тема}`
-• **Использование:** В вопросе и вариантах ответа
-• **Заполнение:** При создании опроса система запросит значения
-
-**Пример шаблона:**
-```
-Вопрос: Голосование по {Тема} на {Дата}
-Варианты:
-- За
-- Против
-- Воздержаться
-```
-
-При использовании система спросит:
-- Значение для {Тема}: "Встреча команды"
-- Значение для {Дата}: "15 декабря"
-
-📞 **Поддержка:** @ih0rd"""
-
-        await self.send_message(update_or_query, help_text,
-                               reply_markup=InlineKeyboardMarkup([[
-                                   InlineKeyboardButton("⬅️ Назад", callback_data="back_to_main")
-                               ]]))
+        await self.send_message(update_or_query, HELP_TEXT, reply_markup=HELP_KEYBOARD)
     async def templates_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /templates"""
         await self.show_templates_for_use(update)
@@ -5596,13 +5981,13 @@ class PollsBot:
             poll_id = data.split(":", 1)[1]
 
             # Check permissions again
-            poll_data = self.db.query("SELECT creator_id, question FROM polls WHERE poll_id = ?", (poll_id,))
+            poll_data = await self.db.query("SELECT creator_id, question FROM polls WHERE poll_id = ?", (poll_id,))
             if not poll_data:
                 await query.answer("❌ Голосование не найдено", show_alert=True)
                 return
 
             creator_id, question = poll_data[0]
-            user_perms = self.get_permissions(user_id)
+            user_perms = await self.get_permissions(user_id)
 
             # Allow deletion only if user is creator or admin
             if user_id != creator_id and user_perms != "admin":
@@ -5610,8 +5995,10 @@ class PollsBot:
                 return
 
             # Delete poll
-            self.db.execute("DELETE FROM polls WHERE poll_id = ?", (poll_id,))
+            await self.db.execute("DELETE FROM polls WHERE poll_id = ?", (poll_id,))
+            self.invalidate_poll_cache(poll_id)
 
+            self.cancel_poll_edit(query)
             await query.edit_message_text(
                 text=f"🗑️ **Опрос удален**\n\n❓ Вопрос: {question}\n\n✅ Опрос успешно удален из системы.",
                 parse_mode=ParseMode.MARKDOWN
@@ -5640,13 +6027,13 @@ class PollsBot:
             poll_id = data.split(":", 1)[1]
 
             # Check permissions
-            poll_data = self.db.query("SELECT creator_id, status, question FROM polls WHERE poll_id = ?", (poll_id,))
+            poll_data = await self.db.query("SELECT creator_id, status, question FROM polls WHERE poll_id = ?", (poll_id,))
             if not poll_data:
                 await query.answer("❌ Голосование не найдено", show_alert=True)
                 return
 
             creator_id, status, question = poll_data[0]
-            user_perms = self.get_permissions(user_id)
+            user_perms = await self.get_permissions(user_id)
 
             # Allow editing only if user is creator or admin
             if user_id != creator_id and user_perms != "admin":
@@ -5658,12 +6045,13 @@ class PollsBot:
                 return
 
             # Set user state for editing question
-            self.set_user_state(user_id, UserState.WAITING_POLL_QUESTION, {
+            await self.set_user_state(user_id, UserState.WAITING_POLL_QUESTION, {
                 "type": "edit_question",
                 "poll_id": poll_id,
                 "original_question": question
             })
 
+            self.cancel_poll_edit(query)
             await query.edit_message_text(
                 text=f"📝 **Редактирование вопроса**\n\n❓ Текущий вопрос: {question}\n\n📝 Введите новый вопрос:",
                 reply_markup=InlineKeyboardMarkup([[
@@ -5692,13 +6080,13 @@ class PollsBot:
             poll_id = data.split(":", 1)[1]
 
             # Check permissions
-            poll_data = self.db.query("SELECT creator_id, status, options FROM polls WHERE poll_id = ?", (poll_id,))
+            poll_data = await self.db.query("SELECT creator_id, status, options FROM polls WHERE poll_id = ?", (poll_id,))
             if not poll_data:
                 await query.answer("❌ Голосование не найдено", show_alert=True)
                 return
 
             creator_id, status, options_str = poll_data[0]
-            user_perms = self.get_permissions(user_id)
+            user_perms = await self.get_permissions(user_id)
 
             # Allow editing only if user is creator or admin
             if user_id != creator_id and user_perms != "admin":
@@ -5712,7 +6100,7 @@ class PollsBot:
             options = options_str.split('|')
 
             # Set user state for editing options
-            self.set_user_state(user_id, UserState.WAITING_POLL_OPTIONS, {
+            await self.set_user_state(user_id, UserState.WAITING_POLL_OPTIONS, {
                 "type": "edit_options",
                 "poll_id": poll_id,
                 "original_options": options
@@ -5720,6 +6108,7 @@ class PollsBot:
 
             options_text = "\n".join([f"{i+1}. {opt}" for i, opt in enumerate(options)])
 
+            self.cancel_poll_edit(query)
             await query.edit_message_text(
                 text=f"📋 **Редактирование вариантов ответа**\n\n📝 Текущие варианты:\n{options_text}\n\n📝 Введите новые варианты через запятую или перенос строки:",
                 reply_markup=InlineKeyboardMarkup([[
@@ -5735,7 +6124,7 @@ class PollsBot:
     async def handle_admin_logs_command(self, query, data: str):
         """Handle admin logs commands"""
         user_id = query.from_user.id
-        if self.get_permissions(user_id) != "admin":
+        if await self.get_permissions(user_id) != "admin":
             await query.answer("❌ Недостаточно прав", show_alert=True)
             return
         await query.answer()
@@ -5818,12 +6207,14 @@ class PollsBot:
                 _, target_user_id, new_perm = data.split(":")
                 target_user_id = int(target_user_id)
                 # Обновляем права
-                self.db.execute("UPDATE users SET permissions = ? WHERE user_id = ?", (new_perm, target_user_id))
+                await self.db.execute("UPDATE users SET permissions = ? WHERE user_id = ?", (new_perm, target_user_id))
+                self.invalidate_user_cache(target_user_id)
                 await self.safe_edit_message(query, f"✅ Права пользователя `{target_user_id}` обновлены на `{new_perm}`.")
                 await self.show_admin_users_list(query)
             elif data.startswith("admin_revoke:"):
                 target_user_id = int(data.split(":")[1])
-                self.db.execute("UPDATE users SET permissions = 'use' WHERE user_id = ?", (target_user_id,))
+                await self.db.execute("UPDATE users SET permissions = 'use' WHERE user_id = ?", (target_user_id,))
+                self.invalidate_user_cache(target_user_id)
                 await self.safe_edit_message(query, f"✅ Права пользователя `{target_user_id}` отозваны (установлено 'use').")
                 await self.show_admin_users_list(query)
             elif data.startswith("admin_delete:"):
@@ -5835,12 +6226,11 @@ class PollsBot:
                 await self.safe_edit_message(query, f"⚠️ Подтвердите удаление пользователя `{target_user_id}`:", reply_markup=InlineKeyboardMarkup(keyboard))
             elif data.startswith("admin_confirm_delete:"):
                 target_user_id = int(data.split(":")[1])
-                self.db.execute("DELETE FROM users WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM poll_votes WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM user_states WHERE user_id = ?", (target_user_id,))
-                self.db.execute("DELETE FROM template_sessions WHERE user_id = ?", (target_user_id,))
-                await self.safe_edit_message(query, f"✅ Пользователь `{target_user_id}` и все его данные удалены.")
-                await self.show_admin_users_list(query)
+                if await self.delete_user_data(target_user_id):
+                    await self.safe_edit_message(query, f"✅ Пользователь `{target_user_id}` и все его данные удалены.")
+                    await self.show_admin_users_list(query)
+                else:
+                    await self.safe_edit_message(query, "❌ Ошибка удаления пользователя")
             elif data == "admin_clear_logs":
                 await self.clear_all_logs(query)
             elif data.startswith("admin_logs_"):
@@ -5943,7 +6333,7 @@ class PollsBot:
             emoji = "✅" if enabled else "❌"
 
             # Добавляем информацию о файле конфигурации
-            config_file = f"{LOG_DIR}/logging_config.json"
+            config_file = LOGGING_CONFIG_FILE
             config_info = ""
             if os.path.exists(config_file):
                 try:
@@ -5996,7 +6386,15 @@ def main():
         logger.debug(f"✅ Бот инициализирован, токен: {bot.config.get('bot_token', 'НЕ НАЙДЕН')[:10]}...")
 
         # Убираем asyncio.run() и используем run_polling() напрямую
-        bot.application = Application.builder().token(bot.config["bot_token"]).build()
+        bot.application = (
+            Application.builder()
+            .token(bot.config["bot_token"])
+            .connection_pool_size(TELEGRAM_POOL_SIZE)
+            .pool_timeout(TELEGRAM_POOL_TIMEOUT)
+            .post_init(bot.post_init)
+            .post_shutdown(bot.post_shutdown)
+            .build()
+        )
         logger.debug("✅ Application создан")
 
         # Add handlers
@@ -6026,7 +6424,9 @@ def main():
         logger.debug("🚀 PollsBot запущен и готов к работе!")
 
         # Прямой запуск без asyncio.run()
-        bot.application.run_polling(poll_interval=bot.config.get("polling_interval", 2))
+        bot.application.run_polling(
+            poll_interval=bot.config.get("polling_interval", 2), timeout=TELEGRAM_LONG_POLL_TIMEOUT
+        )
 
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")